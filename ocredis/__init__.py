@@ -13,15 +13,66 @@
 # limitations under the License.
 
 try:
+    from ocredis.cache import ReadCache
     from ocredis.client import OcRedis
-    from ocredis.observability import register_views
+    from ocredis.cluster import OcClusterPipeline, OcRedisCluster
+    from ocredis.bigvalues import big_values, disable_big_values, enable_big_values
+    from ocredis.coalesce import Coalescer
+    from ocredis.hotkeys import disable_hot_keys, enable_hot_keys, hot_keys
+    from ocredis.lock import OcLock
+    from ocredis.connection import OcConnection, OcSSLConnection, OcUnixDomainSocketConnection
+    from ocredis.pipeline import OcPipeline
+    from ocredis.pool import OcBlockingConnectionPool, OcConnectionPool
+    from ocredis.pubsub import OcPubSub
+    from ocredis.scripts import OcScript
+    from ocredis.spanpolicy import SpanPolicy
+    from ocredis.observability import register_views, set_cardinality_limit, set_size_sampling
+    from ocredis.observability import enable_aggregation, disable_aggregation, flush_aggregation
 except ImportError:
+    from .ocredis.cache import ReadCache
     from .ocredis.client import OcRedis
-    from .ocredis.observability import register_views
+    from .ocredis.cluster import OcClusterPipeline, OcRedisCluster
+    from .ocredis.bigvalues import big_values, disable_big_values, enable_big_values
+    from .ocredis.coalesce import Coalescer
+    from .ocredis.hotkeys import disable_hot_keys, enable_hot_keys, hot_keys
+    from .ocredis.lock import OcLock
+    from .ocredis.connection import OcConnection, OcSSLConnection, OcUnixDomainSocketConnection
+    from .ocredis.pipeline import OcPipeline
+    from .ocredis.pool import OcBlockingConnectionPool, OcConnectionPool
+    from .ocredis.pubsub import OcPubSub
+    from .ocredis.scripts import OcScript
+    from .ocredis.spanpolicy import SpanPolicy
+    from .ocredis.observability import register_views, set_cardinality_limit, set_size_sampling
+    from .ocredis.observability import enable_aggregation, disable_aggregation, flush_aggregation
 except Exception as e:
     raise e
 
 __all__ = [
+        'Coalescer',
+        'OcBlockingConnectionPool',
+        'OcClusterPipeline',
+        'OcConnection',
+        'OcConnectionPool',
+        'OcLock',
+        'OcPipeline',
+        'OcPubSub',
         'OcRedis',
-        'register_views'
+        'OcRedisCluster',
+        'OcSSLConnection',
+        'OcScript',
+        'OcUnixDomainSocketConnection',
+        'ReadCache',
+        'SpanPolicy',
+        'big_values',
+        'disable_aggregation',
+        'disable_big_values',
+        'disable_hot_keys',
+        'enable_aggregation',
+        'enable_big_values',
+        'enable_hot_keys',
+        'flush_aggregation',
+        'hot_keys',
+        'register_views',
+        'set_cardinality_limit',
+        'set_size_sampling'
         ]
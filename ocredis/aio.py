@@ -0,0 +1,264 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Instrumented asyncio clients, built on redis.asyncio which ships with
+redis-py 4.2.0 and later: pip install ocredis[asyncio]
+
+The current span is kept in OpenCensus' RuntimeContext, which is backed by
+contextvars, so each task carries its own trace context across awaits. Spans
+are parented by the current span of their task only, see _task_span, so that
+concurrent commands never parent each other's spans.
+"""
+
+import contextlib
+
+from opencensus.trace import execution_context
+from opencensus.trace import span as trace_span
+from redis.asyncio import client as aioredis_client
+
+try:
+    from ocredis import observability
+    from ocredis.commands import call_info, command_keys, command_values
+    from ocredis.spanpolicy import PIPELINE, span_policy
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.commands import call_info, command_keys, command_values
+    from .ocredis.spanpolicy import PIPELINE, span_policy
+except Exception as e:
+    raise e
+
+
+@contextlib.contextmanager
+def _task_span(tracer, name):
+    """
+    _task_span opens a span named name as the current span of the running
+    task, parented by the previous current span of that task, if any.
+    ContextTracer.span would instead parent spans that have no current span
+    by the span id of the SpanContext of the tracer, which every task shares
+    and which the spans of the other tasks overwrite.
+    """
+    context_tracer = tracer.tracer
+    parent_span = context_tracer.current_span()
+    span = trace_span.Span(name, parent_span=parent_span, context_tracer=context_tracer)
+    execution_context.set_current_span(span)
+    span.start()
+    try:
+        yield span
+    finally:
+        span.finish()
+        execution_context.set_current_span(parent_span)
+        context_tracer.exporter.export(context_tracer.get_span_datas(span))
+
+
+async def _without_spans(fn, *args):
+    """
+    _without_spans awaits fn(*args) with every span skipped, see SpanPolicy.
+    """
+    previous = observability._skip_spans_slot.get()
+    observability._skip_spans_slot.set(True)
+    try:
+        return await fn(*args)
+    finally:
+        observability._skip_spans_slot.set(previous)
+
+
+async def _call_and_record(method_name, fn, key, value, span, args, kwargs):
+    start_time = observability._now()
+    try:
+        result = await fn(*args, **kwargs)
+
+    except Exception as e:
+        if span is not None:
+            span.status = observability.Status.from_exception(e)
+        observability._record_call(method_name, 'ERROR', observability.classify_error(e),
+                (observability._now() - start_time) * 1e3, key, value)
+        raise
+
+    observability._record_call(method_name, 'OK', None, (observability._now() - start_time) * 1e3,
+            key, value, result)
+    return result
+
+
+async def _call_and_record_blocking(method_name, fn, key, value, span, args, kwargs):
+    # The asyncio connections aren't instrumented, so the whole call of a
+    # blocking command is counted as blocked.
+    observability._blocked_ms_slot.set(None)
+    start_time = observability._now()
+    try:
+        result = await fn(*args, **kwargs)
+
+    except Exception as e:
+        if span is not None:
+            span.status = observability.Status.from_exception(e)
+        observability._record_blocking_call(method_name, 'ERROR', observability.classify_error(e),
+                (observability._now() - start_time) * 1e3, key, value)
+        raise
+
+    observability._record_blocking_call(method_name, observability._blocking_status(result), None,
+            (observability._now() - start_time) * 1e3, key, value, result)
+    return result
+
+
+async def trace_and_record_stats_with_key_and_value(method_name, fn, key, value, *args, **kwargs):
+    """
+    trace_and_record_stats_with_key_and_value is the asyncio counterpart of
+    ocredis.observability.trace_and_record_stats_with_key_and_value, for fn
+    returning an awaitable. Recording happens inline, it does no I/O and
+    takes no locks that could be held across an await.
+    """
+    tracer = observability._span_tracer()
+    if tracer is None:
+        if not observability._is_recording():
+            return await fn(*args, **kwargs)
+        return await _call_and_record(method_name, fn, key, value, None, args, kwargs)
+
+    with _task_span(tracer, method_name) as span:
+        previous = observability._in_span_slot.get()
+        observability._in_span_slot.set(True)
+        try:
+            return await _call_and_record(method_name, fn, key, value, span, args, kwargs)
+        finally:
+            observability._in_span_slot.set(previous)
+
+
+async def _record_command(info, fn, args, options):
+    if not observability._is_recording():
+        return await fn(*args, **options)
+    call_and_record = _call_and_record_blocking if 'b' in info.flags else _call_and_record
+    return await call_and_record(info.method, fn, command_keys(info, args), command_values(info, args),
+            None, args, options)
+
+
+async def trace_and_record_command(fn, args, options, span_policy=None):
+    """
+    trace_and_record_command is the asyncio counterpart of
+    ocredis.observability.trace_and_record_command.
+    """
+    info = call_info(args)
+    tracer = observability._span_tracer()
+    if tracer is None:
+        return await _record_command(info, fn, args, options)
+    if span_policy is not None and not span_policy.should_trace(info):
+        return await _without_spans(_record_command, info, fn, args, options)
+
+    call_and_record = _call_and_record_blocking if 'b' in info.flags else _call_and_record
+    with _task_span(tracer, info.method) as span:
+        previous = observability._in_span_slot.get()
+        observability._in_span_slot.set(True)
+        try:
+            return await call_and_record(info.method, fn, command_keys(info, args), command_values(info, args),
+                    span, args, options)
+        finally:
+            observability._in_span_slot.set(previous)
+
+
+async def _execute_and_record_pipeline(method_name, fn, command_stack, span, args, kwargs):
+    start_time = observability._now()
+    try:
+        results = await fn(*args, **kwargs)
+
+    except Exception as e:
+        if span is not None:
+            span.status = observability.Status.from_exception(e)
+        observability._record_pipeline(method_name, 'ERROR', observability.classify_error(e),
+                (observability._now() - start_time) * 1e3, command_stack, None, span)
+        raise
+
+    observability._record_pipeline(method_name, 'OK', None,
+            (observability._now() - start_time) * 1e3, command_stack, results, span)
+    return results
+
+
+async def _record_pipeline_execution(method_name, fn, command_stack, args, kwargs):
+    if not observability._is_recording():
+        return await fn(*args, **kwargs)
+    return await _execute_and_record_pipeline(method_name, fn, command_stack, None, args, kwargs)
+
+
+async def trace_and_record_pipeline(method_name, fn, command_stack, *args, span_policy=None, **kwargs):
+    """
+    trace_and_record_pipeline is the asyncio counterpart of
+    ocredis.observability.trace_and_record_pipeline.
+    """
+    tracer = observability._span_tracer()
+    if tracer is None:
+        return await _record_pipeline_execution(method_name, fn, command_stack, args, kwargs)
+    if span_policy is not None and not span_policy.should_trace(PIPELINE):
+        return await _without_spans(_record_pipeline_execution, method_name, fn, command_stack, args, kwargs)
+
+    with _task_span(tracer, method_name) as span:
+        previous = observability._in_span_slot.get()
+        observability._in_span_slot.set(True)
+        try:
+            return await _execute_and_record_pipeline(method_name, fn, command_stack, span, args, kwargs)
+        finally:
+            observability._in_span_slot.set(previous)
+
+
+class OcAsyncRedis(aioredis_client.Redis):
+    """
+    OcAsyncRedis is the instrumented wrapper for redis.asyncio.Redis clients.
+    Like OcRedis, it records the redispy/* metrics and spans of every command
+    sent through execute_command using the command table of ocredis.commands.
+
+    Given a span_policy, commands only get spans as per that policy, see
+    ocredis.spanpolicy.
+    """
+    span_policy = None
+
+    def __init__(self, *args, **kwargs):
+        self.span_policy = span_policy(kwargs.pop('span_policy', None))
+        super(OcAsyncRedis, self).__init__(*args, **kwargs)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        policy = kwargs.pop('span_policy', None)
+        client = super(OcAsyncRedis, cls).from_url(url, **kwargs)
+        client.span_policy = span_policy(policy)
+        return client
+
+    async def execute_command(self, *args, **options):
+        return await trace_and_record_command(super(OcAsyncRedis, self).execute_command, args, options,
+                self.span_policy)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipeline = OcAsyncPipeline(
+                self.connection_pool,
+                self.response_callbacks,
+                transaction,
+                shard_hint)
+        pipeline.span_policy = self.span_policy
+        return pipeline
+
+
+class OcAsyncPipeline(aioredis_client.Pipeline):
+    """
+    OcAsyncPipeline is the instrumented wrapper for redis.asyncio.client.Pipeline.
+    Like OcPipeline, execute() records a single span for the round trip along
+    with the call counts and sizes of every queued command, and its span is
+    created as per the SpanPolicy of the OcAsyncRedis that created it, if any.
+    """
+    span_policy = None
+
+    async def execute(self, raise_on_error=True):
+        # execute() resets the pipeline, so hold onto the queued commands.
+        command_stack = list(self.command_stack)
+        if not command_stack and not self.watching:
+            return await super(OcAsyncPipeline, self).execute(raise_on_error)
+
+        return await trace_and_record_pipeline(
+                'redispy.Pipeline.execute',
+                super(OcAsyncPipeline, self).execute, command_stack, raise_on_error,
+                span_policy=self.span_policy)
@@ -0,0 +1,194 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import itertools
+import random
+import threading
+import time
+
+try:
+    from ocredis import observability
+    from ocredis.tags import OTHER, key_bytes, tag_value
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.tags import OTHER, key_bytes, tag_value
+except Exception as e:
+    raise e
+
+# BigValue is a value sent or a reply received by method for key, of size
+# bytes, at timestamp as per time.time().
+BigValue = collections.namedtuple('BigValue', ['method', 'key', 'size', 'timestamp'])
+
+# PrefixCount counts the big values of a key prefix, their total bytes and
+# the largest of them.
+PrefixCount = collections.namedtuple('PrefixCount', ['count', 'bytes', 'max'])
+
+# BigValuesSnapshot holds the number of big values seen so far, a uniform
+# sample of them as BigValues and their PrefixCounts by prefix.
+BigValuesSnapshot = collections.namedtuple('BigValuesSnapshot', ['seen', 'samples', 'by_prefix'])
+
+# The prefix of big values without a key, and of the prefixes beyond max_prefixes.
+NO_KEY_PREFIX = '_none'
+OTHER_PREFIX = OTHER
+
+# Replies such as those of HGETALL or LRANGE are big by their number of
+# elements, so collections of more elements than that are sized from as many
+# of them, rather than walked through on every call.
+_SAMPLE_ITEMS = 1024
+
+# The elements walked through at most to size a payload, which leaves room
+# for nested replies such as those of XRANGE.
+_MAX_ITEMS = 1 << 14
+
+
+def _size(payload):
+    """
+    _size returns the encoded length of payload, estimated from _SAMPLE_ITEMS
+    of its elements when it holds more of them, taken evenly from lists and
+    tuples, and as iterated from dicts and sets.
+    """
+    if isinstance(payload, (list, tuple, dict, set, frozenset)) and len(payload) > _SAMPLE_ITEMS:
+        if isinstance(payload, (list, tuple)):
+            sample = payload[::-(-len(payload) // _SAMPLE_ITEMS)]
+        elif isinstance(payload, dict):
+            sample = dict(itertools.islice(payload.items(), _SAMPLE_ITEMS))
+        else:
+            sample = list(itertools.islice(payload, _SAMPLE_ITEMS))
+        return observability.summarize_lengths(sample, _MAX_ITEMS).total * len(payload) // len(sample)
+    return observability.summarize_lengths(payload, _MAX_ITEMS).total
+
+
+def _pairs(keys, payload):
+    """
+    _pairs splits payload among keys when it holds one element per key, as
+    for MGET and MSET, and otherwise attributes all of it to the first key.
+    """
+    if isinstance(keys, (list, tuple)):
+        if isinstance(payload, (list, tuple)) and len(keys) == len(payload):
+            return zip(keys, payload)
+        return ((keys[0] if keys else None, payload),)
+    return ((keys, payload),)
+
+
+class BigValues(object):
+    """
+    BigValues detects the values sent and the replies received of at least
+    threshold bytes. It keeps a uniform sample of reservoir_size of them
+    as BigValues, as per reservoir sampling, and counts them per key prefix,
+    which is the key up to its first separator, truncated to max_key_bytes.
+    The size of collections of many elements is estimated from a sample of
+    them.
+
+    Each big value is also recorded as the redispy/big_values and
+    redispy/big_value_sizes metrics. Only the first max_prefixes prefixes
+    are used as tag values and counted apart, the others are tagged _other.
+    """
+
+    def __init__(self, threshold=1 << 20, reservoir_size=100, max_prefixes=100, separator=':',
+            max_key_bytes=64):
+        if threshold <= 0:
+            raise ValueError('threshold must be positive')
+        self.threshold = threshold
+        self.reservoir_size = reservoir_size
+        self.max_prefixes = max_prefixes
+        self.separator = key_bytes(separator)
+        self.max_key_bytes = max_key_bytes
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._seen = 0
+        self._reservoir = []
+        self._by_prefix = {}
+
+    def _prefix(self, key):
+        if key is None:
+            return NO_KEY_PREFIX
+        prefix = key_bytes(key).split(self.separator, 1)[0][:self.max_key_bytes]
+        return tag_value(prefix)
+
+    def record(self, method_name, keys, value=None, result=None):
+        """
+        record checks the value sent by method_name on keys and the result
+        it got back for big values.
+        """
+        for payload in (value, result):
+            if payload is None or isinstance(payload, BaseException):
+                continue
+            # Most payloads are small as a whole, which saves splitting them.
+            if _size(payload) < self.threshold:
+                continue
+            for key, each in _pairs(keys, payload):
+                size = _size(each)
+                if size >= self.threshold:
+                    self._add(method_name, key, size)
+
+    def _add(self, method_name, key, size):
+        prefix = self._prefix(key)
+        sample = BigValue(method_name, None if key is None else key_bytes(key)[:self.max_key_bytes],
+                size, time.time())
+        with self._lock:
+            self._seen += 1
+            if len(self._reservoir) < self.reservoir_size:
+                self._reservoir.append(sample)
+            else:
+                i = self._random.randrange(self._seen)
+                if i < self.reservoir_size:
+                    self._reservoir[i] = sample
+
+            counts = self._by_prefix.get(prefix)
+            if counts is None:
+                if len(self._by_prefix) >= self.max_prefixes:
+                    prefix = OTHER_PREFIX
+                counts = self._by_prefix.setdefault(prefix, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += size
+            counts[2] = max(counts[2], size)
+
+        observability._record_measurement(observability.m_big_value_size, size, method_name, None, None,
+                ((observability.key_prefix, prefix),))
+
+    def snapshot(self):
+        """
+        snapshot returns the BigValuesSnapshot of the big values seen so far,
+        whose samples are sorted from the oldest to the newest.
+        """
+        with self._lock:
+            samples = sorted(self._reservoir, key=lambda sample: sample.timestamp)
+            by_prefix = dict((prefix, PrefixCount(*counts)) for prefix, counts in self._by_prefix.items())
+            return BigValuesSnapshot(self._seen, samples, by_prefix)
+
+
+def enable_big_values(threshold=1 << 20, reservoir_size=100, max_prefixes=100, separator=':', max_key_bytes=64):
+    """
+    enable_big_values starts detecting the big values of the calls recorded
+    by ocredis, see BigValues, and returns the detector.
+    """
+    detector = BigValues(threshold, reservoir_size, max_prefixes, separator, max_key_bytes)
+    observability._big_values = detector
+    return detector
+
+
+def disable_big_values():
+    observability._big_values = None
+
+
+def big_values():
+    """
+    big_values returns the BigValuesSnapshot of the big values seen since
+    they were enabled, or None if they aren't detected.
+    """
+    detector = observability._big_values
+    if detector is None:
+        return None
+    return detector.snapshot()
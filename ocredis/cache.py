@@ -0,0 +1,412 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+
+try:
+    from ocredis import observability
+    from ocredis.commands import command_info, command_keys
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.commands import command_info, command_keys
+except Exception as e:
+    raise e
+
+# The channel on which Redis publishes the keys to invalidate to the
+# connection that tracking is redirected to.
+INVALIDATE_CHANNEL = '__redis__:invalidate'
+
+_CACHED_COMMANDS = frozenset(['get', 'hget', 'hgetall', 'mget'])
+
+# Marks a key that isn't cached, as opposed to one cached as missing (None).
+_MISSING = object()
+
+
+class _Entry(object):
+    __slots__ = ('value', 'key', 'size', 'expires_at')
+
+    def __init__(self, value, key, size, expires_at):
+        self.value = value
+        self.key = key
+        self.size = size
+        self.expires_at = expires_at
+
+
+def _copy(value):
+    # Callers get their own copy of containers so that they can't change what is cached.
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class ReadCache(object):
+    """
+    ReadCache caches the replies of GET, HGET, HGETALL and MGET for an OcRedis
+    client, see OcRedis.enable_read_cache.
+
+    Entries are evicted least recently used first once their size exceeds
+    max_bytes, and expire ttl seconds after they were read. The keys written
+    by the commands sent through the same client are invalidated, and so are
+    the keys written by any other client once tracking is started.
+
+    The hits and misses per method, the evictions by reason 'size' or 'ttl',
+    the invalidations by reason 'write' or 'tracking' and the size of the
+    cache are recorded as the redispy/cache_* metrics.
+    """
+
+    def __init__(self, max_bytes=64 << 20, ttl=60.0, encoder=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_bytes = 0
+        # Reads bypass the cache while tracking is unavailable.
+        self.bypass = False
+        self._encoder = encoder
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._cache_keys_by_key = {}
+        # A read whose reply arrives after its key was invalidated mustn't
+        # be cached, so invalidations are counted per key while reads of it
+        # are in flight.
+        self._fills = {}
+        self._listener = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _encode(self, arg):
+        if self._encoder is None:
+            return arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        return self._encoder.encode(arg)
+
+    def execute_command(self, execute, args, options):
+        """
+        execute_command serves the command args from the cache if possible,
+        otherwise has execute(*args, **options) send it.
+        """
+        info = command_info(args[0])
+        if info.name in _CACHED_COMMANDS:
+            if self.bypass:
+                return execute(*args, **options)
+            if info.name == 'mget':
+                return self._mget(info, execute, args, options)
+            return self._read(info, execute, args, options)
+
+        if 'w' not in info.flags:
+            return execute(*args, **options)
+        # Keys are invalidated both before the write, so that other threads
+        # stop reading them, and after, for reads that raced with it.
+        keys = command_keys(info, args)
+        self.invalidate_written(keys)
+        try:
+            return execute(*args, **options)
+        finally:
+            self.invalidate_written(keys)
+
+    def invalidate_written(self, keys):
+        """
+        invalidate_written invalidates the keys written by a command, or the
+        whole cache if the keys it writes aren't known.
+        """
+        if keys:
+            self.invalidate(keys, 'write')
+        else:
+            # Writes without known keys, e.g. FLUSHDB, could have written anything.
+            self.clear('write')
+
+    def _read(self, info, execute, args, options):
+        key = self._encode(args[1])
+        cache_key = (info.name,) + tuple(self._encode(arg) for arg in args[1:])
+        evicted = [0, 0]
+        with self._lock:
+            value = self._lookup(cache_key, evicted)
+        self._record_lookups(info.method, value is not _MISSING, value is _MISSING, evicted)
+        if value is not _MISSING:
+            return _copy(value)
+
+        fill = self._begin_fill([key])
+        stored = {}
+        try:
+            value = execute(*args, **options)
+            stored[key] = (cache_key, value)
+        finally:
+            self._end_fill(fill, stored, evicted)
+        return value
+
+    def _mget(self, info, execute, args, options):
+        keys = list(args[1:])
+        encoded = [self._encode(key) for key in keys]
+        values = [_MISSING] * len(keys)
+        evicted = [0, 0]
+        with self._lock:
+            for i, key in enumerate(encoded):
+                values[i] = self._lookup(('get', key), evicted)
+        missing = [i for i, value in enumerate(values) if value is _MISSING]
+        self._record_lookups(info.method, len(keys) - len(missing), len(missing), evicted)
+        if not missing:
+            return values
+
+        # Only the keys that missed are read, redis-py looks the keys up in
+        # options only to parse the reply.
+        missing_keys = [keys[i] for i in missing]
+        if 'keys' in options:
+            options = dict(options, keys=missing_keys)
+        fill = self._begin_fill([encoded[i] for i in missing])
+        stored = {}
+        try:
+            replies = execute(args[0], *missing_keys, **options)
+            for i, reply in zip(missing, replies):
+                values[i] = reply
+                stored[encoded[i]] = (('get', encoded[i]), reply)
+        finally:
+            self._end_fill(fill, stored, evicted)
+        return values
+
+    def _lookup(self, cache_key, evicted):
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return _MISSING
+        if entry.expires_at <= observability._now():
+            self._remove(cache_key, entry)
+            evicted[1] += 1
+            return _MISSING
+        self._entries.move_to_end(cache_key)
+        return entry.value
+
+    def _begin_fill(self, keys):
+        with self._lock:
+            fill = []
+            for key in keys:
+                counts = self._fills.setdefault(key, [0, 0])
+                counts[0] += 1
+                fill.append((key, counts[1]))
+            return fill
+
+    def _end_fill(self, fill, stored, evicted):
+        with self._lock:
+            for key, invalidations in fill:
+                counts = self._fills[key]
+                if key in stored and counts[1] == invalidations and not self.bypass:
+                    self._store(stored[key][0], key, stored[key][1], evicted)
+                counts[0] -= 1
+                if not counts[0]:
+                    del self._fills[key]
+            size_bytes = self.size_bytes
+        self._record_evictions(evicted)
+        observability._record_measurement(observability.m_cache_bytes, size_bytes, None, None, None)
+
+    def _store(self, cache_key, key, value, evicted):
+        size = sum(len(each) for each in cache_key[1:])
+        size += observability.summarize_lengths(value, max_items=1 << 20).total
+        if size > self.max_bytes:
+            return
+
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self.size_bytes -= entry.size
+        self._entries[cache_key] = _Entry(_copy(value), key, size, observability._now() + self.ttl)
+        self._cache_keys_by_key.setdefault(key, set()).add(cache_key)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            cache_key, entry = self._entries.popitem(last=False)
+            self._unindex(cache_key, entry)
+            evicted[0] += 1
+
+    def _remove(self, cache_key, entry):
+        del self._entries[cache_key]
+        self._unindex(cache_key, entry)
+
+    def _unindex(self, cache_key, entry):
+        self.size_bytes -= entry.size
+        cache_keys = self._cache_keys_by_key[entry.key]
+        cache_keys.discard(cache_key)
+        if not cache_keys:
+            del self._cache_keys_by_key[entry.key]
+
+    def invalidate(self, keys, reason='write'):
+        """
+        invalidate removes every entry of keys from the cache.
+        """
+        invalidated = 0
+        with self._lock:
+            for key in keys:
+                key = self._encode(key)
+                counts = self._fills.get(key)
+                if counts is not None:
+                    counts[1] += 1
+                for cache_key in self._cache_keys_by_key.pop(key, ()):
+                    self.size_bytes -= self._entries.pop(cache_key).size
+                    invalidated += 1
+            size_bytes = self.size_bytes
+        self._record_invalidations(invalidated, reason, size_bytes)
+
+    def clear(self, reason='write'):
+        """
+        clear removes every entry from the cache.
+        """
+        self._record_invalidations(self._clear(), reason, 0)
+
+    def _clear(self):
+        with self._lock:
+            cleared = len(self._entries)
+            self._entries.clear()
+            self._cache_keys_by_key.clear()
+            self.size_bytes = 0
+            for counts in self._fills.values():
+                counts[1] += 1
+            return cleared
+
+    def _record_lookups(self, method_name, hits, misses, evicted):
+        if hits:
+            observability._record_measurement(observability.m_cache_hits, int(hits), method_name, None, None)
+        if misses:
+            observability._record_measurement(observability.m_cache_misses, int(misses), method_name, None, None)
+        self._record_evictions(evicted)
+
+    def _record_evictions(self, evicted):
+        for reason, count in zip(('size', 'ttl'), evicted):
+            if count:
+                observability._record_measurement(observability.m_cache_evictions, count, None, None, None,
+                        ((observability.key_reason, reason),))
+        evicted[:] = [0, 0]
+
+    def _record_invalidations(self, invalidated, reason, size_bytes):
+        if invalidated:
+            observability._record_measurement(observability.m_cache_invalidations, invalidated, None, None, None,
+                    ((observability.key_reason, reason),))
+            observability._record_measurement(observability.m_cache_bytes, size_bytes, None, None, None)
+
+    def start_tracking(self, connection_pool):
+        """
+        start_tracking subscribes a dedicated connection of connection_pool to
+        the invalidations of Redis server-assisted client side caching, and
+        has every connection checked out of the pool redirect its tracking to
+        it, see https://redis.io/docs/manual/client-side-caching/.
+
+        While the dedicated connection is down, the cache is cleared and
+        bypassed until it reconnects.
+        """
+        if not hasattr(connection_pool, 'tracking_listener'):
+            raise ValueError('tracking requires an OcConnectionPool or OcBlockingConnectionPool')
+        if connection_pool.tracking_listener is not None:
+            raise ValueError('the connection pool already redirects tracking to another cache')
+        self._listener = _TrackingListener(self, connection_pool)
+        connection_pool.tracking_listener = self._listener
+
+    def close(self):
+        """
+        close stops tracking, if started, and clears the cache.
+        """
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+        self._clear()
+
+
+class _TrackingListener(object):
+    """
+    _TrackingListener reads the invalidation messages of its dedicated
+    connection from a daemon thread. client_id is the id of that connection,
+    or None while it is down.
+    """
+
+    def __init__(self, cache, connection_pool):
+        self.cache = cache
+        self.connection_pool = connection_pool
+        self.connection = None
+        self.client_id = None
+        self._stopped = threading.Event()
+        self._connect()
+        self._thread = threading.Thread(target=self._run, name='ocredis-read-cache-tracking')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _connect(self):
+        pool = self.connection_pool
+        connection = pool.connection_class(**pool.connection_kwargs)
+        try:
+            connection.connect()
+            connection.send_command('CLIENT', 'ID')
+            client_id = connection.read_response()
+            connection.send_command('SUBSCRIBE', INVALIDATE_CHANNEL)
+            connection.read_response()
+        except Exception:
+            connection.disconnect()
+            raise
+        self.connection = connection
+        self.client_id = int(client_id)
+        self.cache.bypass = False
+
+    def enable_tracking(self, connection):
+        """
+        enable_tracking redirects the tracking of the keys read on connection
+        to the dedicated connection, unless it already is.
+        """
+        client_id = self.client_id
+        if client_id is None:
+            return
+        state = (getattr(connection, '_sock', None), client_id)
+        if connection.__dict__.get('_ocredis_tracking') == state:
+            return
+        connection.send_command('CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id)
+        connection.read_response()
+        connection._ocredis_tracking = state
+
+    def _run(self):
+        backoff = 0.1
+        while not self._stopped.is_set():
+            try:
+                if self.connection is None:
+                    self._connect()
+                    backoff = 0.1
+                if self.connection.can_read(timeout=0.1):
+                    self._handle(self.connection.read_response())
+            except Exception:
+                # Invalidations may have been missed, so nothing that is
+                # cached can be trusted until tracking is back.
+                self.client_id = None
+                self.cache.bypass = True
+                self.cache.clear('tracking')
+                self._disconnect()
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 5.0)
+        self._disconnect()
+
+    def _handle(self, message):
+        if not isinstance(message, list) or len(message) < 3 or message[0] not in (b'message', 'message'):
+            return
+        keys = message[2]
+        if keys is None:
+            # The server flushed its keys, or ran out of room to track them.
+            self.cache.clear('tracking')
+        else:
+            self.cache.invalidate(keys, 'tracking')
+
+    def _disconnect(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.disconnect()
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self.client_id = None
+        if self.connection_pool.tracking_listener is self:
+            self.connection_pool.tracking_listener = None
@@ -0,0 +1,247 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Instrumented Redis Cluster clients, built on redis.cluster which ships with
+redis-py 4.1.0 and later.
+"""
+
+import collections
+import concurrent.futures
+import contextvars
+import threading
+
+from redis.cluster import ClusterPipeline, RedisCluster
+from redis.exceptions import RedisClusterException, RedisError
+
+try:
+    from ocredis import observability
+    from ocredis.commands import command_info
+    from ocredis.pool import OcConnectionPool
+    from ocredis.observability import trace_and_record_command, trace_and_record_pipeline
+    from ocredis.spanpolicy import span_policy
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.commands import command_info
+    from .ocredis.pool import OcConnectionPool
+    from .ocredis.observability import trace_and_record_command, trace_and_record_pipeline
+    from .ocredis.spanpolicy import span_policy
+except Exception as e:
+    raise e
+
+CLUSTER_PIPELINE_METHOD = 'redispy.ClusterPipeline.execute'
+
+
+class _FanOut(object):
+    """
+    _FanOut runs calls on a pool of up to max_workers threads, created on
+    first use, each in a copy of the context of its caller so that their
+    spans are children of the current span.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def map(self, fn, items):
+        """
+        map returns fn(*item) for each of items, in order. Should any call
+        raise, the first exception is raised once every call is done.
+        """
+        items = list(items)
+        if len(items) < 2 or self.max_workers < 2:
+            return [fn(*item) for item in items]
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self.max_workers,
+                        thread_name_prefix='ocredis-cluster')
+            executor = self._executor
+        futures = [executor.submit(contextvars.copy_context().run, fn, *item) for item in items]
+        concurrent.futures.wait(futures)
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+class OcRedisCluster(RedisCluster):
+    """
+    OcRedisCluster is the instrumented wrapper for redis.cluster.RedisCluster
+    clients. Every command is traced and recorded as by OcRedis, and each
+    attempt to send it to a node is recorded against the
+    redispy/cluster_node_latency view, tagged by node.
+
+    The nodes are connected to through OcConnectionPools, whose connections
+    count the MOVED and ASK redirections of each node. redis-py only creates
+    the pools of nodes from connection_pool_class for clusters given by URL,
+    so clusters given by host or startup nodes are given by the URL of their
+    first node. The slot map is cached by redis-py and refreshed lazily, once
+    a node replies MOVED reinitialize_steps times.
+
+    Multi-key commands such as mget_nonatomic, mset_nonatomic, delete,
+    exists and unlink, as well as pipelines, are sent to the nodes in
+    parallel on a pool of up to fanout_workers threads.
+
+    Given a span_policy, commands only get spans as per that policy, see
+    ocredis.spanpolicy.
+    """
+    span_policy = None
+
+    def __init__(self, host=None, port=6379, startup_nodes=None, **kwargs):
+        self.span_policy = span_policy(kwargs.pop('span_policy', None))
+        self.fan_out = _FanOut(kwargs.pop('fanout_workers', 8))
+        kwargs.setdefault('connection_pool_class', OcConnectionPool)
+        if kwargs.get('url') is None and (host or startup_nodes):
+            if not host:
+                host, port = startup_nodes[0].host, startup_nodes[0].port
+            # The pools take SSL connections from the scheme rather than ssl.
+            kwargs['url'] = '%s://%s:%s' % ('rediss' if kwargs.pop('ssl', False) else 'redis',
+                    '[%s]' % host if ':' in host else host, port)
+        super(OcRedisCluster, self).__init__(host, port, startup_nodes, **kwargs)
+
+    def close(self):
+        self.fan_out.shutdown()
+        super(OcRedisCluster, self).close()
+
+    def execute_command(self, *args, **kwargs):
+        return trace_and_record_command(super(OcRedisCluster, self).execute_command, args, kwargs,
+                self.span_policy)
+
+    def _execute_command(self, target_node, *args, **kwargs):
+        start_time = observability._now()
+        status, error = 'ERROR', None
+        try:
+            result = super(OcRedisCluster, self)._execute_command(target_node, *args, **kwargs)
+            status = 'OK'
+            return result
+        except Exception as e:
+            error = observability.classify_error(e)
+            raise
+        finally:
+            observability._record_measurement(observability.m_cluster_node_latency_ms,
+                    (observability._now() - start_time) * 1e3, command_info(args[0]).method, status, error,
+                    ((observability.key_node, target_node.name),))
+
+    def pipeline(self, transaction=None, shard_hint=None):
+        if shard_hint:
+            raise RedisClusterException('shard_hint is deprecated in cluster mode')
+        if transaction:
+            raise RedisClusterException('transaction is deprecated in cluster mode')
+
+        pipeline = OcClusterPipeline(
+                nodes_manager=self.nodes_manager,
+                commands_parser=self.commands_parser,
+                startup_nodes=self.nodes_manager.startup_nodes,
+                result_callbacks=self.result_callbacks,
+                cluster_response_callbacks=self.cluster_response_callbacks,
+                cluster_error_retry_attempts=self.cluster_error_retry_attempts,
+                read_from_replicas=self.read_from_replicas,
+                reinitialize_steps=self.reinitialize_steps,
+                lock=self._lock)
+        pipeline.span_policy = self.span_policy
+        pipeline.fan_out = self.fan_out
+        return pipeline
+
+
+class OcClusterPipeline(ClusterPipeline):
+    """
+    OcClusterPipeline is the instrumented wrapper for
+    redis.cluster.ClusterPipeline, recorded as OcPipeline is. The commands
+    bound for each node are sent and read as a pipeline of their own, timed
+    against the redispy/cluster_node_latency view, on a thread of the
+    fan_out of the OcRedisCluster that created the pipeline. Each thread
+    sends its commands through a ClusterPipeline of its own, so that they
+    don't share its retry and redirection state.
+    """
+    span_policy = None
+    fan_out = _FanOut(1)
+
+    def execute(self, raise_on_error=True):
+        command_stack = [(command.args, command.options) for command in self.command_stack]
+        if not command_stack:
+            return super(OcClusterPipeline, self).execute(raise_on_error)
+        return trace_and_record_pipeline(
+                CLUSTER_PIPELINE_METHOD,
+                super(OcClusterPipeline, self).execute, command_stack, raise_on_error,
+                span_policy=self.span_policy)
+
+    def _node_name_of(self, command):
+        # As per ClusterPipeline._send_cluster_commands, which raises the
+        # errors of commands without a single node.
+        passed_targets = command.options.get('target_nodes')
+        try:
+            if passed_targets and not self._is_nodes_flag(passed_targets):
+                target_nodes = self._parse_target_nodes(passed_targets)
+            else:
+                target_nodes = self._determine_nodes(*command.args, node_flag=passed_targets)
+        except (RedisClusterException, RedisError):
+            return None
+        if not target_nodes or len(target_nodes) > 1:
+            return None
+        return target_nodes[0].name
+
+    def _node_pipeline(self):
+        return ClusterPipeline(
+                nodes_manager=self.nodes_manager,
+                commands_parser=self.commands_parser,
+                startup_nodes=self.startup_nodes,
+                result_callbacks=self.result_callbacks,
+                cluster_response_callbacks=self.cluster_response_callbacks,
+                cluster_error_retry_attempts=self.cluster_error_retry_attempts,
+                read_from_replicas=self.read_from_replicas,
+                reinitialize_steps=self.reinitialize_steps,
+                lock=self._lock)
+
+    def _send_to_node(self, send, node_name, stack, raise_on_error, allow_redirections):
+        start_time = observability._now()
+        status, error = 'ERROR', None
+        try:
+            result = send(stack, raise_on_error, allow_redirections)
+            status = 'OK'
+            return result
+        except Exception as e:
+            error = observability.classify_error(e)
+            raise
+        finally:
+            observability._record_measurement(observability.m_cluster_node_latency_ms,
+                    (observability._now() - start_time) * 1e3, CLUSTER_PIPELINE_METHOD, status, error,
+                    ((observability.key_node, node_name),))
+
+    def send_cluster_commands(self, stack, raise_on_error=True, allow_redirections=True):
+        send = super(OcClusterPipeline, self).send_cluster_commands
+        by_node = collections.OrderedDict()
+        for command in stack:
+            name = self._node_name_of(command)
+            if name is None:
+                # Left to redis-py, which raises the error of this command.
+                return send(stack, raise_on_error, allow_redirections)
+            by_node.setdefault(name, []).append(command)
+        if len(by_node) == 1:
+            return self._send_to_node(send, next(iter(by_node)), stack, raise_on_error, allow_redirections)
+
+        # The results are set on the commands themselves, each of which is in
+        # the stack of a single node.
+        pipelines = [self._node_pipeline() for _ in by_node]
+        self.fan_out.map(self._send_to_node,
+                [(pipeline.send_cluster_commands, name, commands, False, allow_redirections)
+                 for pipeline, (name, commands) in zip(pipelines, by_node.items())])
+        self.reinitialize_counter += sum(pipeline.reinitialize_counter for pipeline in pipelines)
+        if raise_on_error:
+            self.raise_first_error(stack)
+        return [command.result for command in sorted(stack, key=lambda command: command.position)]
@@ -0,0 +1,194 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import threading
+
+try:
+    from ocredis import observability
+    from ocredis.commands import command_info, command_keys
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.commands import command_info, command_keys
+except Exception as e:
+    raise e
+
+# The number of arguments of the coalesced commands, including their name.
+_COALESCED_COMMANDS = {'get': 2, 'hget': 3}
+
+
+class _Read(object):
+    __slots__ = ('args', 'read_key', 'batch', 'done', 'value', 'error')
+
+    def __init__(self, args, read_key, batch):
+        self.args = args
+        self.read_key = read_key
+        self.batch = batch
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Batch(object):
+    __slots__ = ('reads', 'full', 'sent_at')
+
+    def __init__(self):
+        self.reads = []
+        self.full = threading.Event()
+        self.sent_at = None
+
+
+class Coalescer(object):
+    """
+    Coalescer merges the GET and HGET calls that concurrent threads make on an
+    OcRedis client into batches, see OcRedis.enable_coalescing.
+
+    While another batch is in flight, the first read of a batch waits up to
+    window_ms, or until max_batch reads have joined, then sends the whole
+    batch in a single round trip: an MGET if all of the reads are GETs,
+    otherwise a pipeline. Otherwise there is no other reader to wait for and
+    the read is sent right away. Reads of the same key while another one is
+    waiting or in flight share its reply, unless the key was written through
+    the client in the meantime.
+
+    MGET replies nil for keys that don't hold strings as well as for missing
+    ones, so the GETs whose replies are nil are sent again in a pipeline,
+    for those that GET would fail with WRONGTYPE.
+
+    The batches are recorded as calls of redispy.Redis.mget or
+    redispy.Pipeline.execute, along with the redispy/coalesce_batch_size and
+    redispy/coalesce_wait metrics.
+    """
+
+    def __init__(self, pipeline, encoder=None, window_ms=0.2, max_batch=64):
+        self.pipeline = pipeline
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._encoder = encoder
+        self._lock = threading.Lock()
+        self._batch = None
+        self._reads = {}
+        self._in_flight = 0
+
+    def _encode(self, arg):
+        if self._encoder is None:
+            return arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        return self._encoder.encode(arg)
+
+    def execute_command(self, execute, args, options):
+        """
+        execute_command coalesces the command args with those of other
+        threads if possible, otherwise has execute(*args, **options) send it.
+        """
+        info = command_info(args[0])
+        if _COALESCED_COMMANDS.get(info.name) != len(args) or any(name != 'keys' for name in options):
+            if 'w' in info.flags:
+                self._forget(command_keys(info, args))
+            return execute(*args, **options)
+
+        start_time = observability._now()
+        read_key = (info.name,) + tuple(self._encode(arg) for arg in args[1:])
+        leader = False
+        with self._lock:
+            read = self._reads.get(read_key)
+            if read is None:
+                batch = self._batch
+                if batch is None:
+                    batch = self._batch = _Batch()
+                    leader = True
+                read = self._reads[read_key] = _Read(args, read_key, batch)
+                batch.reads.append(read)
+                if len(batch.reads) >= self.max_batch:
+                    self._batch = None
+                    batch.full.set()
+
+        if leader:
+            self._send(execute, read.batch)
+        read.done.wait()
+
+        sent_at = read.batch.sent_at
+        observability._record_measurement(observability.m_coalesce_wait_ms,
+                max(sent_at - start_time, 0.0) * 1e3, info.method, None, None)
+        error = read.error
+        if error is not None:
+            # The error is shared by every read of the batch, and of the same
+            # key, so each one raises a copy of its own.
+            try:
+                own_error = copy.copy(error)
+            except Exception:
+                raise error
+            raise own_error from error
+        return read.value
+
+    def _forget(self, keys):
+        # Reads that are already waiting or in flight could miss the write,
+        # so later reads of its keys don't share their replies.
+        with self._lock:
+            if not self._reads:
+                return
+            if keys:
+                keys = set(self._encode(key) for key in keys)
+            for read_key in list(self._reads):
+                if not keys or read_key[1] in keys:
+                    del self._reads[read_key]
+
+    def _send(self, execute, batch):
+        with self._lock:
+            in_flight = self._in_flight
+        if in_flight:
+            batch.full.wait(self.window_ms / 1e3)
+        with self._lock:
+            if self._batch is batch:
+                self._batch = None
+            reads = batch.reads
+            batch.sent_at = observability._now()
+            self._in_flight += 1
+
+        try:
+            replies = self._read_all(execute, reads)
+        except Exception as e:
+            replies = [e] * len(reads)
+
+        with self._lock:
+            self._in_flight -= 1
+            for read in reads:
+                if self._reads.get(read.read_key) is read:
+                    del self._reads[read.read_key]
+        for read, reply in zip(reads, replies):
+            if isinstance(reply, Exception):
+                read.error = reply
+            else:
+                read.value = reply
+            read.done.set()
+        observability._record_measurement(observability.m_coalesce_batch_size, len(reads), None, None, None)
+
+    def _read_all(self, execute, reads):
+        if len(reads) == 1:
+            return [execute(*reads[0].args)]
+
+        if any(read.read_key[0] != 'get' for read in reads):
+            return self._pipeline_all(reads)
+
+        replies = execute('MGET', *[read.args[1] for read in reads])
+        nil = [i for i, reply in enumerate(replies) if reply is None]
+        if nil:
+            for i, reply in zip(nil, self._pipeline_all([reads[i] for i in nil])):
+                replies[i] = reply
+        return replies
+
+    def _pipeline_all(self, reads):
+        pipe = self.pipeline(transaction=False)
+        for read in reads:
+            pipe.execute_command(*read.args)
+        return pipe.execute(raise_on_error=False)
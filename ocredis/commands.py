@@ -0,0 +1,416 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+# CommandInfo describes how a command is instrumented:
+#   name:   the lowercased command name e.g. 'get' or 'client_kill'
+#   method: the method tag and span name e.g. 'redispy.Redis.get'
+#   flags:  a string of 'r' (reads data), 'w' (writes data), 'b' (blocks)
+#           and 'B' (blocks when given a BLOCK argument, see call_info)
+#   keys:   the positions of the keys within the arguments
+#   values: the positions of the values within the arguments
+# Positions are either a (first, last, step) slice of the arguments, where a
+# negative last counts from the end, None for no arguments at all, or a
+# function of the arguments for commands whose keys are given by a count.
+CommandInfo = collections.namedtuple('CommandInfo', ['name', 'method', 'flags', 'keys', 'values'])
+
+
+def _numkeys_keys(args):
+    # EVAL script numkeys key [key ...] arg [arg ...]
+    # BLMPOP timeout numkeys key [key ...] LEFT|RIGHT [COUNT count]
+    try:
+        return args[3:3 + int(args[2])]
+    except (IndexError, ValueError):
+        return ()
+
+
+def _leading_numkeys_keys(args):
+    # LMPOP numkeys key [key ...] LEFT|RIGHT [COUNT count]
+    try:
+        return args[2:2 + int(args[1])]
+    except (IndexError, ValueError):
+        return ()
+
+
+def _numkeys_values(args):
+    try:
+        return args[3 + int(args[2]):]
+    except (IndexError, ValueError):
+        return ()
+
+
+def _store_numkeys_keys(args):
+    # ZUNIONSTORE destination numkeys key [key ...] [WEIGHTS ...]
+    try:
+        return args[1:2] + args[3:3 + int(args[2])]
+    except (IndexError, ValueError):
+        return args[1:2]
+
+
+def _streams_keys(args):
+    # XREAD [COUNT count] [BLOCK ms] STREAMS key [key ...] id [id ...]
+    for i, arg in enumerate(args):
+        if arg in (b'STREAMS', 'STREAMS', b'streams', 'streams'):
+            streams = args[i + 1:]
+            return streams[:len(streams) // 2]
+    return ()
+
+
+def _has_block_argument(args):
+    # XREAD [COUNT count] [BLOCK ms] STREAMS key [key ...] id [id ...]
+    for arg in args[1:]:
+        if arg in (b'BLOCK', 'BLOCK', b'block', 'block'):
+            return True
+        if arg in (b'STREAMS', 'STREAMS', b'streams', 'streams'):
+            return False
+    return False
+
+
+def _migrate_keys(args):
+    # MIGRATE host port key|"" db timeout [COPY] [REPLACE] [KEYS key [key ...]]
+    for i, arg in enumerate(args):
+        if arg in (b'KEYS', 'KEYS'):
+            return args[i + 1:]
+    return args[3:4]
+
+
+_K = (1, 1, 1)
+_K12 = (1, 2, 1)
+_KALL = (1, -1, 1)
+_KPAIRS = (1, -1, 2)
+_KTIMEOUT = (1, -2, 1)
+_V2 = (2, 2, 1)
+_V3 = (3, 3, 1)
+_VREST = (2, -1, 1)
+_VPAIRS = (2, -1, 2)
+_VFIELDS = (3, -1, 2)
+
+# The metadata of each command, as (flags, keys, values).
+_COMMANDS = {
+    # Strings
+    'APPEND': ('w', _K, _V2),
+    'BITCOUNT': ('r', _K, None),
+    'BITFIELD': ('w', _K, None),
+    'BITOP': ('w', (2, -1, 1), None),
+    'BITPOS': ('r', _K, None),
+    'DECR': ('w', _K, None),
+    'DECRBY': ('w', _K, None),
+    'GET': ('r', _K, None),
+    'GETBIT': ('r', _K, None),
+    'GETDEL': ('w', _K, None),
+    'GETEX': ('w', _K, None),
+    'GETRANGE': ('r', _K, None),
+    'GETSET': ('w', _K, _V2),
+    'INCR': ('w', _K, None),
+    'INCRBY': ('w', _K, None),
+    'INCRBYFLOAT': ('w', _K, None),
+    'LCS': ('r', _K12, None),
+    'MGET': ('r', _KALL, None),
+    'MSET': ('w', _KPAIRS, _VPAIRS),
+    'MSETNX': ('w', _KPAIRS, _VPAIRS),
+    'PSETEX': ('w', _K, _V3),
+    'SET': ('w', _K, _V2),
+    'SETBIT': ('w', _K, _V3),
+    'SETEX': ('w', _K, _V3),
+    'SETNX': ('w', _K, _V2),
+    'SETRANGE': ('w', _K, _V3),
+    'STRLEN': ('r', _K, None),
+    'SUBSTR': ('r', _K, None),
+
+    # Keys
+    'COPY': ('w', _K12, None),
+    'DEL': ('w', _KALL, None),
+    'DUMP': ('r', _K, None),
+    'EXISTS': ('r', _KALL, None),
+    'EXPIRE': ('w', _K, None),
+    'EXPIREAT': ('w', _K, None),
+    'EXPIRETIME': ('r', _K, None),
+    'KEYS': ('r', None, None),
+    'MIGRATE': ('w', _migrate_keys, None),
+    'MOVE': ('w', _K, None),
+    'OBJECT': ('r', (2, 2, 1), None),
+    'PERSIST': ('w', _K, None),
+    'PEXPIRE': ('w', _K, None),
+    'PEXPIREAT': ('w', _K, None),
+    'PEXPIRETIME': ('r', _K, None),
+    'PTTL': ('r', _K, None),
+    'RANDOMKEY': ('r', None, None),
+    'RENAME': ('w', _K12, None),
+    'RENAMENX': ('w', _K12, None),
+    'RESTORE': ('w', _K, _V3),
+    'SCAN': ('r', None, None),
+    'SORT': ('w', _K, None),
+    'TOUCH': ('r', _KALL, None),
+    'TTL': ('r', _K, None),
+    'TYPE': ('r', _K, None),
+    'UNLINK': ('w', _KALL, None),
+    'WAIT': ('b', None, None),
+    'WAITAOF': ('b', None, None),
+
+    # Hashes
+    'HDEL': ('w', _K, None),
+    'HEXISTS': ('r', _K, None),
+    'HGET': ('r', _K, None),
+    'HGETALL': ('r', _K, None),
+    'HINCRBY': ('w', _K, None),
+    'HINCRBYFLOAT': ('w', _K, None),
+    'HKEYS': ('r', _K, None),
+    'HLEN': ('r', _K, None),
+    'HMGET': ('r', _K, None),
+    'HMSET': ('w', _K, _VFIELDS),
+    'HRANDFIELD': ('r', _K, None),
+    'HSCAN': ('r', _K, None),
+    'HSET': ('w', _K, _VFIELDS),
+    'HSETNX': ('w', _K, _V3),
+    'HSTRLEN': ('r', _K, None),
+    'HVALS': ('r', _K, None),
+
+    # Lists
+    'BLMOVE': ('wb', _K12, None),
+    'BLMPOP': ('wb', _numkeys_keys, None),
+    'BLPOP': ('wb', _KTIMEOUT, None),
+    'BRPOP': ('wb', _KTIMEOUT, None),
+    'BRPOPLPUSH': ('wb', _K12, None),
+    'LINDEX': ('r', _K, None),
+    'LINSERT': ('w', _K, (4, 4, 1)),
+    'LLEN': ('r', _K, None),
+    'LMOVE': ('w', _K12, None),
+    'LMPOP': ('w', _leading_numkeys_keys, None),
+    'LPOP': ('w', _K, None),
+    'LPOS': ('r', _K, _V2),
+    'LPUSH': ('w', _K, _VREST),
+    'LPUSHX': ('w', _K, _VREST),
+    'LRANGE': ('r', _K, None),
+    'LREM': ('w', _K, _V3),
+    'LSET': ('w', _K, _V3),
+    'LTRIM': ('w', _K, None),
+    'RPOP': ('w', _K, None),
+    'RPOPLPUSH': ('w', _K12, None),
+    'RPUSH': ('w', _K, _VREST),
+    'RPUSHX': ('w', _K, _VREST),
+
+    # Sets
+    'SADD': ('w', _K, _VREST),
+    'SCARD': ('r', _K, None),
+    'SDIFF': ('r', _KALL, None),
+    'SDIFFSTORE': ('w', _KALL, None),
+    'SINTER': ('r', _KALL, None),
+    'SINTERSTORE': ('w', _KALL, None),
+    'SISMEMBER': ('r', _K, _V2),
+    'SMEMBERS': ('r', _K, None),
+    'SMISMEMBER': ('r', _K, _VREST),
+    'SMOVE': ('w', _K12, _V3),
+    'SPOP': ('w', _K, None),
+    'SRANDMEMBER': ('r', _K, None),
+    'SREM': ('w', _K, _VREST),
+    'SSCAN': ('r', _K, None),
+    'SUNION': ('r', _KALL, None),
+    'SUNIONSTORE': ('w', _KALL, None),
+
+    # Sorted sets
+    'BZMPOP': ('wb', _numkeys_keys, None),
+    'BZPOPMAX': ('wb', _KTIMEOUT, None),
+    'BZPOPMIN': ('wb', _KTIMEOUT, None),
+    'ZADD': ('w', _K, _VREST),
+    'ZCARD': ('r', _K, None),
+    'ZCOUNT': ('r', _K, None),
+    'ZINCRBY': ('w', _K, _V3),
+    'ZINTERSTORE': ('w', _store_numkeys_keys, None),
+    'ZLEXCOUNT': ('r', _K, None),
+    'ZMPOP': ('w', _leading_numkeys_keys, None),
+    'ZMSCORE': ('r', _K, _VREST),
+    'ZPOPMAX': ('w', _K, None),
+    'ZPOPMIN': ('w', _K, None),
+    'ZRANDMEMBER': ('r', _K, None),
+    'ZRANGE': ('r', _K, None),
+    'ZRANGEBYLEX': ('r', _K, None),
+    'ZRANGEBYSCORE': ('r', _K, None),
+    'ZRANK': ('r', _K, _V2),
+    'ZREM': ('w', _K, _VREST),
+    'ZREMRANGEBYLEX': ('w', _K, None),
+    'ZREMRANGEBYRANK': ('w', _K, None),
+    'ZREMRANGEBYSCORE': ('w', _K, None),
+    'ZREVRANGE': ('r', _K, None),
+    'ZREVRANGEBYLEX': ('r', _K, None),
+    'ZREVRANGEBYSCORE': ('r', _K, None),
+    'ZREVRANK': ('r', _K, _V2),
+    'ZSCAN': ('r', _K, None),
+    'ZSCORE': ('r', _K, _V2),
+    'ZUNIONSTORE': ('w', _store_numkeys_keys, None),
+
+    # HyperLogLogs
+    'PFADD': ('w', _K, _VREST),
+    'PFCOUNT': ('r', _KALL, None),
+    'PFMERGE': ('w', _KALL, None),
+
+    # Geo
+    'GEOADD': ('w', _K, _VREST),
+    'GEODIST': ('r', _K, None),
+    'GEOHASH': ('r', _K, _VREST),
+    'GEOPOS': ('r', _K, _VREST),
+    'GEORADIUS': ('w', _K, None),
+    'GEORADIUSBYMEMBER': ('w', _K, _V2),
+    'GEOSEARCH': ('r', _K, None),
+
+    # Streams
+    'XACK': ('w', _K, None),
+    'XADD': ('w', _K, _VREST),
+    'XAUTOCLAIM': ('w', _K, None),
+    'XCLAIM': ('w', _K, None),
+    'XDEL': ('w', _K, None),
+    'XGROUP CREATE': ('w', _K, None),
+    'XGROUP CREATECONSUMER': ('w', _K, None),
+    'XGROUP DELCONSUMER': ('w', _K, None),
+    'XGROUP DESTROY': ('w', _K, None),
+    'XGROUP SETID': ('w', _K, None),
+    'XINFO CONSUMERS': ('r', _K, None),
+    'XINFO GROUPS': ('r', _K, None),
+    'XINFO STREAM': ('r', _K, None),
+    'XLEN': ('r', _K, None),
+    'XPENDING': ('r', _K, None),
+    'XRANGE': ('r', _K, None),
+    'XREAD': ('rB', _streams_keys, None),
+    'XREADGROUP': ('wB', _streams_keys, None),
+    'XREVRANGE': ('r', _K, None),
+    'XTRIM': ('w', _K, None),
+
+    # Scripting
+    'EVAL': ('w', _numkeys_keys, _numkeys_values),
+    'EVALSHA': ('w', _numkeys_keys, _numkeys_values),
+    'SCRIPT EXISTS': ('', None, None),
+    'SCRIPT FLUSH': ('', None, None),
+    'SCRIPT KILL': ('', None, None),
+    'SCRIPT LOAD': ('', None, (1, 1, 1)),
+
+    # Pub/Sub
+    'PUBLISH': ('', None, _V2),
+    'PUBSUB CHANNELS': ('', None, None),
+    'PUBSUB NUMPAT': ('', None, None),
+    'PUBSUB NUMSUB': ('', None, None),
+
+    # Transactions
+    'WATCH': ('r', _KALL, None),
+    'UNWATCH': ('', None, None),
+
+    # Connection and server
+    'AUTH': ('', None, None),
+    'BGREWRITEAOF': ('', None, None),
+    'BGSAVE': ('', None, None),
+    'CLIENT GETNAME': ('', None, None),
+    'CLIENT ID': ('', None, None),
+    'CLIENT KILL': ('', None, None),
+    'CLIENT LIST': ('', None, None),
+    'CLIENT PAUSE': ('', None, None),
+    'CLIENT SETNAME': ('', None, None),
+    'CLIENT TRACKING': ('', None, None),
+    'CLIENT UNBLOCK': ('', None, None),
+    'CLUSTER': ('', None, None),
+    'CONFIG GET': ('', None, None),
+    'CONFIG RESETSTAT': ('', None, None),
+    'CONFIG REWRITE': ('', None, None),
+    'CONFIG SET': ('', None, None),
+    'DBSIZE': ('', None, None),
+    'DEBUG OBJECT': ('r', _K, None),
+    'ECHO': ('', None, (1, 1, 1)),
+    'FLUSHALL': ('w', None, None),
+    'FLUSHDB': ('w', None, None),
+    'INFO': ('', None, None),
+    'LASTSAVE': ('', None, None),
+    'MEMORY PURGE': ('', None, None),
+    'MEMORY USAGE': ('r', _K, None),
+    'PING': ('', None, None),
+    'QUIT': ('', None, None),
+    'REPLICAOF': ('', None, None),
+    'SAVE': ('', None, None),
+    'SELECT': ('', None, None),
+    'SENTINEL': ('', None, None),
+    'SHUTDOWN': ('', None, None),
+    'SLAVEOF': ('', None, None),
+    'SLOWLOG GET': ('', None, None),
+    'SLOWLOG LEN': ('', None, None),
+    'SLOWLOG RESET': ('', None, None),
+    'SWAPDB': ('w', None, None),
+    'TIME': ('', None, None),
+}
+
+# Commands missing from the table are assumed to take a key and then values.
+_DEFAULT = ('', _K, _VREST)
+
+_infos = {}
+
+
+def command_info(command_name, prefix='redispy.Redis.'):
+    """
+    command_info returns the CommandInfo of command_name, as passed as the
+    first argument to execute_command, with its method prefixed by prefix.
+    """
+    cache_key = (command_name, prefix)
+    info = _infos.get(cache_key)
+    if info is None:
+        if isinstance(command_name, bytes):
+            command_name = command_name.decode('utf-8', 'replace')
+        upper_name = str(command_name).upper()
+        flags, keys, values = _COMMANDS.get(upper_name, _DEFAULT)
+        name = upper_name.lower().replace(' ', '_')
+        info = CommandInfo(name, prefix + name, flags, keys, values)
+        _infos[cache_key] = info
+    return info
+
+
+_call_infos = {}
+
+
+def call_info(args, prefix='redispy.Redis.'):
+    """
+    call_info returns the CommandInfo of args, a command and its arguments as
+    passed to execute_command. Unlike that of command_info, its flags tell
+    whether this very call blocks, which for commands flagged 'B' depends on
+    whether they were given a BLOCK argument.
+    """
+    info = command_info(args[0], prefix)
+    if 'B' not in info.flags:
+        return info
+    blocks = _has_block_argument(args)
+    cache_key = (info, blocks)
+    call = _call_infos.get(cache_key)
+    if call is None:
+        call = info._replace(flags=info.flags.replace('B', 'b' if blocks else ''))
+        _call_infos[cache_key] = call
+    return call
+
+
+def _select(positions, args):
+    if positions is None:
+        return ()
+    if callable(positions):
+        return positions(args)
+    first, last, step = positions
+    if last < 0:
+        last += len(args)
+    return args[first:last + 1:step]
+
+
+def command_keys(info, args):
+    """
+    command_keys returns the keys within args, a command and its arguments.
+    """
+    return _select(info.keys, args)
+
+
+def command_values(info, args):
+    """
+    command_values returns the values within args, a command and its arguments.
+    """
+    return _select(info.values, args)
@@ -0,0 +1,202 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import redis
+from redis.exceptions import AskError, MovedError
+
+try:
+    from ocredis import observability
+    from ocredis.commands import call_info
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.commands import call_info
+except Exception as e:
+    raise e
+
+# redis-py only sends packed commands directly, rather than through
+# send_command, to execute pipelines. Others that do so may tag what they send
+# by setting _ocredis_next_method on the connection beforehand, as
+# ocredis.scripts does for the scripts it preloads.
+PIPELINE_METHOD = 'redispy.Pipeline.execute'
+
+
+def _parser_buffered_bytes(connection):
+    """
+    _parser_buffered_bytes returns the number of bytes that the parser of
+    connection read from its socket but didn't parse yet, when it can tell.
+    """
+    buffer = getattr(getattr(connection, '_parser', None), '_buffer', None)
+    if buffer is None:
+        return 0
+    if hasattr(buffer, 'unread_bytes'):
+        return buffer.unread_bytes()
+    return buffer.bytes_written - buffer.bytes_read
+
+
+def _packed_length(command):
+    if isinstance(command, (bytes, bytearray, memoryview, str)):
+        return len(command)
+    return sum(len(item) for item in command)
+
+
+class _CountingSocket(object):
+    """
+    _CountingSocket counts the bytes received on the socket it wraps, and
+    notes when data is first received once received_at is reset to None.
+    """
+    __slots__ = ('_sock', 'bytes_received', 'received_at')
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.bytes_received = 0
+        self.received_at = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def recv(self, *args, **kwargs):
+        data = self._sock.recv(*args, **kwargs)
+        self.bytes_received += len(data)
+        if self.received_at is None:
+            self.received_at = observability._now()
+        return data
+
+    def recv_into(self, *args, **kwargs):
+        received = self._sock.recv_into(*args, **kwargs)
+        self.bytes_received += received
+        if self.received_at is None:
+            self.received_at = observability._now()
+        return received
+
+
+class _InstrumentedConnection(object):
+    """
+    _InstrumentedConnection records the exact number of bytes that a redis-py
+    connection sends per command and reads per reply, against the
+    redispy/request_bytes and redispy/response_bytes views.
+
+    Bytes that the parser reads ahead of a reply are counted against the
+    command whose reply was being read, which only happens to pipelines and
+    Pub/Sub connections and when hiredis, whose buffer can't be inspected,
+    is installed.
+
+    The replies of blocking commands are timed from the command being sent
+    to the first bytes of the reply arriving, which is the time the command
+    was blocked for, see ocredis.observability._note_blocked.
+
+    MOVED and ASK replies of cluster nodes are counted against the
+    redispy/cluster_redirections view, tagged by the node that replied.
+    """
+    _ocredis_method = PIPELINE_METHOD
+    _ocredis_sent_at = None
+
+    def _connect(self):
+        return _CountingSocket(super(_InstrumentedConnection, self)._connect())
+
+    def send_command(self, *args, **kwargs):
+        self._ocredis_next_info = call_info(args)
+        return super(_InstrumentedConnection, self).send_command(*args, **kwargs)
+
+    def send_packed_command(self, command, *args, **kwargs):
+        info = self.__dict__.pop('_ocredis_next_info', None)
+        if info is None:
+            method_name = self.__dict__.pop('_ocredis_next_method', PIPELINE_METHOD)
+        else:
+            method_name = info.method
+        super(_InstrumentedConnection, self).send_packed_command(command, *args, **kwargs)
+        # Health checks are sent from within send_packed_command, so the
+        # method whose reply is read next is only set once it returns.
+        self._ocredis_method = method_name
+        if info is not None and 'b' in info.flags and isinstance(self._sock, _CountingSocket):
+            self._sock.received_at = None
+            self._ocredis_sent_at = observability._now()
+        if observability._view_datas_for(observability.m_request_bytes):
+            observability._record_wire_bytes(observability.m_request_bytes, _packed_length(command),
+                    method_name)
+
+    def read_response(self, *args, **kwargs):
+        try:
+            return self._read_reply(*args, **kwargs)
+        except (MovedError, AskError) as e:
+            observability._record_measurement(observability.m_cluster_redirections, 1,
+                    self._ocredis_method, None, None,
+                    ((observability.key_node, '%s:%s' % (getattr(self, 'host', ''), getattr(self, 'port', ''))),
+                     (observability.key_reason, 'moved' if isinstance(e, MovedError) else 'ask')))
+            raise
+
+    def _read_reply(self, *args, **kwargs):
+        sent_at = self._ocredis_sent_at
+        if sent_at is not None:
+            self._ocredis_sent_at = None
+            sock = self._sock
+            try:
+                return self._read_response(*args, **kwargs)
+            finally:
+                if sock.received_at is not None:
+                    observability._note_blocked((sock.received_at - sent_at) * 1e3)
+                    sock.received_at = 0.0
+        return self._read_response(*args, **kwargs)
+
+    def _read_response(self, *args, **kwargs):
+        sock = self._sock
+        if not isinstance(sock, _CountingSocket) or \
+                not observability._view_datas_for(observability.m_response_bytes):
+            return super(_InstrumentedConnection, self).read_response(*args, **kwargs)
+
+        received = sock.bytes_received
+        buffered = _parser_buffered_bytes(self)
+        try:
+            return super(_InstrumentedConnection, self).read_response(*args, **kwargs)
+        finally:
+            # The reply may have disconnected the parser, in which case whatever it buffered is lost.
+            buffered_after = _parser_buffered_bytes(self) if self._sock is sock else 0
+            response_bytes = sock.bytes_received - received - (buffered_after - buffered)
+            observability._record_wire_bytes(observability.m_response_bytes, max(response_bytes, 0),
+                    self._ocredis_method)
+
+
+class OcConnection(_InstrumentedConnection, redis.Connection):
+    """
+    OcConnection is the instrumented wrapper for redis.Connection, which
+    OcConnectionPool uses in place of redis.Connection.
+    """
+
+
+class OcSSLConnection(_InstrumentedConnection, redis.SSLConnection):
+    """
+    OcSSLConnection is the instrumented wrapper for redis.SSLConnection,
+    counting the bytes of the commands and replies before encryption.
+    """
+
+
+class OcUnixDomainSocketConnection(_InstrumentedConnection, redis.UnixDomainSocketConnection):
+    """
+    OcUnixDomainSocketConnection is the instrumented wrapper for
+    redis.UnixDomainSocketConnection.
+    """
+
+
+_instrumented_connection_classes = {
+    redis.Connection: OcConnection,
+    redis.SSLConnection: OcSSLConnection,
+    redis.UnixDomainSocketConnection: OcUnixDomainSocketConnection,
+}
+
+
+def instrumented_connection_class(connection_class):
+    """
+    instrumented_connection_class returns the instrumented counterpart of the
+    redis-py connection_class, or connection_class itself if there is none.
+    """
+    return _instrumented_connection_classes.get(connection_class, connection_class)
@@ -0,0 +1,96 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import socket
+
+from redis import exceptions
+
+# The classes of errors that the error tag is bounded to.
+ERROR_CLASSES = ('timeout', 'connection', 'busy', 'auth', 'readonly', 'noscript', 'oom', 'redirect',
+        'cluster', 'wrongtype', 'transaction', 'response', 'data', 'lock', 'other')
+
+# The redis-py exceptions by class, most specific first since e.g. a
+# BusyLoadingError is a ConnectionError and a ReadOnlyError a ResponseError.
+# Exceptions that older versions of redis-py lack are skipped.
+_EXCEPTION_CLASSES = [(getattr(exceptions, name, None), error_class) for name, error_class in (
+        ('TimeoutError', 'timeout'),
+        ('BusyLoadingError', 'busy'),
+        ('AuthenticationError', 'auth'),
+        ('AuthorizationError', 'auth'),
+        ('NoPermissionError', 'auth'),
+        ('ConnectionError', 'connection'),
+        ('ReadOnlyError', 'readonly'),
+        ('NoScriptError', 'noscript'),
+        ('OutOfMemoryError', 'oom'),
+        ('AskError', 'redirect'),
+        ('MovedError', 'redirect'),
+        ('TryAgainError', 'busy'),
+        ('MasterDownError', 'busy'),
+        ('ClusterDownError', 'cluster'),
+        ('ExecAbortError', 'transaction'),
+        ('WatchError', 'transaction'),
+        ('LockError', 'lock'),
+        ('DataError', 'data'),
+)]
+_EXCEPTION_CLASSES = [(each, error_class) for each, error_class in _EXCEPTION_CLASSES if each is not None]
+
+# The classes of the error replies that redis-py raises as plain
+# ResponseErrors, by their error code.
+_ERROR_CODES = {
+    'ASK': 'redirect',
+    'BUSY': 'busy',
+    'CLUSTERDOWN': 'cluster',
+    'EXECABORT': 'transaction',
+    'LOADING': 'busy',
+    'MASTERDOWN': 'busy',
+    'MOVED': 'redirect',
+    'NOAUTH': 'auth',
+    'NOPERM': 'auth',
+    'NOSCRIPT': 'noscript',
+    'OOM': 'oom',
+    'READONLY': 'readonly',
+    'TRYAGAIN': 'busy',
+    'WRONGPASS': 'auth',
+    'WRONGTYPE': 'wrongtype',
+}
+
+_PIPELINE_ERROR = ' of pipeline caused error: '
+
+
+def classify_error(e):
+    """
+    classify_error returns the class of the exception e among ERROR_CLASSES,
+    which unlike its message doesn't embed keys, addresses or timeouts and
+    so can be used as a tag value.
+    """
+    for each, error_class in _EXCEPTION_CLASSES:
+        if isinstance(e, each):
+            return error_class
+
+    if isinstance(e, exceptions.ResponseError):
+        message = str(e)
+        # redis-py prefixes the errors of pipelined commands with the command.
+        if _PIPELINE_ERROR in message:
+            message = message.split(_PIPELINE_ERROR, 1)[1]
+        code = message.split(' ', 1)[0]
+        return _ERROR_CODES.get(code, 'response')
+
+    if isinstance(e, (socket.timeout, asyncio.TimeoutError)):
+        return 'timeout'
+
+    if isinstance(e, OSError):
+        return 'connection'
+
+    return 'other'
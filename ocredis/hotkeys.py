@@ -0,0 +1,250 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import hashlib
+import heapq
+import threading
+
+try:
+    from ocredis import observability
+    from ocredis.tags import key_bytes, tag_value
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.tags import key_bytes, tag_value
+except Exception as e:
+    raise e
+
+# HotKey is a key of a top-K snapshot with its estimated number of calls or
+# bytes, which overestimates the actual value by at most error.
+HotKey = collections.namedtuple('HotKey', ['key', 'value', 'error'])
+
+# HotKeysSnapshot holds the top keys by calls and by bytes seen between start
+# and end, as per observability._now().
+HotKeysSnapshot = collections.namedtuple('HotKeysSnapshot', ['start', 'end', 'by_calls', 'by_bytes'])
+
+
+class SpaceSaving(object):
+    """
+    SpaceSaving estimates the heaviest keys of a weighted stream in the
+    memory of capacity keys, as per the Space-Saving algorithm of Metwally et
+    al. Once full, a new key replaces the lightest one and inherits its
+    weight as its error, so every key weighing more than total / capacity
+    is kept and no estimate is off by more than that.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._counters = {}
+        # Holds one [weight, key] per counter, whose weight lags behind that
+        # of the counter until it reaches the top of the heap.
+        self._heap = []
+
+    def __len__(self):
+        return len(self._counters)
+
+    def add(self, key, weight=1):
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            return
+
+        if len(self._counters) < self.capacity:
+            self._counters[key] = [weight, 0]
+            heapq.heappush(self._heap, (weight, key))
+            return
+
+        while True:
+            lightest, lightest_key = self._heap[0]
+            actual = self._counters[lightest_key][0]
+            if actual == lightest:
+                break
+            heapq.heapreplace(self._heap, (actual, lightest_key))
+        del self._counters[lightest_key]
+        self._counters[key] = [lightest + weight, lightest]
+        heapq.heapreplace(self._heap, (lightest + weight, key))
+
+    def top(self, k):
+        """
+        top returns the k heaviest keys as HotKeys, heaviest first.
+        """
+        heaviest = heapq.nlargest(k, self._counters.items(), key=lambda item: item[1][0])
+        return [HotKey(key, weight, error) for key, (weight, error) in heaviest]
+
+
+def _each_key(keys):
+    if keys is None:
+        return ()
+    if isinstance(keys, (list, tuple, set, frozenset)):
+        return keys
+    return (keys,)
+
+
+class _Stripe(object):
+    """
+    _Stripe holds the sketches of the keys that hash to it, and the lock
+    that guards them.
+    """
+    __slots__ = ('lock', 'calls', 'bytes')
+
+    def __init__(self, capacity):
+        self.lock = threading.Lock()
+        self.calls = SpaceSaving(capacity)
+        self.bytes = SpaceSaving(capacity)
+
+
+def _top(hot_keys, k):
+    return heapq.nlargest(k, hot_keys, key=lambda hot_key: hot_key.value)
+
+
+class HotKeys(object):
+    """
+    HotKeys tracks the top_k keys by calls and by bytes, that is the length
+    of the key, of the values sent and of the reply, split evenly among the
+    keys of a command. Each ranking is kept by SpaceSaving sketches of
+    capacity keys in all, so memory stays constant however large the
+    keyspace. The keys are spread over stripes sketches by hash, each guarded
+    by a lock of its own, so that concurrent calls seldom wait on each other.
+
+    Keys are truncated to max_key_bytes, or given hash_keys, replaced by a
+    hex digest of that many bytes at most.
+
+    Every interval seconds, the top keys of the interval are snapshot, the
+    sketches start over and the snapshot is recorded as the
+    redispy/hot_key_calls and redispy/hot_key_bytes metrics, by key and rank.
+    """
+
+    def __init__(self, top_k=10, capacity=1000, interval=60.0, max_key_bytes=64, hash_keys=False, stripes=8):
+        if top_k > capacity:
+            raise ValueError('top_k must not exceed capacity')
+        self.top_k = top_k
+        self.capacity = capacity
+        self.interval = interval
+        self.max_key_bytes = max_key_bytes
+        self.hash_keys = hash_keys
+        self._stripe_capacity = max(-(-capacity // stripes), 1)
+        self._stripes = [_Stripe(self._stripe_capacity) for _ in range(stripes)]
+        # Guards the start of the interval and the snapshot, and is only
+        # taken by calls as the interval rotates.
+        self._lock = threading.Lock()
+        self._start = observability._now()
+        self._snapshot = None
+
+    def _normalize(self, key):
+        key = key_bytes(key)
+        if self.hash_keys:
+            return hashlib.blake2b(key, digest_size=max(min(self.max_key_bytes // 2, 64), 1)).hexdigest().encode()
+        return key[:self.max_key_bytes]
+
+    def record(self, keys, value=None, result=None):
+        """
+        record counts a call on keys, which sent value and got result back.
+        """
+        keys = _each_key(keys)
+        if not keys:
+            return
+        payload = 0
+        if value is not None:
+            payload += observability.summarize_lengths(value).total
+        if result is not None and not isinstance(result, BaseException):
+            payload += observability.summarize_lengths(result).total
+        share = payload // len(keys)
+
+        stripes = self._stripes
+        for key in keys:
+            normalized = self._normalize(key)
+            stripe = stripes[hash(normalized) % len(stripes)]
+            with stripe.lock:
+                stripe.calls.add(normalized, 1)
+                stripe.bytes.add(normalized, len(normalized) + share)
+
+        if self.interval is not None and observability._now() - self._start >= self.interval:
+            snapshot = None
+            with self._lock:
+                if observability._now() - self._start >= self.interval:
+                    snapshot = self._rotate()
+            if snapshot is not None:
+                _record_snapshot(snapshot)
+
+    def _tops(self, reset=False):
+        calls, by_bytes = [], []
+        for stripe in self._stripes:
+            with stripe.lock:
+                calls.extend(stripe.calls.top(self.top_k))
+                by_bytes.extend(stripe.bytes.top(self.top_k))
+                if reset:
+                    stripe.calls = SpaceSaving(self._stripe_capacity)
+                    stripe.bytes = SpaceSaving(self._stripe_capacity)
+        # Each key is kept by the sketches of a single stripe.
+        return _top(calls, self.top_k), _top(by_bytes, self.top_k)
+
+    def _rotate(self):
+        # Called with _lock held.
+        now = observability._now()
+        snapshot = HotKeysSnapshot(self._start, now, *self._tops(reset=True))
+        self._start = now
+        self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self, current=False):
+        """
+        snapshot returns the HotKeysSnapshot of the last complete interval,
+        or that of the interval so far given current or if there is none yet.
+        """
+        rotated = None
+        with self._lock:
+            if self.interval is not None and observability._now() - self._start >= self.interval:
+                rotated = self._rotate()
+            if current or self._snapshot is None:
+                snapshot = HotKeysSnapshot(self._start, observability._now(), *self._tops())
+            else:
+                snapshot = self._snapshot
+        if rotated is not None:
+            _record_snapshot(rotated)
+        return snapshot
+
+
+def _record_snapshot(snapshot):
+    # Only the keys of the latest snapshot are kept, so that keys that cooled
+    # down don't linger on with their last value.
+    for each_measure, hot_keys in ((observability.m_hot_key_calls, snapshot.by_calls),
+            (observability.m_hot_key_bytes, snapshot.by_bytes)):
+        observability._replace_measurements(each_measure, [(hot_key.value,
+                ((observability.key_key, tag_value(hot_key.key)), (observability.key_rank, str(rank))))
+                for rank, hot_key in enumerate(hot_keys, 1)])
+
+
+def enable_hot_keys(top_k=10, capacity=1000, interval=60.0, max_key_bytes=64, hash_keys=False, stripes=8):
+    """
+    enable_hot_keys starts tracking the hottest keys of the calls recorded by
+    ocredis, see HotKeys, and returns the tracker.
+    """
+    tracker = HotKeys(top_k, capacity, interval, max_key_bytes, hash_keys, stripes)
+    observability._hot_keys = tracker
+    return tracker
+
+
+def disable_hot_keys():
+    observability._hot_keys = None
+
+
+def hot_keys(current=False):
+    """
+    hot_keys returns the HotKeysSnapshot of the last complete interval, see
+    HotKeys.snapshot, or None if hot keys aren't tracked.
+    """
+    tracker = observability._hot_keys
+    if tracker is None:
+        return None
+    return tracker.snapshot(current)
@@ -0,0 +1,213 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+import uuid
+
+from redis.lock import Lock
+
+try:
+    from ocredis import observability
+    from ocredis.scripts import ScriptRegistry
+    from ocredis.tags import OTHER, key_bytes, tag_value
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.scripts import ScriptRegistry
+    from .ocredis.tags import OTHER, key_bytes, tag_value
+except Exception as e:
+    raise e
+
+# The strategies of OcLock to wait for a lock held by another client.
+POLL = 'poll'
+BACKOFF = 'backoff'
+PUBSUB = 'pubsub'
+
+_WAKEUPS = (POLL, BACKOFF, PUBSUB)
+
+# The channel that releases are published to when waiting by pub/sub.
+RELEASE_CHANNEL_PREFIX = '__ocredis__:lock:'
+
+# The number of lock name prefixes used as tag values, beyond which locks are
+# tagged _other, as are locks whose name has no ':' and would be tagged by it
+# in full.
+MAX_PREFIXES = 100
+
+_prefixes = set()
+_prefixes_lock = threading.Lock()
+
+
+def _prefix_tag_value(name):
+    parts = key_bytes(name).split(b':', 1)
+    if len(parts) < 2:
+        return OTHER
+    prefix = tag_value(parts[0])
+    if prefix not in _prefixes:
+        with _prefixes_lock:
+            if prefix not in _prefixes:
+                if len(_prefixes) >= MAX_PREFIXES:
+                    return OTHER
+                _prefixes.add(prefix)
+    return prefix
+
+
+class OcLock(Lock):
+    """
+    OcLock is the instrumented counterpart of redis.lock.Lock. It records,
+    tagged by the prefix of the lock name up to its first ':', the time spent
+    acquiring the lock and the attempts it took, acquisitions that failed,
+    how long the lock was held and the latency of releases, extensions and
+    reacquisitions. Only the first MAX_PREFIXES prefixes are used as tag
+    values, the others and the names without a ':' are tagged _other.
+
+    wakeup decides how acquire waits for a lock held by another client:
+    a) 'poll' tries again every sleep seconds, as redis.lock.Lock does
+    b) 'backoff' waits twice as long after each attempt, from sleep up to
+       max_sleep, with jitter so that waiters don't retry in lockstep
+    c) 'pubsub' subscribes to the release channel of the lock, to which the
+       OcLocks waking up by pub/sub publish on release, and tries again once
+       a release is published or after max_sleep at the latest, in case the
+       lock expired or was released by another kind of client
+    """
+
+    lua_release = None
+    lua_extend = None
+    lua_reacquire = None
+
+    def __init__(self, redis, name, timeout=None, sleep=0.1, blocking=True, blocking_timeout=None,
+            thread_local=True, wakeup=POLL, max_sleep=1.0):
+        if wakeup not in _WAKEUPS:
+            raise ValueError('wakeup must be one of %s' % ', '.join(_WAKEUPS))
+        super(OcLock, self).__init__(redis, name, timeout, sleep, blocking, blocking_timeout, thread_local)
+        self.wakeup = wakeup
+        self.max_sleep = max(max_sleep, sleep)
+        self.local.acquired_at = None
+        self._tags = ((observability.key_prefix, _prefix_tag_value(name)),)
+
+    def register_scripts(self):
+        registry = getattr(self.redis, 'scripts', None)
+        if not isinstance(registry, ScriptRegistry):
+            return super(OcLock, self).register_scripts()
+        # The scripts are kept per lock rather than per class, since OcScripts
+        # belong to the registry of the client that registered them.
+        cls = self.__class__
+        self.lua_release = registry.register(cls.LUA_RELEASE_SCRIPT, 'lock_release')
+        self.lua_extend = registry.register(cls.LUA_EXTEND_SCRIPT, 'lock_extend')
+        self.lua_reacquire = registry.register(cls.LUA_REACQUIRE_SCRIPT, 'lock_reacquire')
+
+    @property
+    def release_channel(self):
+        name = self.name.decode('utf-8', 'replace') if isinstance(self.name, bytes) else str(self.name)
+        return RELEASE_CHANNEL_PREFIX + name
+
+    def _delay(self, sleep, attempts):
+        if self.wakeup == BACKOFF:
+            delay = min(self.max_sleep, sleep * 2 ** (attempts - 1))
+            return random.uniform(delay / 2, delay)
+        if self.wakeup == PUBSUB:
+            return self.max_sleep
+        return sleep
+
+    def acquire(self, sleep=None, blocking=None, blocking_timeout=None, token=None):
+        if sleep is None:
+            sleep = self.sleep
+        if token is None:
+            token = uuid.uuid1().hex.encode()
+        else:
+            token = self.redis.get_encoder().encode(token)
+        if blocking is None:
+            blocking = self.blocking
+        if blocking_timeout is None:
+            blocking_timeout = self.blocking_timeout
+        stop_trying_at = None
+        if blocking_timeout is not None:
+            stop_trying_at = time.monotonic() + blocking_timeout
+
+        start_time = observability._now()
+        attempts = 0
+        status = 'ERROR'
+        subscription = None
+        try:
+            while True:
+                attempts += 1
+                if self.do_acquire(token):
+                    self.local.token = token
+                    self.local.acquired_at = observability._now()
+                    status = 'OK'
+                    return True
+                if not blocking:
+                    status = 'FAILED'
+                    return False
+
+                if self.wakeup == PUBSUB and subscription is None:
+                    # Subscribing before trying again means that no release
+                    # published after that attempt can be missed. The
+                    # confirmation is read first, lest it end the first wait.
+                    subscription = self.redis.pubsub()
+                    subscription.subscribe(self.release_channel)
+                    subscription.get_message(timeout=self.max_sleep)
+                    continue
+
+                delay = self._delay(sleep, attempts)
+                if stop_trying_at is not None:
+                    remaining = stop_trying_at - time.monotonic()
+                    if remaining <= 0 or (self.wakeup != PUBSUB and delay > remaining):
+                        status = 'FAILED'
+                        return False
+                    delay = min(delay, remaining)
+                if subscription is not None:
+                    subscription.get_message(timeout=delay)
+                else:
+                    time.sleep(delay)
+        finally:
+            if subscription is not None:
+                subscription.close()
+            observability._record_measurement(observability.m_lock_acquire_ms,
+                    (observability._now() - start_time) * 1e3, None, status, None, self._tags)
+            observability._record_measurement(observability.m_lock_acquire_attempts, attempts,
+                    None, None, None, self._tags)
+
+    def _timed(self, method_name, fn, *args):
+        start_time = observability._now()
+        status = 'ERROR'
+        try:
+            result = fn(*args)
+            status = 'OK'
+            return result
+        finally:
+            observability._record_measurement(observability.m_lock_latency_ms,
+                    (observability._now() - start_time) * 1e3, method_name, status, None, self._tags)
+
+    def release(self):
+        acquired_at = getattr(self.local, 'acquired_at', None)
+        self.local.acquired_at = None
+        status = 'ERROR'
+        try:
+            self._timed('redispy.Lock.release', super(OcLock, self).release)
+            status = 'OK'
+        finally:
+            # A lock that expired before its release was held for longer than
+            # its timeout, which shows up as an ERROR.
+            if acquired_at is not None:
+                observability._record_measurement(observability.m_lock_hold_ms,
+                        (observability._now() - acquired_at) * 1e3, None, status, None, self._tags)
+        if self.wakeup == PUBSUB:
+            self.redis.publish(self.release_channel, b'released')
+
+    def extend(self, additional_time, replace_ttl=False):
+        return self._timed('redispy.Lock.extend', super(OcLock, self).extend, additional_time, replace_ttl)
+
+    def reacquire(self):
+        return self._timed('redispy.Lock.reacquire', super(OcLock, self).reacquire)
@@ -12,52 +12,187 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import atexit
+import bisect
+import collections
+import itertools
+import random
+import threading
 import time
 
+from opencensus.common.runtime_context import RuntimeContext
 from opencensus.trace import execution_context
+from opencensus.trace import span as trace_span
 from opencensus.trace.status import Status
+from opencensus.trace.tracers import base as tracers_base
 from opencensus.trace.tracer import noop_tracer
 
 from opencensus.stats import stats
 from opencensus.stats import aggregation
+from opencensus.stats import aggregation_data
 from opencensus.stats import measure
 from opencensus.stats import view
 from opencensus.tags import tag_key
-from opencensus.tags import tag_map
-from opencensus.tags import tag_value
 
+try:
+    from ocredis.commands import call_info, command_info, command_keys, command_values
+    from ocredis.errors import classify_error
+    from ocredis.spanpolicy import PIPELINE
+except ImportError:
+    from .ocredis.commands import call_info, command_info, command_keys, command_values
+    from .ocredis.errors import classify_error
+    from .ocredis.spanpolicy import PIPELINE
+except Exception as e:
+    raise e
+
+key_channel = tag_key.TagKey("channel")
 key_error = tag_key.TagKey("error")
+key_key = tag_key.TagKey("key")
 key_method = tag_key.TagKey("method")
+key_node = tag_key.TagKey("node")
+key_prefix = tag_key.TagKey("prefix")
+key_rank = tag_key.TagKey("rank")
+key_reason = tag_key.TagKey("reason")
+key_group = tag_key.TagKey("group")
+key_script = tag_key.TagKey("script")
 key_status = tag_key.TagKey("status")
+key_stream = tag_key.TagKey("stream")
 
 m_latency_ms = measure.MeasureFloat("redispy/latency", "The latency per call in milliseconds", "ms")
 m_key_length = measure.MeasureInt("redispy/key_length", "The length of each key", "By")
 m_value_length = measure.MeasureInt("redispy/value_length", "The length of each value", "By")
+m_request_bytes = measure.MeasureInt("redispy/request_bytes", "The bytes sent per command", "By")
+m_response_bytes = measure.MeasureInt("redispy/response_bytes", "The bytes received per reply", "By")
+m_scan_page_elements = measure.MeasureInt("redispy/scan_page_elements",
+        "The number of elements per page of a SCAN iteration", "1")
+m_scan_pages = measure.MeasureInt("redispy/scan_pages", "The number of pages per SCAN iteration", "1")
+m_scan_latency_ms = measure.MeasureFloat("redispy/scan_latency",
+        "The elapsed time per SCAN iteration in milliseconds", "ms")
+m_pubsub_message_size = measure.MeasureInt("redispy/pubsub_message_size",
+        "The size of each Pub/Sub message received", "By")
+m_pubsub_receive_ms = measure.MeasureFloat("redispy/pubsub_receive_latency",
+        "The time spent receiving Pub/Sub messages in get_message or listen, in milliseconds", "ms")
+m_pubsub_handler_ms = measure.MeasureFloat("redispy/pubsub_handler_latency",
+        "The execution time of Pub/Sub message handlers in milliseconds", "ms")
+m_pubsub_backlog = measure.MeasureInt("redispy/pubsub_backlog",
+        "The bytes received on a Pub/Sub connection that weren't read yet", "By")
+m_pool_checkout_ms = measure.MeasureFloat("redispy/pool_checkout_latency",
+        "The time spent waiting for a connection from the pool in milliseconds", "ms")
+m_pool_connection_creation_ms = measure.MeasureFloat("redispy/pool_connection_creation_latency",
+        "The time spent creating and connecting new connections in milliseconds", "ms")
+m_pool_connections_in_use = measure.MeasureInt("redispy/pool_connections_in_use",
+        "The number of connections checked out of the pool", "1")
+m_pool_connections_idle = measure.MeasureInt("redispy/pool_connections_idle",
+        "The number of connections idle in the pool", "1")
+m_pool_disconnects = measure.MeasureInt("redispy/pool_disconnects",
+        "The number of connections of the pool that were disconnected", "1")
+m_cache_hits = measure.MeasureInt("redispy/cache_hits", "The number of reads served by the read cache", "1")
+m_cache_misses = measure.MeasureInt("redispy/cache_misses", "The number of reads that missed the read cache", "1")
+m_cache_evictions = measure.MeasureInt("redispy/cache_evictions",
+        "The number of entries evicted from the read cache", "1")
+m_cache_invalidations = measure.MeasureInt("redispy/cache_invalidations",
+        "The number of entries of the read cache that were invalidated", "1")
+m_cache_bytes = measure.MeasureInt("redispy/cache_bytes", "The size of the entries of the read cache", "By")
+m_coalesce_batch_size = measure.MeasureInt("redispy/coalesce_batch_size",
+        "The number of distinct reads sent per coalesced batch", "1")
+m_coalesce_wait_ms = measure.MeasureFloat("redispy/coalesce_wait",
+        "The time that coalesced reads waited for their batch to be sent, in milliseconds", "ms")
+m_hot_key_calls = measure.MeasureInt("redispy/hot_key_calls",
+        "The estimated number of calls on each of the hottest keys per interval", "1")
+m_hot_key_bytes = measure.MeasureInt("redispy/hot_key_bytes",
+        "The estimated bytes sent and received for each of the hottest keys per interval", "By")
+m_big_value_size = measure.MeasureInt("redispy/big_value_size",
+        "The size of each value or reply over the big value threshold", "By")
+m_script_latency_ms = measure.MeasureFloat("redispy/script_latency",
+        "The latency per script call in milliseconds, including any reload", "ms")
+m_script_bytes_saved = measure.MeasureInt("redispy/script_bytes_saved",
+        "The bytes of script source that EVALSHA saved sending", "By")
+m_script_reloads = measure.MeasureInt("redispy/script_reloads",
+        "The number of scripts loaded again after a NOSCRIPT error", "1")
+m_lock_acquire_ms = measure.MeasureFloat("redispy/lock_acquire_latency",
+        "The time spent acquiring a lock in milliseconds, whether it was acquired or not", "ms")
+m_lock_acquire_attempts = measure.MeasureInt("redispy/lock_acquire_attempts",
+        "The number of attempts per lock acquisition", "1")
+m_lock_hold_ms = measure.MeasureFloat("redispy/lock_hold_time",
+        "The time that a lock was held for in milliseconds, from its acquisition to its release", "ms")
+m_lock_latency_ms = measure.MeasureFloat("redispy/lock_latency",
+        "The latency of lock releases, extensions and reacquisitions in milliseconds", "ms")
+m_stream_batch_size = measure.MeasureInt("redispy/stream_batch_size",
+        "The number of entries that XREADGROUP returned per stream", "1")
+m_stream_end_to_end_ms = measure.MeasureFloat("redispy/stream_end_to_end_latency",
+        "The time from the ID of a stream entry to its delivery by XREADGROUP in milliseconds", "ms")
+m_stream_ack_ms = measure.MeasureFloat("redispy/stream_ack_latency",
+        "The time from the delivery of a stream entry to its XACK in milliseconds", "ms")
+m_stream_pending = measure.MeasureInt("redispy/stream_pending",
+        "The number of pending entries of a consumer group as per XPENDING", "1")
+m_blocked_ms = measure.MeasureFloat("redispy/blocked_time",
+        "The time that a blocking command waited for its reply in milliseconds", "ms")
+m_cluster_node_latency_ms = measure.MeasureFloat("redispy/cluster_node_latency",
+        "The latency per command sent to a cluster node in milliseconds, including any redirection", "ms")
+m_cluster_redirections = measure.MeasureInt("redispy/cluster_redirections",
+        "The number of MOVED and ASK redirections replied by cluster nodes", "1")
+
+
+def exponential_buckets(start, factor=2.0, count=22, sub_buckets=1):
+    """
+    exponential_buckets returns the bounds of count ranges from start on,
+    each factor times wider than the previous one and split into sub_buckets
+    equal buckets, as per HDR histograms, so that the relative error of any
+    percentile stays under (factor - 1) / sub_buckets whatever its magnitude.
+    """
+    if start <= 0 or factor <= 1 or count < 1 or sub_buckets < 1:
+        raise ValueError('start must be positive, factor above 1 and count and sub_buckets at least 1')
+    bounds = []
+    for i in range(count):
+        lower = start * factor ** i
+        step = (lower * factor - lower) / sub_buckets
+        bounds.extend(round(lower + step * j, 6) for j in range(sub_buckets))
+    bounds.append(round(start * factor ** count, 6))
+    return bounds
+
+
+# The default latency buckets, from 10us up to about 42s, with four buckets
+# per doubling: 10us, 12.5us, 15us, 17.5us, 20us, 25us, ... since most calls
+# to a nearby Redis complete within a millisecond.
+DEFAULT_LATENCY_BUCKETS = exponential_buckets(0.01, 2, 22, sub_buckets=4)
 
+# The latency buckets of earlier versions, from 5ms up to 100s.
+COARSE_LATENCY_BUCKETS = [
+    # Latency in buckets:
+    # [
+    #    >=0ms, >=5ms, >=10ms, >=25ms, >=40ms, >=50ms, >=75ms, >=100ms, >=200ms, >=400ms,
+    #    >=600ms, >=800ms, >=1s, >=2s, >=4s, >=6s, >=10s, >=20s, >=50s, >=100s
+    # ]
+        0, 5, 10, 25, 40, 50, 75, 1e2, 2e2, 4e2,
+        6e2, 8e2, 1e3, 2e3, 4e3, 6e3, 1e4, 2e4, 5e4, 1e5
+]
 
-def register_views():
+
+def register_views(size_views_by_status=True, latency_buckets=None):
+    """
+    register_views registers the redispy/* views. Unless size_views_by_status,
+    the redispy/key_lengths and redispy/value_lengths views are only tagged by
+    method, leaving out error and status.
+
+    latency_buckets are the bounds in milliseconds of the redispy/latency,
+    redispy/script_latency, redispy/lock_latency and redispy/cluster_node_latency
+    views, DEFAULT_LATENCY_BUCKETS unless given, see exponential_buckets.
+    """
     all_tag_keys = [key_method, key_error, key_status]
+    size_tag_keys = all_tag_keys if size_views_by_status else [key_method]
     calls_view = view.View("redispy/calls", "The number of calls",
             all_tag_keys,
             m_latency_ms,
             aggregation.CountAggregation())
 
-    latency_view = view.View("redispy/latency", "The distribution of the latencies per method", 
+    latency_view = view.View("redispy/latency", "The distribution of the latencies per method",
             all_tag_keys,
             m_latency_ms,
-            aggregation.DistributionAggregation([
-            # Latency in buckets:
-            # [
-            #    >=0ms, >=5ms, >=10ms, >=25ms, >=40ms, >=50ms, >=75ms, >=100ms, >=200ms, >=400ms,
-            #    >=600ms, >=800ms, >=1s, >=2s, >=4s, >=6s, >=10s, >-20s, >=50s, >=100s
-            # ]
-                0, 5, 10, 25, 40, 50, 75, 1e2, 2e2, 4e2,
-                6e2, 8e2, 1e3, 2e3, 4e3, 6e3, 1e4, 2e4, 5e4, 10e5
-            ])
-    )
-  
+            aggregation.DistributionAggregation(list(latency_buckets or DEFAULT_LATENCY_BUCKETS)))
+
     key_lengths_view = view.View("redispy/key_lengths", "The distribution of the key lengths",
-            all_tag_keys,
+            size_tag_keys,
             m_key_length,
             aggregation.DistributionAggregation([
             # Key length buckets:
@@ -69,7 +204,7 @@ def register_views():
     )
 
     value_lengths_view = view.View("redispy/value_lengths", "The distribution of the value lengths",
-            all_tag_keys,
+            size_tag_keys,
             m_value_length,
             aggregation.DistributionAggregation([
             # Value length buckets:
@@ -79,8 +214,354 @@ def register_views():
                 0, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000
             ])
     )
+
+    wire_bytes_buckets = [
+        # Size buckets:
+        # [
+        #   0B, 16B, 32B, 64B, 128B, 256B, 512B, 1kB, 4kB, 16kB, 64kB, 256kB, 1MB, 4MB, 16MB
+        # ]
+            0, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216
+    ]
+
+    request_bytes_view = view.View("redispy/request_bytes", "The distribution of the bytes sent per command",
+            [key_method],
+            m_request_bytes,
+            aggregation.DistributionAggregation(wire_bytes_buckets))
+
+    response_bytes_view = view.View("redispy/response_bytes", "The distribution of the bytes received per reply",
+            [key_method],
+            m_response_bytes,
+            aggregation.DistributionAggregation(wire_bytes_buckets))
+
+    scan_page_elements_view = view.View("redispy/scan_page_elements",
+            "The distribution of the number of elements per page of SCAN iterations",
+            all_tag_keys,
+            m_scan_page_elements,
+            aggregation.DistributionAggregation([
+                0, 1, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000
+            ])
+    )
+
+    scan_pages_view = view.View("redispy/scan_pages", "The distribution of the number of pages per SCAN iteration",
+            all_tag_keys,
+            m_scan_pages,
+            aggregation.DistributionAggregation([
+                0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 1e5
+            ])
+    )
+
+    scan_latency_view = view.View("redispy/scan_latency",
+            "The distribution of the elapsed time of SCAN iterations, from the first page to the last",
+            all_tag_keys,
+            m_scan_latency_ms,
+            aggregation.DistributionAggregation([
+            # Latency in buckets:
+            # [
+            #    >=0ms, >=10ms, >=50ms, >=100ms, >=500ms, >=1s, >=5s, >=10s, >=30s,
+            #    >=1min, >=5min, >=10min, >=30min, >=1h
+            # ]
+                0, 10, 50, 1e2, 5e2, 1e3, 5e3, 1e4, 3e4, 6e4, 3e5, 6e5, 1.8e6, 3.6e6
+            ])
+    )
+
+    pubsub_messages_view = view.View("redispy/pubsub_messages", "The number of Pub/Sub messages received",
+            [key_channel],
+            m_pubsub_message_size,
+            aggregation.CountAggregation())
+
+    pubsub_bytes_view = view.View("redispy/pubsub_bytes", "The bytes of Pub/Sub messages received",
+            [key_channel],
+            m_pubsub_message_size,
+            aggregation.SumAggregation())
+
+    pubsub_receive_latency_view = view.View("redispy/pubsub_receive_latency",
+            "The distribution of the time spent receiving Pub/Sub messages, handlers excluded",
+            [key_method],
+            m_pubsub_receive_ms,
+            aggregation.DistributionAggregation([
+            # Latency in buckets:
+            # [
+            #    >=0ms, >=0.1ms, >=0.5ms, >=1ms, >=5ms, >=10ms, >=50ms, >=100ms, >=500ms, >=1s, >=5s, >=10s
+            # ]
+                0, 0.1, 0.5, 1, 5, 10, 50, 1e2, 5e2, 1e3, 5e3, 1e4
+            ])
+    )
+
+    pubsub_handler_latency_view = view.View("redispy/pubsub_handler_latency",
+            "The distribution of the execution times of Pub/Sub message handlers",
+            [key_channel, key_status],
+            m_pubsub_handler_ms,
+            aggregation.DistributionAggregation([
+                0, 0.1, 0.5, 1, 5, 10, 50, 1e2, 5e2, 1e3, 5e3, 1e4
+            ])
+    )
+
+    pubsub_backlog_view = view.View("redispy/pubsub_backlog",
+            "The distribution of the bytes received on Pub/Sub connections that weren't read yet",
+            [],
+            m_pubsub_backlog,
+            aggregation.DistributionAggregation([
+            # Backlog buckets:
+            # [
+            #   0B, 1kB, 10kB, 100kB, 1MB, 10MB, 100MB
+            # ]
+                0, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8
+            ])
+    )
+
+    pool_latency_buckets = [
+        # Latency in buckets:
+        # [
+        #    >=0ms, >=0.01ms, >=0.05ms, >=0.1ms, >=0.5ms, >=1ms, >=5ms, >=10ms, >=50ms, >=100ms,
+        #    >=500ms, >=1s, >=5s, >=10s
+        # ]
+            0, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 1e2, 5e2, 1e3, 5e3, 1e4
+    ]
+
+    pool_checkout_latency_view = view.View("redispy/pool_checkout_latency",
+            "The distribution of the time spent waiting for a connection from the pool",
+            [key_status],
+            m_pool_checkout_ms,
+            aggregation.DistributionAggregation(pool_latency_buckets))
+
+    pool_connection_creation_latency_view = view.View("redispy/pool_connection_creation_latency",
+            "The distribution of the time spent creating and connecting new connections",
+            [],
+            m_pool_connection_creation_ms,
+            aggregation.DistributionAggregation(pool_latency_buckets))
+
+    pool_connections_in_use_view = view.View("redispy/pool_connections_in_use",
+            "The number of connections checked out of the pool",
+            [],
+            m_pool_connections_in_use,
+            aggregation.LastValueAggregation())
+
+    pool_connections_idle_view = view.View("redispy/pool_connections_idle",
+            "The number of connections idle in the pool",
+            [],
+            m_pool_connections_idle,
+            aggregation.LastValueAggregation())
+
+    pool_disconnects_view = view.View("redispy/pool_disconnects",
+            "The number of connections of the pool that were disconnected",
+            [key_reason],
+            m_pool_disconnects,
+            aggregation.SumAggregation())
+
+    cache_hits_view = view.View("redispy/cache_hits", "The number of reads served by the read cache",
+            [key_method],
+            m_cache_hits,
+            aggregation.SumAggregation())
+
+    cache_misses_view = view.View("redispy/cache_misses", "The number of reads that missed the read cache",
+            [key_method],
+            m_cache_misses,
+            aggregation.SumAggregation())
+
+    cache_evictions_view = view.View("redispy/cache_evictions",
+            "The number of entries evicted from the read cache",
+            [key_reason],
+            m_cache_evictions,
+            aggregation.SumAggregation())
+
+    cache_invalidations_view = view.View("redispy/cache_invalidations",
+            "The number of entries of the read cache that were invalidated",
+            [key_reason],
+            m_cache_invalidations,
+            aggregation.SumAggregation())
+
+    cache_bytes_view = view.View("redispy/cache_bytes", "The size of the entries of the read cache",
+            [],
+            m_cache_bytes,
+            aggregation.LastValueAggregation())
+
+    coalesce_batch_size_view = view.View("redispy/coalesce_batch_size",
+            "The distribution of the number of distinct reads sent per coalesced batch",
+            [],
+            m_coalesce_batch_size,
+            aggregation.DistributionAggregation([
+            # Batch size buckets:
+            # [
+            #   1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024
+            # ]
+                1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024
+            ])
+    )
+
+    coalesce_wait_view = view.View("redispy/coalesce_wait",
+            "The distribution of the time that coalesced reads waited for their batch to be sent",
+            [key_method],
+            m_coalesce_wait_ms,
+            aggregation.DistributionAggregation([
+            # Wait time buckets:
+            # [
+            #    >=0ms, >=0.01ms, >=0.05ms, >=0.1ms, >=0.2ms, >=0.5ms, >=1ms, >=2ms, >=5ms, >=10ms,
+            #    >=50ms, >=100ms
+            # ]
+                0, 0.01, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 50, 1e2
+            ])
+    )
+
+    hot_key_calls_view = view.View("redispy/hot_key_calls",
+            "The estimated number of calls on each of the hottest keys per interval",
+            [key_rank, key_key],
+            m_hot_key_calls,
+            aggregation.LastValueAggregation())
+
+    hot_key_bytes_view = view.View("redispy/hot_key_bytes",
+            "The estimated bytes sent and received for each of the hottest keys per interval",
+            [key_rank, key_key],
+            m_hot_key_bytes,
+            aggregation.LastValueAggregation())
+
+    big_values_view = view.View("redispy/big_values",
+            "The number of values and replies over the big value threshold per key prefix",
+            [key_method, key_prefix],
+            m_big_value_size,
+            aggregation.CountAggregation())
+
+    big_value_sizes_view = view.View("redispy/big_value_sizes",
+            "The distribution of the sizes of the values and replies over the big value threshold",
+            [key_method],
+            m_big_value_size,
+            aggregation.DistributionAggregation([
+            # Big value size buckets:
+            # [
+            #   0B, 16kB, 64kB, 256kB, 1MB, 4MB, 16MB, 64MB, 256MB, 512MB
+            # ]
+                0, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26, 1 << 28, 1 << 29
+            ])
+    )
+
+    script_latency_view = view.View("redispy/script_latency",
+            "The distribution of the latencies per script",
+            [key_script, key_status],
+            m_script_latency_ms,
+            aggregation.DistributionAggregation(list(latency_buckets or DEFAULT_LATENCY_BUCKETS)))
+
+    script_bytes_saved_view = view.View("redispy/script_bytes_saved",
+            "The bytes of script source that EVALSHA saved sending per script",
+            [key_script],
+            m_script_bytes_saved,
+            aggregation.SumAggregation())
+
+    script_reloads_view = view.View("redispy/script_reloads",
+            "The number of scripts loaded again after a NOSCRIPT error",
+            [key_script],
+            m_script_reloads,
+            aggregation.CountAggregation())
+
+    lock_acquire_latency_view = view.View("redispy/lock_acquire_latency",
+            "The distribution of the time spent acquiring locks per lock name prefix",
+            [key_prefix, key_status],
+            m_lock_acquire_ms,
+            aggregation.DistributionAggregation(list(DEFAULT_LATENCY_BUCKETS)))
+
+    lock_acquisitions_view = view.View("redispy/lock_acquisitions",
+            "The number of lock acquisitions per lock name prefix, by status FAILED if the lock wasn't acquired",
+            [key_prefix, key_status],
+            m_lock_acquire_ms,
+            aggregation.CountAggregation())
+
+    lock_acquire_attempts_view = view.View("redispy/lock_acquire_attempts",
+            "The distribution of the number of attempts per lock acquisition",
+            [key_prefix],
+            m_lock_acquire_attempts,
+            aggregation.DistributionAggregation([
+            # Attempt buckets:
+            # [
+            #   1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024
+            # ]
+                1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024
+            ])
+    )
+
+    lock_hold_time_view = view.View("redispy/lock_hold_time",
+            "The distribution of the time that locks were held for per lock name prefix",
+            [key_prefix, key_status],
+            m_lock_hold_ms,
+            aggregation.DistributionAggregation(list(DEFAULT_LATENCY_BUCKETS)))
+
+    lock_latency_view = view.View("redispy/lock_latency",
+            "The distribution of the latencies of lock releases, extensions and reacquisitions",
+            [key_prefix, key_method, key_status],
+            m_lock_latency_ms,
+            aggregation.DistributionAggregation(list(latency_buckets or DEFAULT_LATENCY_BUCKETS)))
+
+    stream_batch_size_view = view.View("redispy/stream_batch_size",
+            "The distribution of the number of entries per stream per XREADGROUP",
+            [key_stream, key_group],
+            m_stream_batch_size,
+            aggregation.DistributionAggregation([
+            # Entry buckets:
+            # [
+            #   1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096
+            # ]
+                1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096
+            ])
+    )
+
+    stream_entries_view = view.View("redispy/stream_entries",
+            "The number of stream entries delivered by XREADGROUP",
+            [key_stream, key_group],
+            m_stream_batch_size,
+            aggregation.SumAggregation())
+
+    # Consumer lag and processing times range from milliseconds to hours.
+    stream_end_to_end_latency_view = view.View("redispy/stream_end_to_end_latency",
+            "The distribution of the time from the ID of each new stream entry to its delivery",
+            [key_stream, key_group],
+            m_stream_end_to_end_ms,
+            aggregation.DistributionAggregation(exponential_buckets(1, 2, 26, sub_buckets=2)))
+
+    stream_ack_latency_view = view.View("redispy/stream_ack_latency",
+            "The distribution of the time from the delivery of each stream entry to its XACK",
+            [key_stream, key_group],
+            m_stream_ack_ms,
+            aggregation.DistributionAggregation(exponential_buckets(1, 2, 26, sub_buckets=2)))
+
+    stream_pending_view = view.View("redispy/stream_pending",
+            "The last number of pending entries per consumer group",
+            [key_stream, key_group],
+            m_stream_pending,
+            aggregation.LastValueAggregation())
+
+    # Blocking commands wait for up to their timeout, which can be minutes.
+    blocked_time_view = view.View("redispy/blocked_time",
+            "The distribution of the time that blocking commands waited for their reply, by status TIMEOUT if none came",
+            all_tag_keys,
+            m_blocked_ms,
+            aggregation.DistributionAggregation(exponential_buckets(0.1, 2, 24, sub_buckets=2)))
+
+    cluster_node_latency_view = view.View("redispy/cluster_node_latency",
+            "The distribution of the latencies per cluster node and method",
+            [key_node, key_method, key_status],
+            m_cluster_node_latency_ms,
+            aggregation.DistributionAggregation(list(latency_buckets or DEFAULT_LATENCY_BUCKETS)))
+
+    cluster_redirections_view = view.View("redispy/cluster_redirections",
+            "The number of MOVED and ASK redirections per cluster node, by reason moved or ask",
+            [key_node, key_method, key_reason],
+            m_cluster_redirections,
+            aggregation.CountAggregation())
+
     view_manager = stats.stats.view_manager
-    for each_view in [calls_view, latency_view, key_lengths_view, value_lengths_view]:
+    for each_view in [calls_view, latency_view, key_lengths_view, value_lengths_view,
+            request_bytes_view, response_bytes_view,
+            scan_page_elements_view, scan_pages_view, scan_latency_view,
+            pubsub_messages_view, pubsub_bytes_view, pubsub_receive_latency_view,
+            pubsub_handler_latency_view, pubsub_backlog_view,
+            pool_checkout_latency_view, pool_connection_creation_latency_view,
+            pool_connections_in_use_view, pool_connections_idle_view, pool_disconnects_view,
+            cache_hits_view, cache_misses_view, cache_evictions_view, cache_invalidations_view,
+            cache_bytes_view, coalesce_batch_size_view, coalesce_wait_view,
+            hot_key_calls_view, hot_key_bytes_view, big_values_view, big_value_sizes_view,
+            script_latency_view, script_bytes_saved_view, script_reloads_view,
+            lock_acquire_latency_view, lock_acquisitions_view, lock_acquire_attempts_view,
+            lock_hold_time_view, lock_latency_view,
+            stream_batch_size_view, stream_entries_view, stream_end_to_end_latency_view,
+            stream_ack_latency_view, stream_pending_view, blocked_time_view,
+            cluster_node_latency_view, cluster_redirections_view]:
         view_manager.register_view(each_view)
 
 
@@ -135,39 +616,1182 @@ def heuristical_lengths(items):
        return []
 
 
-def trace_and_record_stats_with_key_and_value(method_name, fn, key, value, *args, **kwargs):
-    __TRACER = execution_context.get_opencensus_tracer() or noop_tracer.NoopTracer()
-    __STATS_RECORDER = stats.stats.stats_recorder
+LengthSummary = collections.namedtuple('LengthSummary', ['count', 'total', 'max', 'lengths'])
+
+_EMPTY_SUMMARY = LengthSummary(0, 0, 0, {})
+
+
+def summarize_lengths(items, max_items=1024, max_depth=4):
+    """
+    summarize_lengths summarizes the encoded lengths of the content of items
+    as a LengthSummary of (count, total, max, lengths), where lengths maps
+    each distinct length to the number of times it occurs, so that the
+    lengths can be recorded as few weighted samples whatever the size of
+    items.
+
+    a) bytes and bytearrays count their length, memoryviews their nbytes
+    b) strings count the length of their UTF-8 encoding
+    c) numbers count the length of their repr, which is how redis-py sends
+       them, and booleans count as a single byte
+    d) lists, tuples, sets and dicts (both keys and values) are walked
+       iteratively, up to max_depth levels deep
+    e) other sized objects count their len()
+    f) iterators and other unsized iterables are skipped rather than consumed,
+       so one-shot generators are still intact when redis-py sees them
+
+    At most max_items elements are summarized.
+    """
+
+    count = 0
+    total = 0
+    largest = 0
+    lengths = {}
+    stack = [(items, 0)]
+    while stack and count < max_items:
+        item, depth = stack.pop()
+        if item is None:
+            continue
+
+        if isinstance(item, (bytes, bytearray)):
+            size = len(item)
+
+        elif isinstance(item, str):
+            size = len(item) if item.isascii() else len(item.encode('utf-8', 'replace'))
+
+        elif isinstance(item, memoryview):
+            size = item.nbytes
+
+        elif isinstance(item, bool):
+            size = 1
+
+        elif isinstance(item, (int, float)):
+            size = len(repr(item))
+
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            if depth < max_depth:
+                remaining = max_items - count
+                stack.extend((child, depth + 1) for child in itertools.islice(item, remaining))
+            continue
+
+        elif isinstance(item, dict):
+            if depth < max_depth:
+                remaining = max_items - count
+                for child_key, child_value in itertools.islice(item.items(), remaining):
+                    stack.append((child_key, depth + 1))
+                    stack.append((child_value, depth + 1))
+            continue
+
+        elif hasattr(item, '__len__') and not hasattr(item, '__next__'):
+            size = len(item)
+
+        else:
+            continue
+
+        count += 1
+        total += size
+        if size > largest:
+            largest = size
+        lengths[size] = lengths.get(size, 0) + 1
+
+    if count == 0:
+        return _EMPTY_SUMMARY
+    return LengthSummary(count, total, largest, lengths)
+
+
+def _weighted_summary(summary, weight):
+    """
+    _weighted_summary returns summary as if its lengths had occurred weight
+    times as often.
+    """
+    return summary._replace(count=summary.count * weight, total=summary.total * weight,
+            lengths=dict((length, times * weight) for length, times in summary.lengths.items()))
+
+
+# The monotonic, high resolution clock used to time each call.
+_now = getattr(time, 'perf_counter', time.time)
+
+# The tracer slot is read directly when available since going through
+# RuntimeContext.__getattr__ costs about as much as the rest of the fast path.
+_tracer_slot = getattr(execution_context, '_tracer_slot', None)
+_get_tracer = _tracer_slot.get if _tracer_slot is not None else execution_context.get_opencensus_tracer
+
+# Whether a span created by ocredis is open in the current context, in which
+# case nested calls e.g. the commands that redis-py helpers send on our behalf
+# only record stats instead of creating spans of their own.
+_in_span_slot = RuntimeContext.register_slot('ocredis_in_span', False)
+
+# Whether the span of the current call was skipped as per its SpanPolicy, in
+# which case neither it nor the calls that it makes create any span.
+_skip_spans_slot = RuntimeContext.register_slot('ocredis_skip_spans', False)
+
+# The detached span, see _start_detached_span, of the SCAN iteration whose
+# page is being fetched in the current context, under which connection
+# checkouts get their spans rather than under the current span.
+_detached_span_slot = RuntimeContext.register_slot('ocredis_detached_span', None)
+
+# The _CallRecording of the instrumented call in flight in the current
+# context, which gathers the samples recorded on its behalf.
+_recording_slot = RuntimeContext.register_slot('ocredis_recording', None)
+
+# The time that the reply of the current blocking command took to arrive, as
+# noted by the instrumented connection that read it, see _note_blocked.
+_blocked_ms_slot = RuntimeContext.register_slot('ocredis_blocked_ms', None)
+
+# Tag values are precomputed per (view, method, status, error, extra tags)
+# since errors are tagged by class, see ocredis.errors, rather than by
+# message, see _aggregation_data_for. Extra tags such as hot keys churn, so
+# the cache is cleared once it holds _MAX_CACHED_TAG_VALUES of them.
+_tag_values_cache = {}
+_MAX_CACHED_TAG_VALUES = 4096
+
+# The measures recorded for every call, and all of the measures that
+# _ViewDataCache keeps track of.
+_call_measures = (m_latency_ms, m_key_length, m_value_length)
+_all_measures = _call_measures + (m_request_bytes, m_response_bytes, m_scan_page_elements, m_scan_pages, m_scan_latency_ms,
+        m_pubsub_message_size, m_pubsub_receive_ms, m_pubsub_handler_ms, m_pubsub_backlog,
+        m_pool_checkout_ms, m_pool_connection_creation_ms, m_pool_connections_in_use,
+        m_pool_connections_idle, m_pool_disconnects,
+        m_cache_hits, m_cache_misses, m_cache_evictions, m_cache_invalidations, m_cache_bytes,
+        m_coalesce_batch_size, m_coalesce_wait_ms, m_hot_key_calls, m_hot_key_bytes,
+        m_big_value_size, m_script_latency_ms, m_script_bytes_saved, m_script_reloads,
+        m_lock_acquire_ms, m_lock_acquire_attempts, m_lock_hold_ms, m_lock_latency_ms,
+        m_stream_batch_size, m_stream_end_to_end_ms, m_stream_ack_ms, m_stream_pending, m_blocked_ms,
+        m_cluster_node_latency_ms, m_cluster_redirections)
+
+
+class _ViewDataCache(object):
+    """
+    _ViewDataCache holds the ViewDatas registered against each of the redispy
+    measures. It is rebuilt whenever another view is registered.
+    """
+    __slots__ = ('measure_to_view_map', 'view_count', 'by_measure', 'bounds_by_measure', 'recording')
+
+    def __init__(self):
+        self.measure_to_view_map = None
+        self.view_count = None
+        self.by_measure = {}
+        self.bounds_by_measure = {}
+        self.recording = False
+
+    def refresh(self):
+        # The map itself is held onto rather than its id, which could be
+        # reused by another map once it is garbage collected.
+        mtvm = stats.stats.view_manager.measure_to_view_map
+        view_count = len(mtvm._registered_views)
+        if mtvm is self.measure_to_view_map and view_count == self.view_count:
+            return self
+
+        by_measure = {}
+        bounds_by_measure = {}
+        for each_measure in _all_measures:
+            view_datas = []
+            if mtvm._registered_measures.get(each_measure.name) is each_measure:
+                view_datas = list(mtvm._measure_to_view_data_list_map.get(each_measure.name, ()))
+            by_measure[each_measure.name] = view_datas
+
+            # Pre-aggregated histograms use the bounds of the first distribution view.
+            bounds_by_measure[each_measure.name] = ()
+            for view_data in view_datas:
+                new_data = view_data.view.new_aggregation_data()
+                if isinstance(new_data, aggregation_data.DistributionAggregationData):
+                    bounds_by_measure[each_measure.name] = tuple(new_data.bounds)
+                    break
+
+        self.by_measure = by_measure
+        self.bounds_by_measure = bounds_by_measure
+        self.recording = any(by_measure[each_measure.name] for each_measure in _call_measures)
+        self.measure_to_view_map = mtvm
+        self.view_count = view_count
+        return self
+
+
+_view_data_cache = _ViewDataCache()
+
+
+def _measure_to_view_map():
+    return stats.stats.view_manager.measure_to_view_map
+
+
+def _by_measure():
+    """
+    _by_measure returns the ViewDatas by measure name of the call being
+    recorded in the current context, if any, or else of the refreshed cache.
+    """
+    recording = _recording_slot.get()
+    if recording is not None:
+        return recording.by_measure
+    return _view_data_cache.refresh().by_measure
+
+
+def _view_datas_for(measure):
+    """
+    _view_datas_for returns the ViewDatas registered against measure.
+    """
+    return _by_measure().get(measure.name, ())
+
+
+def _active_tracer():
+    """
+    _active_tracer returns the tracer in the current context or None if that
+    tracer would not produce any spans.
+    """
+    tracer = _get_tracer()
+    if tracer is None or isinstance(getattr(tracer, 'tracer', tracer), noop_tracer.NoopTracer):
+        return None
+    if _skip_spans_slot.get():
+        return None
+    return tracer
+
+
+def _without_spans(fn, *args):
+    """
+    _without_spans invokes fn(*args) with every span skipped, see SpanPolicy.
+    """
+    previous = _skip_spans_slot.get()
+    _skip_spans_slot.set(True)
+    try:
+        return fn(*args)
+    finally:
+        _skip_spans_slot.set(previous)
+
+
+def _span_tracer():
+    """
+    _span_tracer returns the tracer to create a span with, or None if there is
+    no sampling tracer or if a span created by ocredis is already open.
+    """
+    tracer = _active_tracer()
+    if tracer is None or _in_span_slot.get():
+        return None
+    return tracer
+
+
+def _is_recording():
+    """
+    _is_recording reports whether any view is registered against the latency,
+    key length or value length measures, or hot keys or big values are tracked.
+    """
+    return _view_data_cache.refresh().recording or _hot_keys is not None or _big_values is not None
+
+
+def _tag_values_for(view, method_name, status, error, extra_tags=()):
+    """
+    _tag_values_for returns the tuple of tag values for the columns of view,
+    where extra_tags are (TagKey, value) pairs besides the method, status and
+    error.
+    """
+    tags = dict(extra_tags)
+    tags[key_method] = method_name
+    tags[key_status] = status
+    if error is not None:
+        tags[key_error] = error
+    return tuple(tags.get(column) for column in view.columns)
+
+
+# The tag value of every column of the series that the tag values beyond the
+# cardinality limit of a view are recorded into.
+OVERFLOW_TAG_VALUE = '_other'
+
+# The maximum number of series per view, see set_cardinality_limit.
+_max_series = None
+_max_series_per_view = {}
+
+
+def set_cardinality_limit(max_series=None, per_view=None):
+    """
+    set_cardinality_limit caps the number of series, that is of distinct tag
+    values, of each redispy/* view to max_series, and optionally of the views
+    named in per_view to limits of their own. Once a view is at its limit,
+    new tag values are recorded into an overflow series whose tag values are
+    all _other, so memory stays bounded however many tag values come up.
+    Calling set_cardinality_limit() with no arguments lifts the limits.
+    """
+    global _max_series, _max_series_per_view
+    limits = [max_series] + list((per_view or {}).values())
+    if any(limit is not None and limit < 1 for limit in limits):
+        raise ValueError('cardinality limits must be positive')
+    _max_series = max_series
+    _max_series_per_view = dict(per_view or {})
+
 
-    start_time = time.time()
-    tags = tag_map.TagMap()
-    tags.insert(key_method, tag_value.TagValue(method_name))
-    mm = __STATS_RECORDER.new_measurement_map()
+def _aggregation_data_for(view_data, method_name, status, error, extra_tags=()):
+    # Tag values are cached once they have a series of their own, as those
+    # beyond the cardinality limit of the view would otherwise pile up. Views
+    # are keyed by identity since one registered again under the same name
+    # may have other columns.
+    view = view_data.view
+    aggregation_map = view_data.tag_value_aggregation_data_map
+    cache_key = (view, method_name, status, error, extra_tags)
+    tag_values = _tag_values_cache.get(cache_key)
+    cached = tag_values is not None
+    if not cached:
+        tag_values = _tag_values_for(view, method_name, status, error, extra_tags)
+    data = aggregation_map.get(tag_values)
+    if data is None:
+        limit = _max_series_per_view.get(view.name, _max_series)
+        if limit is not None and len(aggregation_map) >= limit:
+            tag_values = (OVERFLOW_TAG_VALUE,) * len(view.columns)
+            data = aggregation_map.get(tag_values)
+            if data is None:
+                data = aggregation_map[tag_values] = view.new_aggregation_data()
+            return data
+        data = aggregation_map[tag_values] = view.new_aggregation_data()
 
-    with __TRACER.span(name=method_name) as span:
+    if not cached:
+        if len(_tag_values_cache) >= _MAX_CACHED_TAG_VALUES:
+            _tag_values_cache.clear()
+        _tag_values_cache[cache_key] = tag_values
+    return data
+
+
+def _add_weighted_sample(data, value, weight):
+    """
+    _add_weighted_sample adds value to data as if it had been sampled weight times.
+    Distributions are bucketed by bisection rather than by add_sample, which
+    scans their bounds one by one.
+    """
+    if isinstance(data, aggregation_data.DistributionAggregationData):
+        count = data.count_data + weight
+        delta = value - data.mean_data
+        data._mean_data += delta * weight / count
+        data._sum_of_sqd_deviations += delta * (value - data._mean_data) * weight
+        data._count_data = count
+        data.counts_per_bucket[bisect.bisect_right(data.bounds, value)] += weight
+
+    elif isinstance(data, aggregation_data.CountAggregationData):
+        data._count_data += weight
+
+    elif isinstance(data, aggregation_data.SumAggregationData):
+        data._sum_data += value * weight
+
+    elif isinstance(data, aggregation_data.LastValueAggregationData):
+        data._value = value
+
+    else:
+        data.add_sample(value, None, None)
+
+
+def _record_into_views(view_datas, value, method_name, status, error, weight=1, extra_tags=()):
+    for view_data in view_datas:
+        _add_weighted_sample(_aggregation_data_for(view_data, method_name, status, error, extra_tags),
+                value, weight)
+
+
+def _record_lengths(view_datas, summary, method_name, status, error):
+    """
+    _record_lengths records each distinct length of the LengthSummary as a
+    sample weighted by the number of times it occurs.
+    """
+    lengths = summary.lengths.items()
+    for view_data in view_datas:
+        data = _aggregation_data_for(view_data, method_name, status, error)
+        for length, times in lengths:
+            _add_weighted_sample(data, length, times)
+
+
+def _record_measurement(each_measure, value, method_name, status, error, extra_tags=()):
+    """
+    _record_measurement records a single value of each_measure, for the
+    measures that aren't recorded on every call and so aren't pre-aggregated.
+    Within an instrumented call the value is gathered by its _CallRecording,
+    and otherwise it is recorded directly.
+    """
+    recording = _recording_slot.get()
+    if recording is not None:
+        view_datas = recording.by_measure.get(each_measure.name)
+        if view_datas:
+            recording.samples.append((view_datas, value, method_name, status, error, extra_tags))
+        return
+
+    view_datas = _view_data_cache.refresh().by_measure.get(each_measure.name)
+    if not view_datas:
+        return
+
+    _record_into_views(view_datas, value, method_name, status, error, extra_tags=extra_tags)
+    mtvm = _measure_to_view_map()
+    if mtvm.exporters:
+        mtvm.export(view_datas)
+
+
+def _replace_measurements(each_measure, samples):
+    """
+    _replace_measurements replaces the values recorded so far of each_measure
+    with samples, as (value, extra_tags) pairs, for the measures that hold
+    the latest of a series of snapshots, so that the series of the earlier
+    snapshots don't linger on with their last values.
+    """
+    view_datas = _view_datas_for(each_measure)
+    if not view_datas:
+        return
+
+    for view_data in view_datas:
+        view_data.tag_value_aggregation_data_map.clear()
+    for value, extra_tags in samples:
+        _record_into_views(view_datas, value, None, None, None, extra_tags=extra_tags)
+    mtvm = _measure_to_view_map()
+    if mtvm.exporters:
+        mtvm.export(view_datas)
+
+
+class _CallRecording(object):
+    """
+    _CallRecording gathers the samples recorded while an instrumented call is
+    in flight, such as those of the checkout of its connection, so that they
+    are written into the views along with the call and exported once. The
+    bytes of the first command sent and reply read are kept as is, see
+    _record_wire_bytes.
+    """
+    __slots__ = ('by_measure', 'samples', 'request', 'response')
+
+    def __init__(self, by_measure):
+        self.by_measure = by_measure
+        self.samples = []
+        self.request = None
+        self.response = None
+
+
+def _record_wire_bytes(each_measure, value, method_name):
+    """
+    _record_wire_bytes records the bytes of a command sent or of a reply read,
+    against m_request_bytes or m_response_bytes. Within an instrumented call
+    the first of each is kept by its _CallRecording, and only those of any
+    further commands and replies, such as those of pipelines, are gathered
+    as samples.
+    """
+    recording = _recording_slot.get()
+    if recording is not None:
+        if each_measure is m_request_bytes:
+            if recording.request is None:
+                recording.request = (value, method_name)
+                return
+        elif recording.response is None:
+            recording.response = (value, method_name)
+            return
+    _record_measurement(each_measure, value, method_name, None, None)
+
+
+def _begin_recording(refresh):
+    """
+    _begin_recording makes a new _CallRecording the recording of the current
+    context, and returns the recording that it replaces, if any. The
+    view data cache is refreshed once per call: by _is_recording for calls
+    without a span, and here given refresh for the others.
+    """
+    cache = _view_data_cache.refresh() if refresh else _view_data_cache
+    previous = _recording_slot.get()
+    _recording_slot.set(_CallRecording(cache.by_measure))
+    return previous
+
+
+def _export_recording(recording, view_datas):
+    """
+    _export_recording writes the samples gathered by recording, if any, into
+    their views and exports them along with view_datas in a single export.
+    """
+    if recording is not None:
+        view_datas = list(view_datas)
+        for each_measure, wire_bytes in ((m_request_bytes, recording.request), (m_response_bytes, recording.response)):
+            if wire_bytes is not None:
+                wire_view_datas = recording.by_measure[each_measure.name]
+                _record_into_views(wire_view_datas, wire_bytes[0], wire_bytes[1], None, None)
+                view_datas.extend(wire_view_datas)
+        recording.request = recording.response = None
+
+        samples, recording.samples = recording.samples, []
+        for sample_view_datas, value, method_name, status, error, extra_tags in samples:
+            _record_into_views(sample_view_datas, value, method_name, status, error, extra_tags=extra_tags)
+            view_datas.extend(sample_view_datas)
+
+    if view_datas:
+        mtvm = _measure_to_view_map()
+        if mtvm.exporters:
+            mtvm.export(list(dict((id(view_data), view_data) for view_data in view_datas).values()))
+
+
+def _start_detached_span(tracer, name, parent_span=None):
+    """
+    _start_detached_span starts a child span of the current span which does not
+    become the current span itself, for operations such as SCAN iterations that
+    are suspended in between steps while the caller carries on. Given the
+    detached parent_span, it is started as a child of that span instead, with
+    the tracer of that span.
+    """
+    if parent_span is not None:
+        context_tracer = parent_span.context_tracer
+    else:
+        context_tracer = tracer.tracer
+        parent_span = context_tracer.current_span()
+        if parent_span is None:
+            parent_span = tracers_base.NullContextManager(span_id=context_tracer.span_context.span_id)
+    span = trace_span.Span(name, parent_span=parent_span, context_tracer=context_tracer)
+    span.start()
+    return span
+
+
+def _end_detached_span(span):
+    span.finish()
+    context_tracer = span.context_tracer
+    context_tracer.exporter.export(context_tracer.get_span_datas(span))
+
+
+class _Histogram(object):
+    """
+    _Histogram is a pre-aggregated distribution of the samples of one measure,
+    bucketed by the bounds of the first distribution view of that measure.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'sum_of_squares', 'last')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = array.array('q', [0] * (len(bounds) + 1))
+        self.count = 0
+        self.total = 0.0
+        self.sum_of_squares = 0.0
+        self.last = None
+
+    def add(self, value, weight=1):
+        self.counts[bisect.bisect_right(self.bounds, value)] += weight
+        self.count += weight
+        self.total += value * weight
+        self.sum_of_squares += value * value * weight
+        self.last = value
+
+
+def _merge_distribution(data, histogram):
+    """
+    _merge_distribution folds histogram into the DistributionAggregationData,
+    combining the means and squared deviations as per Chan et al.
+    """
+    count = data.count_data + histogram.count
+    mean = histogram.total / histogram.count
+    sum_of_sqd_deviations = max(histogram.sum_of_squares - histogram.total * mean, 0.0)
+    if data.count_data == 0:
+        data._mean_data = mean
+        data._sum_of_sqd_deviations = sum_of_sqd_deviations
+    else:
+        delta = mean - data.mean_data
+        data._sum_of_sqd_deviations += (sum_of_sqd_deviations
+                + delta * delta * data.count_data * histogram.count / count)
+        data._mean_data += delta * histogram.count / count
+    data._count_data = count
+
+    counts_per_bucket = data.counts_per_bucket
+    if tuple(data.bounds) == histogram.bounds:
+        for i, bucket_count in enumerate(histogram.counts):
+            counts_per_bucket[i] += bucket_count
+        return
+
+    # The view has bounds of its own, so re-bucket at the lower bound of each bucket.
+    for i, bucket_count in enumerate(histogram.counts):
+        if bucket_count:
+            lower_bound = histogram.bounds[i - 1] if i else 0
+            counts_per_bucket[bisect.bisect_right(data.bounds, lower_bound)] += bucket_count
+
+
+def _merge_histogram(data, histogram):
+    if isinstance(data, aggregation_data.DistributionAggregationData):
+        _merge_distribution(data, histogram)
+    elif isinstance(data, aggregation_data.CountAggregationData):
+        data._count_data += histogram.count
+    elif isinstance(data, aggregation_data.SumAggregationData):
+        data._sum_data += histogram.total
+    elif isinstance(data, aggregation_data.LastValueAggregationData):
+        data._value = histogram.last
+
+
+class _ThreadBuffer(object):
+    """
+    _ThreadBuffer holds the histograms recorded by a single thread, keyed by
+    (method, status, error). Its lock is only ever contended by a flush.
+    """
+    __slots__ = ('lock', 'entries', 'pending', 'thread')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.pending = 0
+        self.thread = threading.current_thread()
+
+
+class _Aggregator(object):
+    """
+    _Aggregator pre-aggregates calls into per-thread histograms and merges them
+    into the redispy/* views every flush_interval seconds or once a thread has
+    buffered flush_threshold calls.
+    """
+
+    def __init__(self, flush_interval, flush_threshold):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._local = threading.local()
+        self._buffers = []
+        self._buffers_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flusher = None
+
+    def start(self):
+        if self.flush_interval is None:
+            return
+        self._flusher = threading.Thread(target=self._run, name='ocredis-stats-flusher')
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def _buffer(self):
         try:
-            return fn(*args, **kwargs)
+            return self._local.buffer
+        except AttributeError:
+            buf = _ThreadBuffer()
+            with self._buffers_lock:
+                self._buffers.append(buf)
+            self._local.buffer = buf
+            return buf
+
+    def _entry(self, buf, entry_key):
+        # The histograms of latency, key and value lengths, and the number of
+        # queued pipeline commands, which have no latency of their own.
+        entry = buf.entries.get(entry_key)
+        if entry is None:
+            bounds_by_measure = _view_data_cache.bounds_by_measure
+            entry = [_Histogram(bounds_by_measure.get(each_measure.name, ()))
+                    for each_measure in (m_latency_ms, m_key_length, m_value_length)] + [0]
+            buf.entries[entry_key] = entry
+        return entry
+
+    def _add_lengths(self, entry, key_summary, value_summary):
+        for length, times in key_summary.lengths.items():
+            entry[1].add(length, times)
+        for length, times in value_summary.lengths.items():
+            entry[2].add(length, times)
+
+    def record(self, method_name, status, error, latency_ms, key_summary, value_summary):
+        buf = self._buffer()
+        with buf.lock:
+            entry = self._entry(buf, (method_name, status, error))
+            entry[0].add(latency_ms)
+            self._add_lengths(entry, key_summary, value_summary)
+            buf.pending += 1
+            should_flush = buf.pending >= self.flush_threshold
+
+        if should_flush:
+            self._flush_buffer(buf)
+
+    def record_queued(self, method_name, status, error, calls, key_summary, value_summary):
+        """
+        record_queued records calls commands queued on a pipeline, which
+        are counted but have no latency of their own.
+        """
+        buf = self._buffer()
+        with buf.lock:
+            entry = self._entry(buf, (method_name, status, error))
+            entry[3] += calls
+            self._add_lengths(entry, key_summary, value_summary)
+            buf.pending += calls
+            should_flush = buf.pending >= self.flush_threshold
+
+        if should_flush:
+            self._flush_buffer(buf)
+
+    def flush(self):
+        with self._buffers_lock:
+            buffers = list(self._buffers)
+            self._buffers = [buf for buf in buffers if buf.thread.is_alive()]
+
+        for buf in buffers:
+            self._flush_buffer(buf)
+
+    def _flush_buffer(self, buf):
+        with buf.lock:
+            entries = buf.entries
+            buf.entries = {}
+            buf.pending = 0
+
+        if entries:
+            with self._merge_lock:
+                _merge_entries(entries)
+
+
+def _merge_entries(entries):
+    by_measure = _view_data_cache.refresh().by_measure
+    all_view_datas = []
+    for i, each_measure in enumerate((m_latency_ms, m_key_length, m_value_length)):
+        view_datas = by_measure[each_measure.name]
+        all_view_datas.extend(view_datas)
+        for (method_name, status, error), entry in entries.items():
+            histogram = entry[i]
+            queued = entry[3] if i == 0 else 0
+            if histogram.count == 0 and not queued:
+                continue
+            for view_data in view_datas:
+                counted = isinstance(view_data.view.aggregation, aggregation.CountAggregation)
+                if histogram.count == 0 and not counted:
+                    continue
+                data = _aggregation_data_for(view_data, method_name, status, error)
+                if histogram.count:
+                    _merge_histogram(data, histogram)
+                if queued and counted:
+                    data._count_data += queued
+
+    mtvm = _measure_to_view_map()
+    if all_view_datas and mtvm.exporters:
+        mtvm.export(all_view_datas)
+
+
+_aggregator = None
+
+
+def enable_aggregation(flush_interval=1.0, flush_threshold=1024):
+    """
+    enable_aggregation switches recording from writing every call into the
+    redispy/* views to pre-aggregating calls into per-thread histograms.
+    Those are merged into the views every flush_interval seconds, or once a
+    thread has buffered flush_threshold calls. If flush_interval is None then
+    only the threshold and explicit calls to flush_aggregation merge them.
+    """
+    global _aggregator
+    disable_aggregation()
+    aggregator = _Aggregator(flush_interval, flush_threshold)
+    aggregator.start()
+    _aggregator = aggregator
+
+
+def disable_aggregation():
+    """
+    disable_aggregation merges any pending histograms into the views and goes
+    back to recording every call directly.
+    """
+    global _aggregator
+    aggregator, _aggregator = _aggregator, None
+    if aggregator is not None:
+        aggregator.stop()
+
+
+def flush_aggregation():
+    """
+    flush_aggregation merges the pending histograms of every thread into the views.
+    """
+    aggregator = _aggregator
+    if aggregator is not None:
+        aggregator.flush()
+
+
+atexit.register(flush_aggregation)
+
+
+class _SizeSampler(object):
+    """
+    _SizeSampler decides which calls get their key and value sizes measured,
+    and with what weight, so that the sampled histograms remain unbiased.
+    """
+
+    def __init__(self, rate, method_rates, per_second):
+        self.rate = rate
+        self.method_rates = dict(method_rates or {})
+        self.per_second = per_second
+        self._window_start = _now()
+        self._window_calls = 0
+        self._budget_rate = 1.0
+
+    def weight(self, method_name):
+        """
+        weight returns 0 if the sizes of this call should not be measured, or
+        otherwise the number of calls that the measured sizes stand for.
+        """
+        rate = self.method_rates.get(method_name, self.rate)
+        if self.per_second is not None:
+            rate = min(rate, self._next_budget_rate())
+
+        if rate >= 1.0:
+            return 1
+        if rate <= 0.0 or random.random() >= rate:
+            return 0
+
+        # Stochastically round 1/rate so that the expected weight is exact.
+        inverse = 1.0 / rate
+        weight = int(inverse)
+        if random.random() < inverse - weight:
+            weight += 1
+        return weight
+
+    def _next_budget_rate(self):
+        # The rate for each window of at least a second is derived from the
+        # number of calls seen in the previous one.
+        self._window_calls += 1
+        elapsed = _now() - self._window_start
+        if elapsed >= 1.0:
+            self._budget_rate = min(1.0, self.per_second * elapsed / self._window_calls)
+            self._window_start += elapsed
+            self._window_calls = 0
+        return self._budget_rate
+
+
+_size_sampler = None
+
+# The HotKeys tracker of ocredis.hotkeys, if enabled.
+_hot_keys = None
+
+# The BigValues detector of ocredis.bigvalues, if enabled.
+_big_values = None
+
+
+def set_size_sampling(rate=1.0, method_rates=None, per_second=None):
+    """
+    set_size_sampling limits how often the key and value sizes of calls are
+    measured for the redispy/key_lengths and redispy/value_lengths views.
+    Latencies and call counts are always recorded for every call.
+
+    rate is the fraction of calls measured, and method_rates optionally maps
+    method names e.g. 'redispy.Redis.mset' to rates of their own. per_second
+    additionally caps the measurements to about that many per second.
+
+    Each measured call is weighted by the inverse of its sampling rate so the
+    histograms stay statistically correct. Calling set_size_sampling() with
+    no arguments goes back to measuring every call.
+    """
+    global _size_sampler
+    rates = [rate] + list((method_rates or {}).values())
+    if any(not 0.0 <= each_rate <= 1.0 for each_rate in rates):
+        raise ValueError('sampling rates must be within [0, 1]')
+    if per_second is not None and per_second <= 0:
+        raise ValueError('per_second must be positive')
 
-        except Exception as e:
+    if rate >= 1.0 and not method_rates and per_second is None:
+        _size_sampler = None
+    else:
+        _size_sampler = _SizeSampler(rate, method_rates, per_second)
+
+
+def _record_call(method_name, status, error, latency_ms, key, value, result=None):
+    hot_keys = _hot_keys
+    if hot_keys is not None and key is not None:
+        hot_keys.record(key, value, result)
+    big_values = _big_values
+    if big_values is not None:
+        big_values.record(method_name, key, value, result)
+
+    recording = _recording_slot.get()
+    by_measure = recording.by_measure if recording is not None else _view_data_cache.refresh().by_measure
+    key_view_datas = by_measure[m_key_length.name]
+    value_view_datas = by_measure[m_value_length.name]
+
+    key_summary = value_summary = _EMPTY_SUMMARY
+    if key_view_datas or value_view_datas:
+        sampler = _size_sampler
+        weight = sampler.weight(method_name) if sampler is not None else 1
+        if weight:
+            if key_view_datas:
+                key_summary = summarize_lengths(key)
+            if value_view_datas:
+                value_summary = summarize_lengths(value)
+            if weight != 1:
+                key_summary = _weighted_summary(key_summary, weight)
+                value_summary = _weighted_summary(value_summary, weight)
+
+    aggregator = _aggregator
+    if aggregator is not None:
+        aggregator.record(method_name, status, error, latency_ms, key_summary, value_summary)
+        _export_recording(recording, ())
+        return
+
+    latency_view_datas = by_measure[m_latency_ms.name]
+    _record_into_views(latency_view_datas, latency_ms, method_name, status, error)
+    if key_summary.count:
+        _record_lengths(key_view_datas, key_summary, method_name, status, error)
+    if value_summary.count:
+        _record_lengths(value_view_datas, value_summary, method_name, status, error)
+
+    _export_recording(recording, latency_view_datas + key_view_datas + value_view_datas)
+
+
+def _call_and_record(method_name, fn, key, value, span, args, kwargs):
+    previous = _begin_recording(span is not None)
+    start_time = _now()
+    try:
+        result = fn(*args, **kwargs)
+
+    except Exception as e:
+        if span is not None:
             span.status = Status.from_exception(e)
-            tags.insert(key_status, "ERROR")
-            tags.insert(key_error, e.__str__())
-            # Re-raise that exception after we've extracted the error.
-            raise e
+        _record_call(method_name, 'ERROR', classify_error(e), (_now() - start_time) * 1e3, key, value)
+        # Re-raise that exception after we've extracted the error.
+        raise
+
+    else:
+        _record_call(method_name, 'OK', None, (_now() - start_time) * 1e3, key, value, result)
+        return result
+
+    finally:
+        _recording_slot.set(previous)
+
+
+def _note_blocked(blocked_ms):
+    """
+    _note_blocked notes that the reply of the blocking command being called
+    took blocked_ms to arrive once the command was sent.
+    """
+    _blocked_ms_slot.set(blocked_ms)
+
+
+def _blocking_status(result):
+    # Blocking commands that time out reply nil, which redis-py parses as
+    # None or, for XREAD and XREADGROUP, as an empty list or dict.
+    if result is None or (isinstance(result, (list, dict)) and not result):
+        return 'TIMEOUT'
+    return 'OK'
+
+
+def _record_blocking_call(method_name, status, error, elapsed_ms, key, value, result=None):
+    """
+    _record_blocking_call records a call of a blocking command, whose wait
+    for its reply goes to redispy/blocked_time rather than redispy/latency,
+    which only gets the overhead of sending the command and delivering its
+    reply. If the wait wasn't noted, e.g. the connection isn't instrumented,
+    the whole call is counted as blocked.
+    """
+    blocked_ms = _blocked_ms_slot.get()
+    if blocked_ms is None or blocked_ms > elapsed_ms:
+        blocked_ms = elapsed_ms
+    _blocked_ms_slot.set(None)
+
+    _record_measurement(m_blocked_ms, blocked_ms, method_name, status, error)
+    _record_call(method_name, status, error, elapsed_ms - blocked_ms, key, value, result)
 
-        else:
-            tags.insert(key_status, "OK")
 
+def _call_and_record_blocking(method_name, fn, key, value, span, args, kwargs):
+    _blocked_ms_slot.set(None)
+    previous = _begin_recording(span is not None)
+    start_time = _now()
+    try:
+        result = fn(*args, **kwargs)
+
+    except Exception as e:
+        if span is not None:
+            span.status = Status.from_exception(e)
+        _record_blocking_call(method_name, 'ERROR', classify_error(e), (_now() - start_time) * 1e3, key, value)
+        raise
+
+    else:
+        _record_blocking_call(method_name, _blocking_status(result), None, (_now() - start_time) * 1e3,
+                key, value, result)
+        return result
+
+    finally:
+        _recording_slot.set(previous)
+
+
+def trace_and_record_stats_with_key_and_value(method_name, fn, key, value, *args, **kwargs):
+    """
+    trace_and_record_stats_with_key_and_value invokes fn(*args, **kwargs)
+    within a span named method_name and records its latency, key length and
+    value length against the redispy/* views.
+
+    When neither a sampling tracer is installed nor any view is registered
+    against the redispy measures, fn is invoked directly.
+    """
+    tracer = _span_tracer()
+    if tracer is None:
+        if not _is_recording():
+            return fn(*args, **kwargs)
+        return _call_and_record(method_name, fn, key, value, None, args, kwargs)
+
+    with tracer.span(name=method_name) as span:
+        previous = _in_span_slot.get()
+        _in_span_slot.set(True)
+        try:
+            return _call_and_record(method_name, fn, key, value, span, args, kwargs)
         finally:
-            latency_ms = (time.time() - start_time) * 1e3
-            mm.measure_float_put(m_latency_ms, latency_ms)
-            key_lengths = heuristical_lengths(key)
-            value_lengths =  heuristical_lengths(value)
+            _in_span_slot.set(previous)
+
+
+def _record_command(info, fn, args, options):
+    if not _is_recording():
+        return fn(*args, **options)
+    call_and_record = _call_and_record_blocking if 'b' in info.flags else _call_and_record
+    return call_and_record(info.method, fn, command_keys(info, args), command_values(info, args),
+            None, args, options)
+
+
+def trace_and_record_command(fn, args, options, span_policy=None):
+    """
+    trace_and_record_command invokes fn(*args, **options), where args are a
+    command and its arguments as passed to execute_command, and records it as
+    per trace_and_record_stats_with_key_and_value. The method name, keys and
+    values are looked up in the command table of ocredis.commands.
+
+    Blocking commands record their wait for a reply against the
+    redispy/blocked_time view instead, see _record_blocking_call.
+
+    Given a SpanPolicy that skips the span of the command, only its stats are
+    recorded.
+    """
+    info = call_info(args)
+    tracer = _span_tracer()
+    if tracer is None:
+        if not _is_recording():
+            return fn(*args, **options)
+        call_and_record = _call_and_record_blocking if 'b' in info.flags else _call_and_record
+        return call_and_record(info.method, fn, command_keys(info, args), command_values(info, args),
+                None, args, options)
+    if span_policy is not None and not span_policy.should_trace(info):
+        return _without_spans(_record_command, info, fn, args, options)
+
+    call_and_record = _call_and_record_blocking if 'b' in info.flags else _call_and_record
+    with tracer.span(name=info.method) as span:
+        previous = _in_span_slot.get()
+        _in_span_slot.set(True)
+        try:
+            return call_and_record(info.method, fn, command_keys(info, args), command_values(info, args),
+                    span, args, options)
+        finally:
+            _in_span_slot.set(previous)
+
 
-            for key_length in key_lengths:
-                mm.measure_int_put(m_key_length, key_length)
+def _merge_summaries(summaries):
+    count = total = largest = 0
+    lengths = {}
+    for summary in summaries:
+        if not summary.count:
+            continue
+        count += summary.count
+        total += summary.total
+        largest = max(largest, summary.max)
+        for length, times in summary.lengths.items():
+            lengths[length] = lengths.get(length, 0) + times
+    if count == 0:
+        return _EMPTY_SUMMARY
+    return LengthSummary(count, total, largest, lengths)
 
-            for value_length in value_lengths:
-                mm.measure_int_put(m_value_length, value_length)
 
-            mm.record(tags)
+def _record_pipeline(method_name, status, error, latency_ms, command_stack, results, span):
+    """
+    _record_pipeline records the execution of a whole pipeline as a single
+    call of method_name, and the commands that were queued on it in bulk, as
+    call counts and sizes per command without latencies.
+    """
+    by_command = {}
+    request_bytes = 0
+    hot_keys = _hot_keys
+    big_values = _big_values
+    for i, (args, options) in enumerate(command_stack):
+        command_status, command_error = status, error
+        result = results[i] if results is not None and i < len(results) else None
+        if isinstance(result, Exception):
+            command_status, command_error = 'ERROR', classify_error(result)
+
+        info = command_info(args[0], 'redispy.Pipeline.')
+        keys, values = command_keys(info, args), command_values(info, args)
+        key_summary = summarize_lengths(keys)
+        value_summary = summarize_lengths(values)
+        if hot_keys is not None:
+            hot_keys.record(keys, values, result)
+        if big_values is not None:
+            big_values.record(info.method, keys, values, result)
+        request_bytes += key_summary.total + value_summary.total
+
+        entry_key = (info.method, command_status, command_error)
+        summaries = by_command.get(entry_key)
+        if summaries is None:
+            summaries = by_command[entry_key] = ([], [])
+        summaries[0].append(key_summary)
+        summaries[1].append(value_summary)
+
+    if span is not None:
+        span.add_attribute('redispy.pipeline.batch_size', len(command_stack))
+        span.add_attribute('redispy.pipeline.request_bytes', request_bytes)
+        if results is not None:
+            span.add_attribute('redispy.pipeline.response_bytes', summarize_lengths(results).total)
+        span.add_attribute('redispy.pipeline.latency_ms', latency_ms)
+
+    by_measure = _by_measure()
+    latency_view_datas = by_measure[m_latency_ms.name]
+    key_view_datas = by_measure[m_key_length.name]
+    value_view_datas = by_measure[m_value_length.name]
+    if not (latency_view_datas or key_view_datas or value_view_datas):
+        _export_recording(_recording_slot.get(), ())
+        return
+
+    # The pipeline itself is recorded last, exporting the queued commands along with it.
+    aggregator = _aggregator
+    if aggregator is not None:
+        for (command_method, command_status, command_error), (key_summaries, value_summaries) in \
+                by_command.items():
+            aggregator.record_queued(command_method, command_status, command_error, len(key_summaries),
+                    _merge_summaries(key_summaries), _merge_summaries(value_summaries))
+        _record_call(method_name, status, error, latency_ms, None, None)
+        return
+
+    for (command_method, command_status, command_error), (key_summaries, value_summaries) in by_command.items():
+        # Queued commands have no latency of their own, so only count them.
+        for view_data in latency_view_datas:
+            if isinstance(view_data.view.aggregation, aggregation.CountAggregation):
+                data = _aggregation_data_for(view_data, command_method, command_status, command_error)
+                _add_weighted_sample(data, 0, len(key_summaries))
+        key_summary = _merge_summaries(key_summaries)
+        value_summary = _merge_summaries(value_summaries)
+        if key_summary.count:
+            _record_lengths(key_view_datas, key_summary, command_method, command_status, command_error)
+        if value_summary.count:
+            _record_lengths(value_view_datas, value_summary, command_method, command_status, command_error)
+
+    _record_call(method_name, status, error, latency_ms, None, None)
+
+
+def _execute_and_record_pipeline(method_name, fn, command_stack, span, args, kwargs):
+    previous = _begin_recording(span is not None)
+    start_time = _now()
+    try:
+        results = fn(*args, **kwargs)
+
+    except Exception as e:
+        if span is not None:
+            span.status = Status.from_exception(e)
+        _record_pipeline(method_name, 'ERROR', classify_error(e), (_now() - start_time) * 1e3,
+                command_stack, None, span)
+        raise
+
+    else:
+        _record_pipeline(method_name, 'OK', None, (_now() - start_time) * 1e3, command_stack, results, span)
+        return results
+
+    finally:
+        _recording_slot.set(previous)
+
+
+def _record_pipeline_execution(method_name, fn, command_stack, args, kwargs):
+    if not _is_recording():
+        return fn(*args, **kwargs)
+    return _execute_and_record_pipeline(method_name, fn, command_stack, None, args, kwargs)
+
+
+def trace_and_record_pipeline(method_name, fn, command_stack, *args, span_policy=None, **kwargs):
+    """
+    trace_and_record_pipeline invokes fn(*args, **kwargs), which is expected
+    to execute command_stack, within a single span named method_name that
+    carries the batch size, the request and response bytes and the latency.
+    Given a SpanPolicy that skips the span of pipelines, only stats are recorded.
+    """
+    tracer = _span_tracer()
+    if tracer is None:
+        if not _is_recording():
+            return fn(*args, **kwargs)
+        return _execute_and_record_pipeline(method_name, fn, command_stack, None, args, kwargs)
+    if span_policy is not None and not span_policy.should_trace(PIPELINE):
+        return _without_spans(_record_pipeline_execution, method_name, fn, command_stack, args, kwargs)
+
+    with tracer.span(name=method_name) as span:
+        previous = _in_span_slot.get()
+        _in_span_slot.set(True)
+        try:
+            return _execute_and_record_pipeline(method_name, fn, command_stack, span, args, kwargs)
+        finally:
+            _in_span_slot.set(previous)
@@ -0,0 +1,71 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import redis
+
+try:
+    from ocredis.commands import command_info, command_keys
+    from ocredis.observability import trace_and_record_pipeline
+except ImportError:
+    from .ocredis.commands import command_info, command_keys
+    from .ocredis.observability import trace_and_record_pipeline
+except Exception as e:
+    raise e
+
+class OcPipeline(redis.client.Pipeline):
+    """
+    OcPipeline is the instrumented wrapper for redis.client.Pipeline.
+    Commands are queued as usual and execute() records a single span for the
+    round trip along with the call counts and sizes of every queued command.
+
+    The keys written by the queued commands are invalidated in the read cache
+    of the OcRedis client that created the pipeline, if any, and its span is
+    created as per the SpanPolicy of that client, if any. Scripts passed to
+    eval are queued as EVALSHA and kept in the ScriptRegistry of that client.
+    """
+    read_cache = None
+    span_policy = None
+    script_registry = None
+
+    def eval(self, script, numkeys, *keys_and_args):
+        if self.script_registry is None:
+            return super(OcPipeline, self).eval(script, numkeys, *keys_and_args)
+        numkeys = int(numkeys)
+        return self.script_registry.register(script)(keys_and_args[:numkeys], keys_and_args[numkeys:], self)
+
+    def execute(self, raise_on_error=True):
+        # execute() resets the pipeline, so hold onto the queued commands.
+        command_stack = list(self.command_stack)
+        if not command_stack and not self.watching:
+            return super(OcPipeline, self).execute(raise_on_error)
+        if self.read_cache is None:
+            return trace_and_record_pipeline(
+                    'redispy.Pipeline.execute',
+                    super(OcPipeline, self).execute, command_stack, raise_on_error,
+                    span_policy=self.span_policy)
+
+        self._invalidate_written(command_stack)
+        try:
+            return trace_and_record_pipeline(
+                    'redispy.Pipeline.execute',
+                    super(OcPipeline, self).execute, command_stack, raise_on_error,
+                    span_policy=self.span_policy)
+        finally:
+            self._invalidate_written(command_stack)
+
+    def _invalidate_written(self, command_stack):
+        for args, options in command_stack:
+            info = command_info(args[0])
+            if 'w' in info.flags:
+                self.read_cache.invalidate_written(command_keys(info, args))
@@ -0,0 +1,202 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import sys
+
+import redis
+
+try:
+    from ocredis import observability
+    from ocredis.connection import instrumented_connection_class
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.connection import instrumented_connection_class
+except Exception as e:
+    raise e
+
+_pool_measures = (observability.m_pool_checkout_ms, observability.m_pool_connection_creation_ms,
+        observability.m_pool_connections_in_use, observability.m_pool_connections_idle,
+        observability.m_pool_disconnects)
+
+
+_CHECKOUT_SPAN_NAME = 'redispy.ConnectionPool.get_connection'
+
+
+def _is_recording_pool():
+    by_measure = observability._by_measure()
+    return any(by_measure[each_measure.name] for each_measure in _pool_measures)
+
+
+class _InstrumentedPool(abc.ABC):
+    """
+    _InstrumentedPool instruments the checkout of connections from a redis-py
+    connection pool. The time spent waiting for a connection is recorded apart
+    from the time spent creating and connecting new ones, and shows up as a
+    redispy.ConnectionPool.get_connection span within the span of the command.
+
+    The connection classes of redis-py are replaced by their instrumented
+    counterparts of ocredis.connection.
+
+    Once a ReadCache starts tracking, see ocredis.cache, it sets itself as
+    tracking_listener and every connection checked out has its tracking
+    redirected to it.
+
+    Given a script_registry, see ocredis.scripts, every connection checked
+    out has the registered scripts loaded into it once after it connects.
+
+    The connections in use and idle change on every checkout and release, so
+    they are recorded at most once every counts_interval seconds, as well as
+    whenever a connection is created or disconnected.
+    """
+    tracking_listener = None
+    script_registry = None
+    counts_interval = 1.0
+    _counts_recorded_at = None
+
+    def __init__(self, *args, **kwargs):
+        super(_InstrumentedPool, self).__init__(*args, **kwargs)
+        self.connection_class = instrumented_connection_class(self.connection_class)
+
+    def make_connection(self):
+        connection = super(_InstrumentedPool, self).make_connection()
+        # Connections are created lazily and connected by get_connection, so
+        # the creation latency is only known once the checkout completes.
+        connection._ocredis_created_at = observability._now()
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        tracer = observability._active_tracer()
+        detached_span = observability._detached_span_slot.get() if tracer is not None else None
+        if detached_span is not None:
+            # Checkouts for the pages of a SCAN iteration are parented by its
+            # span, which is never the current span.
+            span = observability._start_detached_span(tracer, _CHECKOUT_SPAN_NAME, detached_span)
+            try:
+                connection = self._checkout(span, args, kwargs)
+            finally:
+                observability._end_detached_span(span)
+        elif tracer is not None:
+            with tracer.span(name=_CHECKOUT_SPAN_NAME) as span:
+                connection = self._checkout(span, args, kwargs)
+        elif _is_recording_pool():
+            connection = self._checkout(None, args, kwargs)
+        else:
+            connection = super(_InstrumentedPool, self).get_connection(*args, **kwargs)
+
+        tracking_listener, script_registry = self.tracking_listener, self.script_registry
+        if tracking_listener is not None or script_registry is not None:
+            try:
+                if tracking_listener is not None:
+                    tracking_listener.enable_tracking(connection)
+                if script_registry is not None:
+                    script_registry.preload(connection)
+            except Exception:
+                self.release(connection)
+                raise
+        return connection
+
+    def _checkout(self, span, args, kwargs):
+        start_time = observability._now()
+        try:
+            connection = super(_InstrumentedPool, self).get_connection(*args, **kwargs)
+
+        except Exception as e:
+            if span is not None:
+                span.status = observability.Status.from_exception(e)
+            observability._record_measurement(observability.m_pool_checkout_ms,
+                    (observability._now() - start_time) * 1e3, None, 'ERROR',
+                    observability.classify_error(e))
+            raise
+
+        end_time = observability._now()
+        creation_ms = 0.0
+        created_at = connection.__dict__.pop('_ocredis_created_at', None)
+        if created_at is not None:
+            creation_ms = (end_time - max(created_at, start_time)) * 1e3
+            observability._record_measurement(observability.m_pool_connection_creation_ms, creation_ms,
+                    None, 'OK', None)
+        checkout_ms = (end_time - start_time) * 1e3 - creation_ms
+        observability._record_measurement(observability.m_pool_checkout_ms, checkout_ms, None, 'OK', None)
+        if span is not None:
+            span.add_attribute('redispy.pool.checkout_ms', checkout_ms)
+            span.add_attribute('redispy.pool.created', created_at is not None)
+
+        # Connections that get disconnected while checked out, e.g. after an
+        # error, are counted when they are released.
+        connection._ocredis_connected = getattr(connection, '_sock', None) is not None
+        self._record_connection_counts(created_at is not None)
+        return connection
+
+    def release(self, connection):
+        connected = connection.__dict__.pop('_ocredis_connected', False)
+        super(_InstrumentedPool, self).release(connection)
+        if not _is_recording_pool():
+            return
+
+        disconnected = connected and getattr(connection, '_sock', None) is None
+        if disconnected:
+            observability._record_measurement(observability.m_pool_disconnects, 1, None, None, None,
+                    ((observability.key_reason, 'in_use'),))
+        self._record_connection_counts(disconnected)
+
+    def disconnect(self, *args, **kwargs):
+        in_use, idle = self._connection_counts()
+        inuse_connections = kwargs.get('inuse_connections', args[0] if args else True)
+        super(_InstrumentedPool, self).disconnect(*args, **kwargs)
+        disconnected = in_use + idle if inuse_connections else idle
+        # Redis.__del__ also disconnects its pool, possibly as the interpreter shuts down.
+        if disconnected and not sys.is_finalizing():
+            observability._record_measurement(observability.m_pool_disconnects, disconnected, None, None, None,
+                    ((observability.key_reason, 'pool'),))
+
+    def _record_connection_counts(self, changed=False):
+        now = observability._now()
+        recorded_at = self._counts_recorded_at
+        if not changed and recorded_at is not None and now - recorded_at < self.counts_interval:
+            return
+        self._counts_recorded_at = now
+        in_use, idle = self._connection_counts()
+        observability._record_measurement(observability.m_pool_connections_in_use, in_use, None, None, None)
+        observability._record_measurement(observability.m_pool_connections_idle, idle, None, None, None)
+
+    @abc.abstractmethod
+    def _connection_counts(self):
+        """
+        _connection_counts returns the number of connections in use and idle.
+        """
+
+
+class OcConnectionPool(_InstrumentedPool, redis.ConnectionPool):
+    """
+    OcConnectionPool is the instrumented wrapper for redis.ConnectionPool,
+    which OcRedis uses unless given a connection_pool. It records the checkout
+    wait, the connections in use and idle, the latency of creating connections
+    and disconnects as the redispy/pool_* metrics.
+    """
+
+    def _connection_counts(self):
+        return len(self._in_use_connections), len(self._available_connections)
+
+
+class OcBlockingConnectionPool(_InstrumentedPool, redis.BlockingConnectionPool):
+    """
+    OcBlockingConnectionPool is the instrumented wrapper for
+    redis.BlockingConnectionPool, whose checkout wait includes the time spent
+    blocking for a connection to be released.
+    """
+
+    def _connection_counts(self):
+        idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+        return len(self._connections) - idle, idle
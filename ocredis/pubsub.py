@@ -0,0 +1,146 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+
+import redis
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = termios = None
+
+try:
+    from ocredis import observability
+    from ocredis.connection import _parser_buffered_bytes
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.connection import _parser_buffered_bytes
+except Exception as e:
+    raise e
+
+# The channel tag of messages received once the limit on distinct channels is reached.
+OTHER_CHANNELS = '_other'
+
+_PUBLISH_MESSAGE_TYPES = frozenset(['message', 'pmessage', 'smessage',
+        b'message', b'pmessage', b'smessage'])
+
+
+def _unread_bytes(connection):
+    """
+    _unread_bytes returns the number of bytes received on connection that
+    weren't read yet, both those buffered by its parser and those still
+    queued on its socket.
+    """
+    unread = _parser_buffered_bytes(connection)
+    sock = getattr(connection, '_sock', None)
+    if sock is not None and fcntl is not None:
+        try:
+            unread += struct.unpack('i', fcntl.ioctl(sock.fileno(), termios.FIONREAD, b'\0\0\0\0'))[0]
+        except (OSError, ValueError):
+            pass
+    return unread
+
+
+class OcPubSub(redis.client.PubSub):
+    """
+    OcPubSub is the instrumented wrapper for redis.client.PubSub.
+
+    It records the number and bytes of messages received per channel, or per
+    pattern for pattern subscriptions, the time spent receiving messages in
+    get_message and listen, the execution time of message handlers e.g. as
+    run by run_in_thread, and the bytes left to read after each receive.
+
+    At most max_channel_tags distinct channels are used as tag values, the
+    messages of any other channels are tagged as OTHER_CHANNELS.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.max_channel_tags = kwargs.pop('max_channel_tags', 100)
+        self._channel_tags = {}
+        self._handler_ms = 0.0
+        super(OcPubSub, self).__init__(*args, **kwargs)
+
+    def _channel_tags_for(self, channel):
+        extra_tags = self._channel_tags.get(channel)
+        if extra_tags is not None:
+            return extra_tags
+
+        if len(self._channel_tags) < self.max_channel_tags:
+            value = channel.decode('utf-8', 'replace') if isinstance(channel, bytes) else str(channel)
+            extra_tags = ((observability.key_channel, value),)
+            self._channel_tags[channel] = extra_tags
+        else:
+            extra_tags = ((observability.key_channel, OTHER_CHANNELS),)
+        return extra_tags
+
+    def handle_message(self, response, ignore_subscribe_messages=False):
+        if not isinstance(response, (list, tuple)) or response[0] not in _PUBLISH_MESSAGE_TYPES:
+            return super(OcPubSub, self).handle_message(response, ignore_subscribe_messages)
+
+        message_type = response[0]
+        if message_type in ('pmessage', b'pmessage'):
+            subscription, data, handlers = response[1], response[3], self.patterns
+        elif message_type in ('smessage', b'smessage'):
+            subscription, data, handlers = response[1], response[2], getattr(self, 'shard_channels', {})
+        else:
+            subscription, data, handlers = response[1], response[2], self.channels
+
+        extra_tags = self._channel_tags_for(subscription)
+        if observability._view_datas_for(observability.m_pubsub_message_size):
+            observability._record_measurement(observability.m_pubsub_message_size,
+                    observability.summarize_lengths(data).total, None, None, None, extra_tags)
+
+        if not handlers.get(subscription):
+            return super(OcPubSub, self).handle_message(response, ignore_subscribe_messages)
+
+        status = 'OK'
+        start_time = observability._now()
+        try:
+            return super(OcPubSub, self).handle_message(response, ignore_subscribe_messages)
+        except Exception:
+            status = 'ERROR'
+            raise
+        finally:
+            handler_ms = (observability._now() - start_time) * 1e3
+            self._handler_ms += handler_ms
+            observability._record_measurement(observability.m_pubsub_handler_ms, handler_ms,
+                    None, status, None, extra_tags)
+
+    def _record_receive(self, method_name, start_time):
+        # Handlers run within get_message, so their execution time is left out.
+        receive_ms = (observability._now() - start_time) * 1e3 - self._handler_ms
+        observability._record_measurement(observability.m_pubsub_receive_ms, max(receive_ms, 0.0),
+                method_name, None, None)
+        if self.connection is not None and observability._view_datas_for(observability.m_pubsub_backlog):
+            observability._record_measurement(observability.m_pubsub_backlog, _unread_bytes(self.connection),
+                    None, None, None)
+
+    def get_message(self, *args, **kwargs):
+        self._handler_ms = 0.0
+        start_time = observability._now()
+        try:
+            return super(OcPubSub, self).get_message(*args, **kwargs)
+        finally:
+            self._record_receive('redispy.PubSub.get_message', start_time)
+
+    def listen(self):
+        while self.subscribed:
+            self._handler_ms = 0.0
+            start_time = observability._now()
+            response = self.handle_message(self.parse_response(block=True))
+            self._record_receive('redispy.PubSub.listen', start_time)
+            if response is not None:
+                yield response
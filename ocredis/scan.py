@@ -0,0 +1,138 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Instrumented SCAN, HSCAN, SSCAN and ZSCAN iterations.
+
+An iteration may go on for as long as its consumer takes, so it is traced
+as one span from the first page to the last, with an annotation per page,
+that is never made the current span: whatever the consumer does in between
+pages is not parented by it.
+"""
+
+try:
+    from ocredis import observability
+except ImportError:
+    from .ocredis import observability
+except Exception as e:
+    raise e
+
+# The COUNT that Redis uses for pages when none is given.
+DEFAULT_COUNT = 10
+
+
+class _AdaptiveCount(object):
+    """
+    _AdaptiveCount tunes the COUNT hint of each page toward target_page_ms,
+    scaling it by the ratio of that target to the latency of the last page,
+    by at most a factor of two per page and within [min_count, max_count].
+    """
+    __slots__ = ('target_page_ms', 'min_count', 'max_count', 'count')
+
+    def __init__(self, target_page_ms, count=None, min_count=DEFAULT_COUNT, max_count=100000):
+        if target_page_ms <= 0:
+            raise ValueError('target_page_ms must be positive, got %r' % (target_page_ms,))
+        self.target_page_ms = target_page_ms
+        self.min_count = min_count
+        self.max_count = max_count
+        self.count = min(max(count or DEFAULT_COUNT, min_count), max_count)
+
+    def update(self, page_ms):
+        ratio = self.target_page_ms / max(page_ms, 1e-3)
+        ratio = min(max(ratio, 0.5), 2.0)
+        self.count = min(max(int(round(self.count * ratio)), self.min_count), self.max_count)
+
+
+def _page_items(data):
+    # HSCAN replies are dicts of fields to values.
+    return data.items() if isinstance(data, dict) else data
+
+
+def traced_scan_iter(method_name, scan_page, count=None, target_page_ms=None):
+    """
+    traced_scan_iter yields the elements of every page of an iteration,
+    where scan_page(cursor, count) returns the next cursor and page, until
+    the cursor is back at 0.
+
+    The iteration is traced as a single span named method_name, annotated
+    with the number of elements and latency of each page, and records the
+    elements per page, the number of pages and the elapsed time of the whole
+    iteration. The commands fetching each page record their own stats but
+    don't get spans of their own.
+
+    If target_page_ms is given, the COUNT of each page is tuned toward that
+    latency, starting from count.
+    """
+    adaptive = _AdaptiveCount(target_page_ms, count) if target_page_ms is not None else None
+    tracer = observability._span_tracer()
+    if tracer is None and not observability._is_recording() and adaptive is None:
+        cursor = '0'
+        while cursor != 0:
+            cursor, data = scan_page(cursor, count)
+            yield from _page_items(data)
+        return
+
+    span = observability._start_detached_span(tracer, method_name) if tracer is not None else None
+    start_time = observability._now()
+    status, error = 'OK', None
+    pages = elements = 0
+    cursor = '0'
+    try:
+        while cursor != 0:
+            page_count = adaptive.count if adaptive is not None else count
+            page_start = observability._now()
+            if span is not None:
+                previous = observability._in_span_slot.get(), observability._detached_span_slot.get()
+                observability._in_span_slot.set(True)
+                observability._detached_span_slot.set(span)
+            try:
+                cursor, data = scan_page(cursor, page_count)
+            finally:
+                if span is not None:
+                    observability._in_span_slot.set(previous[0])
+                    observability._detached_span_slot.set(previous[1])
+            page_ms = (observability._now() - page_start) * 1e3
+
+            pages += 1
+            page_elements = len(data)
+            elements += page_elements
+            if adaptive is not None:
+                adaptive.update(page_ms)
+            if span is not None:
+                attributes = {'page': pages, 'elements': page_elements, 'latency_ms': page_ms}
+                if page_count is not None:
+                    attributes['count'] = page_count
+                span.add_annotation('page', **attributes)
+            observability._record_measurement(observability.m_scan_page_elements, page_elements,
+                    method_name, 'OK', None)
+
+            yield from _page_items(data)
+
+    except Exception as e:
+        status, error = 'ERROR', observability.classify_error(e)
+        if span is not None:
+            span.status = observability.Status.from_exception(e)
+        raise
+
+    finally:
+        # Also reached when the consumer stops early and the generator is closed.
+        elapsed_ms = (observability._now() - start_time) * 1e3
+        observability._record_measurement(observability.m_scan_pages, pages, method_name, status, error)
+        observability._record_measurement(observability.m_scan_latency_ms, elapsed_ms, method_name, status, error)
+        if span is not None:
+            span.add_attribute('redispy.scan.pages', pages)
+            span.add_attribute('redispy.scan.elements', elements)
+            span.add_attribute('redispy.scan.latency_ms', elapsed_ms)
+            span.add_attribute('redispy.scan.complete', cursor == 0)
+            observability._end_detached_span(span)
@@ -0,0 +1,215 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+import threading
+
+import redis
+from redis.commands.core import Script
+from redis.exceptions import NoScriptError, ResponseError
+
+try:
+    from ocredis import observability
+except ImportError:
+    from .ocredis import observability
+except Exception as e:
+    raise e
+
+_logger = logging.getLogger(__name__)
+
+# The method that the bytes sent and read to preload scripts are tagged by,
+# see ocredis.connection.
+PRELOAD_METHOD = 'redispy.ScriptRegistry.preload'
+
+
+class OcScript(Script):
+    """
+    OcScript is the instrumented counterpart of the Script objects returned
+    by register_script. Each call sends EVALSHA and, should the server not
+    know the script, loads it with SCRIPT LOAD and sends EVALSHA again.
+
+    The latency of each call, the bytes of source that EVALSHA saved sending
+    and the reloads are recorded per script, tagged by name, which defaults
+    to the first 12 characters of the SHA1 digest.
+
+    Called with a pipeline as client, the script is queued as EVALSHA and
+    loaded by the pipeline itself if need be, so only the bytes saved are
+    recorded.
+
+    Given a registry, the script is added to it once the server ran or
+    loaded it, so that scripts that don't compile are never preloaded.
+    """
+
+    _sequence = 0
+
+    def __init__(self, registered_client, script, name=None, registry=None):
+        super(OcScript, self).__init__(registered_client, script)
+        self.registry = registry
+        self.name = name or self.sha[:12]
+        source = script
+        if isinstance(source, str):
+            source = registered_client.connection_pool.get_encoder().encode(source)
+        self.source_length = len(source)
+        # Sources shorter than their digest save nothing rather than cost.
+        self._bytes_saved = max(0, self.source_length - len(self.sha))
+        self._tags = ((observability.key_script, self.name),)
+
+    def _record_bytes_saved(self):
+        observability._record_measurement(observability.m_script_bytes_saved,
+                self._bytes_saved, None, None, None, self._tags)
+
+    def __call__(self, keys=None, args=None, client=None):
+        keys = keys or []
+        args = args or []
+        if client is None:
+            client = self.registered_client
+        if isinstance(client, redis.client.Pipeline):
+            result = super(OcScript, self).__call__(keys, args, client)
+            self._record_bytes_saved()
+            return result
+
+        keys_and_args = tuple(keys) + tuple(args)
+        start_time = observability._now()
+        status = 'ERROR'
+        try:
+            try:
+                result = client.evalsha(self.sha, len(keys), *keys_and_args)
+                self._record_bytes_saved()
+            except NoScriptError:
+                # The server restarted, flushed its scripts or isn't the one
+                # that the script was loaded into.
+                observability._record_measurement(observability.m_script_reloads, 1,
+                        None, None, None, self._tags)
+                client.script_load(self.script)
+                self._loaded()
+                result = client.evalsha(self.sha, len(keys), *keys_and_args)
+            else:
+                self._loaded()
+            status = 'OK'
+            return result
+        finally:
+            observability._record_measurement(observability.m_script_latency_ms,
+                    (observability._now() - start_time) * 1e3, None, status, None, self._tags)
+
+    def _loaded(self):
+        if self.registry is not None:
+            self.registry.add(self)
+
+
+class ScriptRegistry(object):
+    """
+    ScriptRegistry holds the OcScripts of client that the server ran or
+    loaded by SHA1 digest, up to max_scripts of them, evicting the least
+    recently registered first.
+
+    Once set as the script_registry of an OcConnectionPool or
+    OcBlockingConnectionPool, the scripts are loaded into each connection
+    checked out of the pool that wasn't since it connected or since they
+    were added, so that calls don't have to fall back on NOSCRIPT.
+    """
+
+    def __init__(self, client, max_scripts=1000):
+        self.client = client
+        self.max_scripts = max_scripts
+        self._lock = threading.Lock()
+        self._scripts = collections.OrderedDict()
+        # The scripts by their source, so that registering them again
+        # needn't hash their source.
+        self._by_source = {}
+        # The sequence number of the last script added, each connection
+        # notes that of the last script loaded into it.
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._scripts)
+
+    def register(self, script, name=None):
+        """
+        register returns the OcScript of script, a Lua source, which is
+        added to the registry once it ran or loaded, unless it already is.
+        Given a name, the script is tagged by it.
+        """
+        with self._lock:
+            existing = self._by_source.get(script)
+            if existing is not None and (name is None or existing.name == name):
+                self._scripts.move_to_end(existing.sha)
+                return existing
+
+        new_script = OcScript(self.client, script, name, self)
+        with self._lock:
+            existing = self._scripts.get(new_script.sha)
+            if existing is not None and (name is None or existing.name == name):
+                self._scripts.move_to_end(new_script.sha)
+                return existing
+            return new_script
+
+    def add(self, script):
+        """
+        add adds script, an OcScript, to the registry unless it already is.
+        """
+        with self._lock:
+            existing = self._scripts.get(script.sha)
+            if existing is script:
+                return
+            if existing is None:
+                self._sequence += 1
+                script._sequence = self._sequence
+            else:
+                # Renamed, the server already knows it.
+                script._sequence = existing._sequence
+                self._forget(existing)
+            self._scripts[script.sha] = script
+            self._by_source[script.script] = script
+            while len(self._scripts) > self.max_scripts:
+                self._forget(self._scripts.popitem(last=False)[1])
+
+    def discard(self, sha):
+        with self._lock:
+            script = self._scripts.pop(sha, None)
+            if script is not None:
+                self._forget(script)
+
+    def _forget(self, script):
+        if self._by_source.get(script.script) is script:
+            del self._by_source[script.script]
+
+    def get(self, sha):
+        return self._scripts.get(sha)
+
+    def preload(self, connection):
+        """
+        preload loads the scripts added since connection connected or since
+        it last had scripts loaded into it. Scripts that fail to load are
+        logged and discarded rather than failing the checkout.
+        """
+        loaded = getattr(connection, '_ocredis_scripts_loaded', None)
+        loaded_sequence = loaded[1] if loaded is not None and loaded[0] is connection._sock else 0
+        with self._lock:
+            sequence = self._sequence
+            if loaded_sequence == sequence:
+                return
+            scripts = [each for each in self._scripts.values() if each._sequence > loaded_sequence]
+        if scripts:
+            connection._ocredis_next_method = PRELOAD_METHOD
+            connection.send_packed_command(connection.pack_commands(
+                    [('SCRIPT', 'LOAD', each.script) for each in scripts]))
+            # Every reply is read, lest they be read as those of later commands.
+            for each in scripts:
+                try:
+                    connection.read_response()
+                except ResponseError as e:
+                    _logger.warning('Discarding script %s that failed to load: %s', each.name, e)
+                    self.discard(each.sha)
+        connection._ocredis_scripts_loaded = (connection._sock, sequence)
@@ -0,0 +1,118 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+try:
+    from ocredis.commands import CommandInfo
+except ImportError:
+    from .ocredis.commands import CommandInfo
+except Exception as e:
+    raise e
+
+# The decisions of a SpanPolicy besides sampling rates.
+ALWAYS = 'always'
+NEVER = 'never'
+
+# The CommandInfo that pipelines are looked up with, as a whole.
+PIPELINE = CommandInfo('pipeline', 'redispy.Pipeline.execute', '', None, None)
+
+
+def _command_class(info):
+    if info is PIPELINE:
+        return 'pipeline'
+    if 'b' in info.flags:
+        return 'blocking'
+    if 'w' in info.flags:
+        return 'write'
+    if 'r' in info.flags:
+        return 'read'
+    return None
+
+
+def _rate(decision):
+    if decision == ALWAYS:
+        return 1.0
+    if decision == NEVER:
+        return 0.0
+    rate = float(decision)
+    if not 0.0 <= rate <= 1.0:
+        raise ValueError('span policy rates must be within [0, 1], not %r' % (decision,))
+    return rate
+
+
+class SpanPolicy(object):
+    """
+    SpanPolicy decides per command whether OcRedis creates its span, given a
+    sampling tracer. Stats are recorded either way, and a command whose span
+    is skipped creates no span object at all, nor do the connection checkouts
+    and commands that it makes.
+
+    policy either maps to decisions, from most to least specific:
+    method names e.g. 'redispy.Redis.get', command names e.g. 'get', command
+    classes 'blocking', 'write', 'read' or 'pipeline', and '*' for the other
+    commands; or is a callable of the CommandInfo of a command, see
+    ocredis.commands, returning its decision. A callable is called on every
+    command, so that its decisions may change over time, whereas those of a
+    mapping are looked up once per method and reused.
+
+    Decisions are 'always', 'never', or the rate at which spans are sampled.
+    Commands that policy doesn't decide on get default.
+    """
+
+    def __init__(self, policy=None, default=ALWAYS):
+        self.policy = policy if policy is not None else {}
+        self.default = default
+        self._default_rate = _rate(default)
+        self._rates = {}
+        if not callable(self.policy):
+            for decision in self.policy.values():
+                _rate(decision)
+
+    def _rate_for(self, info):
+        if callable(self.policy):
+            decision = self.policy(info)
+            return self._default_rate if decision is None else _rate(decision)
+
+        for name in (info.method, info.name, _command_class(info), '*'):
+            decision = self.policy.get(name)
+            if decision is not None:
+                return _rate(decision)
+        return self._default_rate
+
+    def should_trace(self, info):
+        """
+        should_trace returns whether to create the span of the command
+        described by info, a CommandInfo.
+        """
+        if callable(self.policy):
+            rate = self._rate_for(info)
+        else:
+            rate = self._rates.get(info.method)
+            if rate is None:
+                rate = self._rates[info.method] = self._rate_for(info)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        return random.random() < rate
+
+
+def span_policy(policy):
+    """
+    span_policy returns policy as a SpanPolicy, or None if policy is None.
+    """
+    if policy is None or isinstance(policy, SpanPolicy):
+        return policy
+    return SpanPolicy(policy)
@@ -0,0 +1,152 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+import time
+
+try:
+    from ocredis import observability
+    from ocredis.tags import key_bytes, tag_value
+except ImportError:
+    from .ocredis import observability
+    from .ocredis.tags import key_bytes, tag_value
+except Exception as e:
+    raise e
+
+# The ID that XREADGROUP is given to read the entries never delivered to the group.
+NEW_ENTRIES = b'>'
+
+
+def entry_timestamp_ms(entry_id):
+    """
+    entry_timestamp_ms returns the Unix time in milliseconds that the stream
+    entry ID entry_id starts with, or None if it doesn't.
+    """
+    try:
+        return int(key_bytes(entry_id).split(b'-', 1)[0])
+    except ValueError:
+        return None
+
+
+def _stream_entries(reply):
+    """
+    _stream_entries returns the (stream, entries) of an XREADGROUP reply,
+    as parsed by redis-py for RESP2 or RESP3.
+    """
+    if not reply:
+        return ()
+    if isinstance(reply, dict):
+        return [(stream, each[0] if each else []) for stream, each in reply.items()]
+    return [(each[0], each[1]) for each in reply]
+
+
+class StreamTracker(object):
+    """
+    StreamTracker records the consumption of streams by consumer groups,
+    tagged by stream and group: the entries each XREADGROUP returned, the
+    time from the ID of each new entry to its delivery, the time from the
+    delivery of each entry to its XACK, and the pending entries that XPENDING
+    reports.
+
+    Delivery times are kept for up to max_deliveries entries not acked yet,
+    evicting the oldest first, so that entries that are never acked by this
+    client, e.g. because another consumer claims them, don't pile up.
+    """
+
+    def __init__(self, max_deliveries=10000):
+        self.max_deliveries = max_deliveries
+        self._lock = threading.Lock()
+        self._deliveries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._deliveries)
+
+    def _tags(self, stream, group):
+        return ((observability.key_stream, tag_value(key_bytes(stream))),
+                (observability.key_group, tag_value(key_bytes(group))))
+
+    def _delivered(self, stream, group, entry_ids, now):
+        group_key = (key_bytes(stream), key_bytes(group))
+        with self._lock:
+            for entry_id in entry_ids:
+                self._deliveries[group_key + (key_bytes(entry_id),)] = now
+            while len(self._deliveries) > self.max_deliveries:
+                self._deliveries.popitem(last=False)
+
+    def read(self, group, streams, reply):
+        """
+        read records the XREADGROUP of group from streams, which map stream
+        names to IDs, given its reply. Only the entries read past the last
+        one delivered to the group, from ID '>', are new; the others were
+        already delivered, which doesn't tell how far behind the group is.
+        Streams that returned no entries, e.g. as the read timed out, aren't
+        recorded, lest idle consumers skew the batch sizes toward zero.
+        """
+        now = observability._now()
+        now_ms = time.time() * 1e3
+        entries_by_stream = dict((key_bytes(stream), entries) for stream, entries in _stream_entries(reply))
+        for stream, stream_id in streams.items():
+            entries = entries_by_stream.get(key_bytes(stream)) or []
+            entry_ids = [entry_id for entry_id, _ in entries if entry_id is not None]
+            if not entry_ids:
+                continue
+
+            tags = self._tags(stream, group)
+            observability._record_measurement(observability.m_stream_batch_size, len(entry_ids),
+                    None, None, None, tags)
+            self._delivered(stream, group, entry_ids, now)
+            if key_bytes(stream_id) != NEW_ENTRIES:
+                continue
+            for entry_id in entry_ids:
+                timestamp_ms = entry_timestamp_ms(entry_id)
+                if timestamp_ms is not None:
+                    observability._record_measurement(observability.m_stream_end_to_end_ms,
+                            max(0.0, now_ms - timestamp_ms), None, None, None, tags)
+
+    def claimed(self, stream, group, entries):
+        """
+        claimed records the entries of stream that group claimed with XCLAIM
+        or XAUTOCLAIM, as entries or IDs, as delivered now.
+        """
+        entry_ids = [each[0] if isinstance(each, (list, tuple)) else each for each in entries or ()]
+        self._delivered(stream, group, [each for each in entry_ids if each is not None], observability._now())
+
+    def acked(self, stream, group, entry_ids):
+        """
+        acked records the time to XACK of the entries entry_ids of stream
+        that were delivered to group.
+        """
+        now = observability._now()
+        group_key = (key_bytes(stream), key_bytes(group))
+        with self._lock:
+            delivered_at = [self._deliveries.pop(group_key + (key_bytes(entry_id),), None)
+                    for entry_id in entry_ids]
+        tags = None
+        for each in delivered_at:
+            if each is None:
+                continue
+            if tags is None:
+                tags = self._tags(stream, group)
+            observability._record_measurement(observability.m_stream_ack_ms, (now - each) * 1e3,
+                    None, None, None, tags)
+
+    def pending(self, stream, group, reply):
+        """
+        pending records the number of pending entries of group in stream as
+        per the summary reply of XPENDING.
+        """
+        if isinstance(reply, dict) and reply.get('pending') is not None:
+            observability._record_measurement(observability.m_stream_pending, int(reply['pending']),
+                    None, None, None, self._tags(stream, group))
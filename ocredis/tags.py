@@ -0,0 +1,44 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Helpers for tagging metrics by keys, key prefixes and other names sent to
+Redis, shared by the hot key, big value, lock and stream trackers.
+"""
+
+# The tag value of the keys, prefixes or names beyond those that are tracked
+# individually.
+OTHER = '_other'
+
+
+def key_bytes(key):
+    """
+    key_bytes returns key as redis-py would encode it with the default
+    encoding, as bytes.
+    """
+    if isinstance(key, bytes):
+        return key
+    if isinstance(key, str):
+        return key.encode('utf-8')
+    if isinstance(key, (bytearray, memoryview)):
+        return bytes(key)
+    return repr(key).encode('utf-8')
+
+
+def tag_value(key):
+    """
+    tag_value returns key, as returned by key_bytes, as a tag value, escaping
+    the bytes that aren't ASCII.
+    """
+    return key.decode('ascii', 'backslashreplace')
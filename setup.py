@@ -21,9 +21,13 @@ from setuptools import setup, find_packages
 
 install_requires = [
     'opencensus >= 0.2.0',
-    'redis >= 3.2.0'
+    'redis >= 4.1.0'
 ]
 
+extras_require = {
+    'asyncio': ['redis >= 4.2.0'],
+}
+
 class PyTest(TestCommand):
     def finalize_options(self):
         TestCommand.finalize_options(self)
@@ -46,17 +50,19 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: Apache Software License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
     description='A wrapper for redis-py, instrumented using OpenCensus for distributed tracing and metrics',
     include_package_data=True,
     long_description=open('README.rst').read(),
     install_requires=install_requires,
+    python_requires='>=3.7',
+    extras_require=extras_require,
     license='Apache-2.0',
     packages=find_packages(),
     namespace_packages=[],
@@ -0,0 +1,412 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Microbenchmarks of the overhead of OcRedis over redis.Redis.
+
+Every operation runs against a connection whose socket replies in process
+with canned RESP replies, so that only the client side is measured: redis-py
+packing commands and parsing replies, plus whatever ocredis adds. Each one is
+run by redis.Redis and by OcRedis, with the redispy views registered, with
+tracing off, sampled (one in ten calls) and on.
+
+    python -m tests.benchmark --output results.json
+    python -m tests.benchmark --compare results.json
+
+The time per call is the median over the repeats. The overhead of the fast
+path of trace_and_record_stats_with_key_and_value over calling a no-op
+directly is reported too, with nothing listening and with the redispy views
+registered, as the best of the repeats. As CPython doesn't count
+allocations, the allocations per call are the peak bytes traced by
+tracemalloc during each call, and the memory blocks still allocated after
+the calls, per call, which shows up what gets retained.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import socket
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+import opencensus
+import redis
+from opencensus.stats import stats
+from opencensus.stats.measure_to_view_map import MeasureToViewMap
+from opencensus.trace import execution_context
+from opencensus.trace.samplers import AlwaysOnSampler
+from opencensus.trace.tracer import Tracer
+from opencensus.trace.tracers import noop_tracer
+
+import ocredis
+from ocredis import observability
+from ocredis.connection import _InstrumentedConnection
+from ocredis.pool import OcConnectionPool
+from tests.fakes import _parse_packed_commands, encode_reply
+
+# The reply to each command, anything else gets +OK.
+_CANNED_REPLIES = {
+    b'GET': b'value',
+    b'INCR': 1,
+    b'MGET': [b'value', None, b'value'],
+    b'HSET': 1,
+    b'HGET': b'value',
+    b'HGETALL': [b'field', b'value', b'other', b'value'],
+    b'RPUSH': 3,
+    b'LRANGE': [b'a', b'b', b'c'],
+    b'LPOP': b'a',
+    b'SADD': 1,
+    b'SMEMBERS': [b'a', b'b', b'c'],
+    b'SISMEMBER': 1,
+    b'ZADD': 1,
+    b'ZRANGE': [b'a', b'b', b'c'],
+    b'ZSCORE': b'1.5',
+    b'XADD': b'1526919030474-0',
+    b'XRANGE': [[b'1526919030474-0', [b'field', b'value']]],
+    b'XLEN': 1,
+}
+
+
+class _CannedSocket(object):
+    """
+    _CannedSocket stands in for the socket of a connection, replying to the
+    commands sent on it from _CANNED_REPLIES.
+    """
+
+    def __init__(self):
+        self._replies = bytearray()
+        self._queued = None
+
+    def _reply(self, args):
+        command = args[0].upper()
+        if command == b'MULTI':
+            self._queued = []
+            return b'OK'
+        if command == b'EXEC':
+            queued, self._queued = self._queued, None
+            return [_CANNED_REPLIES.get(each.upper(), b'OK') for each in queued]
+        if self._queued is not None:
+            self._queued.append(command)
+            return b'QUEUED'
+        return _CANNED_REPLIES.get(command, b'OK')
+
+    def sendall(self, data):
+        for args in _parse_packed_commands(bytes(data)):
+            self._replies += encode_reply(self._reply(args))
+
+    def recv(self, size):
+        if not self._replies:
+            # redis-py polls for unread replies whenever it checks out a connection.
+            raise socket.timeout('timed out')
+        data = bytes(self._replies[:size])
+        del self._replies[:size]
+        return data
+
+    def recv_into(self, buffer, size=0):
+        if not self._replies:
+            raise socket.timeout('timed out')
+        size = min(size or len(buffer), len(self._replies))
+        buffer[:size] = self._replies[:size]
+        del self._replies[:size]
+        return size
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
+
+
+class CannedConnection(redis.Connection):
+    def _connect(self):
+        return _CannedSocket()
+
+
+class OcCannedConnection(_InstrumentedConnection, CannedConnection):
+    pass
+
+
+class _NullExporter(object):
+    def export(self, span_datas):
+        pass
+
+    def emit(self, span_datas):
+        pass
+
+
+def _pipeline(client):
+    pipe = client.pipeline()
+    for i in range(10):
+        pipe.set('key', 'value')
+    pipe.execute()
+
+
+# The operations per command family, each run against a client.
+OPERATIONS = [
+    ('strings', 'set', lambda client: client.set('key', 'value')),
+    ('strings', 'get', lambda client: client.get('key')),
+    ('strings', 'incr', lambda client: client.incr('counter')),
+    ('strings', 'mget', lambda client: client.mget('key', 'missing', 'key')),
+    ('hashes', 'hset', lambda client: client.hset('hash', 'field', 'value')),
+    ('hashes', 'hget', lambda client: client.hget('hash', 'field')),
+    ('hashes', 'hgetall', lambda client: client.hgetall('hash')),
+    ('lists', 'rpush', lambda client: client.rpush('list', 'a', 'b', 'c')),
+    ('lists', 'lrange', lambda client: client.lrange('list', 0, -1)),
+    ('lists', 'lpop', lambda client: client.lpop('list')),
+    ('sets', 'sadd', lambda client: client.sadd('set', 'a')),
+    ('sets', 'smembers', lambda client: client.smembers('set')),
+    ('sets', 'sismember', lambda client: client.sismember('set', 'a')),
+    ('zsets', 'zadd', lambda client: client.zadd('zset', {'a': 1.5})),
+    ('zsets', 'zrange', lambda client: client.zrange('zset', 0, -1)),
+    ('zsets', 'zscore', lambda client: client.zscore('zset', 'a')),
+    ('streams', 'xadd', lambda client: client.xadd('stream', {'field': 'value'})),
+    ('streams', 'xrange', lambda client: client.xrange('stream')),
+    ('streams', 'xlen', lambda client: client.xlen('stream')),
+    ('pipelines', 'pipeline_10_sets', _pipeline),
+]
+
+TRACING_MODES = ('off', 'sampled', 'on')
+
+# Sampled tracing has every SAMPLE_EVERY-th call traced.
+SAMPLE_EVERY = 10
+
+
+def _clients():
+    """
+    _clients yields the (client name, tracing, client, set_tracer) to benchmark.
+    set_tracer, if any, is called before each call with its index.
+    """
+    plain = redis.Redis(connection_pool=redis.ConnectionPool(connection_class=CannedConnection))
+    yield 'redis', 'off', plain, None
+
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=OcConnectionPool(connection_class=OcCannedConnection))
+    noop = noop_tracer.NoopTracer()
+    traced = Tracer(sampler=AlwaysOnSampler(), exporter=_NullExporter())
+    tracers = [traced] + [noop] * (SAMPLE_EVERY - 1)
+
+    def set_tracer(i):
+        execution_context.set_opencensus_tracer(tracers[i % SAMPLE_EVERY])
+
+    for tracing in TRACING_MODES:
+        execution_context.set_opencensus_tracer(traced if tracing == 'on' else noop)
+        yield 'ocredis', tracing, client, set_tracer if tracing == 'sampled' else None
+    execution_context.set_opencensus_tracer(noop)
+
+
+def _time_per_call(operation, client, set_tracer, iterations):
+    if set_tracer is None:
+        start = time.perf_counter()
+        for i in range(iterations):
+            operation(client)
+        return (time.perf_counter() - start) / iterations * 1e9
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        set_tracer(i)
+        operation(client)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def _allocations_per_call(operation, client, set_tracer, iterations):
+    peak_bytes = 0
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        for i in range(iterations):
+            if set_tracer is not None:
+                set_tracer(i)
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            operation(client)
+            peak_bytes += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    return peak_bytes / iterations, (sys.getallocatedblocks() - blocks) / iterations
+
+
+def _overhead_ns_per_call(number, repeats):
+    def noop(key):
+        pass
+
+    def direct():
+        noop('key')
+
+    def wrapped():
+        observability.trace_and_record_stats_with_key_and_value('redispy.Redis.get', noop, 'key', None, 'key')
+
+    direct_ns = min(timeit.repeat(direct, number=number, repeat=repeats)) / number * 1e9
+    wrapped_ns = min(timeit.repeat(wrapped, number=number, repeat=repeats)) / number * 1e9
+    return wrapped_ns - direct_ns
+
+
+def fast_path_overheads(number=20000, repeats=5):
+    """
+    fast_path_overheads returns the overhead in nanoseconds per call of
+    trace_and_record_stats_with_key_and_value, with tracing off, when nothing
+    is listening and when the redispy views are registered.
+    """
+    view_manager = stats.stats.view_manager
+    measure_to_view_map = view_manager._measure_view_map
+    tracer = execution_context.get_opencensus_tracer()
+    execution_context.set_opencensus_tracer(noop_tracer.NoopTracer())
+    view_manager._measure_view_map = MeasureToViewMap()
+    try:
+        idle_ns = _overhead_ns_per_call(number, repeats)
+        ocredis.register_views()
+        recording_ns = _overhead_ns_per_call(number, repeats)
+    finally:
+        view_manager._measure_view_map = measure_to_view_map
+        execution_context.set_opencensus_tracer(tracer)
+    return {'idle_ns': round(idle_ns, 1), 'recording_ns': round(recording_ns, 1)}
+
+
+def run(iterations=2000, repeats=5, alloc_iterations=200, families=None):
+    """
+    run benchmarks every operation, of the given families if any, and returns
+    the results as a dict ready to be saved as JSON.
+    """
+    fast_path = fast_path_overheads(iterations * 10, repeats)
+    results = []
+    for client_name, tracing, client, set_tracer in _clients():
+        for family, name, operation in OPERATIONS:
+            if families and family not in families:
+                continue
+            # Warm up, connecting the client and filling any caches.
+            _time_per_call(operation, client, set_tracer, max(iterations // 10, 1))
+            timings = [_time_per_call(operation, client, set_tracer, iterations) for i in range(repeats)]
+            alloc_bytes, blocks = _allocations_per_call(operation, client, set_tracer, alloc_iterations)
+            results.append({
+                'family': family,
+                'operation': name,
+                'client': client_name,
+                'tracing': tracing,
+                'ns_per_call': round(statistics.median(timings), 1),
+                'ns_per_call_min': round(min(timings), 1),
+                'alloc_bytes_per_call': round(alloc_bytes, 1),
+                'blocks_per_call': round(blocks, 3),
+            })
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'redis': redis.__version__,
+            'opencensus': getattr(opencensus, '__version__', None),
+            'iterations': iterations,
+            'repeats': repeats,
+            'alloc_iterations': alloc_iterations,
+        },
+        'fast_path': fast_path,
+        'results': results,
+    }
+
+
+def _key(result):
+    return result['family'], result['operation'], result['client'], result['tracing']
+
+
+def overheads(report):
+    """
+    overheads returns the time per call of OcRedis relative to redis.Redis,
+    per (family, operation, tracing).
+    """
+    plain = dict(((result['family'], result['operation']), result['ns_per_call'])
+            for result in report['results'] if result['client'] == 'redis')
+    return dict(((result['family'], result['operation'], result['tracing']),
+            result['ns_per_call'] / plain[result['family'], result['operation']])
+            for result in report['results']
+            if result['client'] == 'ocredis' and (result['family'], result['operation']) in plain)
+
+
+def regressions(report, baseline, threshold=1.1):
+    """
+    regressions returns the results of report whose time per call exceeds
+    that of baseline by more than threshold, as (result, baseline result).
+    Times are compared relative to redis.Redis on either run, so that runs
+    on different machines can be compared.
+    """
+    current, previous = overheads(report), overheads(baseline)
+    by_key = dict((_key(result), result) for result in report['results'])
+    previous_by_key = dict((_key(result), result) for result in baseline['results'])
+    found = []
+    for (family, operation, tracing), ratio in sorted(current.items()):
+        previous_ratio = previous.get((family, operation, tracing))
+        if previous_ratio and ratio > previous_ratio * threshold:
+            key = (family, operation, 'ocredis', tracing)
+            found.append((by_key[key], previous_by_key[key]))
+    return found
+
+
+def format_report(report):
+    ratios = overheads(report)
+    lines = ['%-10s %-18s %-8s %-8s %12s %9s %12s %8s' % ('family', 'operation', 'client', 'tracing',
+            'ns/call', 'overhead', 'bytes/call', 'blocks')]
+    for result in report['results']:
+        ratio = ratios.get((result['family'], result['operation'], result['tracing']))
+        lines.append('%-10s %-18s %-8s %-8s %12.0f %9s %12.0f %8.3f' % (result['family'], result['operation'],
+                result['client'], result['tracing'], result['ns_per_call'],
+                '' if result['client'] == 'redis' or ratio is None else 'x%.2f' % ratio,
+                result['alloc_bytes_per_call'], result['blocks_per_call']))
+    fast_path = report.get('fast_path')
+    if fast_path:
+        lines.append('fast path overhead: %.0fns/call idle, %.0fns/call recording' % (fast_path['idle_ns'],
+                fast_path['recording_ns']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the overhead of OcRedis over redis.Redis.')
+    parser.add_argument('--iterations', type=int, default=2000, help='calls per repeat')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--alloc-iterations', type=int, default=200, help='calls traced by tracemalloc')
+    parser.add_argument('--family', action='append', help='only run the operations of this family')
+    parser.add_argument('--output', help='save the results as JSON to this file')
+    parser.add_argument('--compare', help='compare the results with those of this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.1,
+            help='the overhead relative to the compared results that counts as a regression')
+    args = parser.parse_args(argv)
+
+    report = run(args.iterations, args.repeats, args.alloc_iterations, args.family)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.threshold)
+        for result, previous in found:
+            print('regression: %s %s tracing=%s %.0fns/call, was %.0fns/call' % (result['family'],
+                    result['operation'], result['tracing'], result['ns_per_call'], previous['ns_per_call']))
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
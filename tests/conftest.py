@@ -0,0 +1,48 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from opencensus.trace import execution_context
+from opencensus.trace.samplers import AlwaysOnSampler
+from opencensus.trace.tracer import Tracer
+from opencensus.trace.tracers import noop_tracer
+from opencensus.stats import stats
+from opencensus.stats.measure_to_view_map import MeasureToViewMap
+
+from tests.fakes import RetainerTraceExporter
+
+
+@pytest.fixture
+def fresh_stats(monkeypatch):
+    """
+    fresh_stats swaps in an empty MeasureToViewMap and a NoopTracer so that
+    views and tracers installed by other tests don't leak in.
+    """
+    monkeypatch.setattr(stats.stats.view_manager, '_measure_view_map', MeasureToViewMap())
+    previous_tracer = execution_context.get_opencensus_tracer()
+    execution_context.set_opencensus_tracer(noop_tracer.NoopTracer())
+    yield stats.stats.view_manager
+    execution_context.set_opencensus_tracer(previous_tracer)
+
+
+@pytest.fixture
+def span_retainer(fresh_stats):
+    """
+    span_retainer installs an always sampling tracer whose spans are retained.
+    """
+    retainer = RetainerTraceExporter()
+    Tracer(sampler=AlwaysOnSampler(), exporter=retainer)
+    yield retainer
+    execution_context.set_opencensus_tracer(noop_tracer.NoopTracer())
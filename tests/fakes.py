@@ -0,0 +1,816 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import fnmatch
+import hashlib
+import itertools
+import socketserver
+import threading
+import time
+
+import redis
+from redis.crc import REDIS_CLUSTER_HASH_SLOTS, key_slot
+from redis.exceptions import NoScriptError, ResponseError
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+class RetainerTraceExporter(object):
+    def __init__(self):
+        self.__spans = []
+
+    def export(self, span_data_list):
+        self.__spans.extend(span_data_list)
+
+    def emit(self, span_data_list):
+        self.__spans.extend(span_data_list)
+
+    def spans(self):
+        return self.__spans
+
+
+# The keys that each tracked read and each write command of FakeServer
+# touches, for client side caching.
+_TRACKED_READS = {
+    b'GET': lambda args: args[1:2],
+    b'MGET': lambda args: args[1:],
+    b'HGET': lambda args: args[1:2],
+    b'HGETALL': lambda args: args[1:2],
+}
+_WRITES = {
+    b'SET': lambda args: args[1:2],
+    b'MSET': lambda args: args[1::2],
+    b'DEL': lambda args: args[1:],
+    b'INCR': lambda args: args[1:2],
+    b'INCRBY': lambda args: args[1:2],
+    b'HSET': lambda args: args[1:2],
+    b'SADD': lambda args: args[1:2],
+    b'RPUSH': lambda args: args[1:2],
+    b'ZADD': lambda args: args[1:2],
+}
+
+INVALIDATE_CHANNEL = b'__redis__:invalidate'
+
+
+def _lock_script_sha(script):
+    return hashlib.sha1(script.encode('utf-8')).hexdigest().encode('ascii')
+
+
+# The scripts of redis.lock.Lock by SHA1 digest, as functions of the server
+# data, keys and arguments. Lock timeouts aren't emulated, only ownership.
+_LOCK_SCRIPTS = {
+    _lock_script_sha(redis.lock.Lock.LUA_RELEASE_SCRIPT):
+        lambda data, keys, args: int(data.get(keys[0]) == args[0] and data.pop(keys[0]) is not None),
+    _lock_script_sha(redis.lock.Lock.LUA_EXTEND_SCRIPT):
+        lambda data, keys, args: int(data.get(keys[0]) == args[0]),
+    _lock_script_sha(redis.lock.Lock.LUA_REACQUIRE_SCRIPT):
+        lambda data, keys, args: int(data.get(keys[0]) == args[0]),
+}
+
+
+class FakeServer(object):
+    """
+    FakeServer executes a small subset of Redis commands against a dict.
+
+    Connections that enable CLIENT TRACKING with a REDIRECT have invalidation
+    messages for the keys they read pushed to the redirect connection, as
+    long as it is subscribed to __redis__:invalidate.
+
+    Scripts are loaded by SHA1 digest but not run, EVALSHA replies with the
+    keys and arguments it was given instead, except for those of
+    redis.lock.Lock, which are emulated. Scripts starting with '!' fail to
+    compile.
+
+    Streams only support XADD with an ID, consumer groups created from the
+    start of a stream and the summary form of XPENDING.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.subscribers = collections.defaultdict(set)
+        self.pattern_subscribers = collections.defaultdict(set)
+        self.clients = {}
+        self.tracking = {}
+        self.tracked_keys = collections.defaultdict(set)
+        self.scripts = {}
+        self.groups = {}
+        self._client_ids = itertools.count(1)
+
+    def execute(self, args, connection=None):
+        command = args[0].upper()
+        handler = getattr(self, '_' + command.decode('ascii').lower(), None)
+        if handler is None:
+            return ResponseError("unknown command '%s'" % command.decode('ascii'))
+        try:
+            reply = handler(*args[1:])
+        except TypeError:
+            return ResponseError("wrong number of arguments for '%s' command" % command.decode('ascii'))
+
+        if connection in self.tracking and command in _TRACKED_READS:
+            for key in _TRACKED_READS[command](args):
+                self.tracked_keys[key].add(connection)
+        if command in _WRITES and not isinstance(reply, ResponseError):
+            for key in _WRITES[command](args):
+                self.invalidate(key)
+        return reply
+
+    def client(self, connection, args):
+        """
+        client executes the CLIENT ID and CLIENT TRACKING commands of connection.
+        """
+        subcommand = args[1].upper() if len(args) > 1 else b''
+        if subcommand == b'ID':
+            for client_id, each in self.clients.items():
+                if each is connection:
+                    return client_id
+            client_id = next(self._client_ids)
+            self.clients[client_id] = connection
+            return client_id
+        if subcommand == b'TRACKING' and len(args) > 2:
+            if args[2].upper() == b'OFF':
+                self.tracking.pop(connection, None)
+                return b'OK'
+            redirect = None
+            if len(args) > 4 and args[3].upper() == b'REDIRECT':
+                redirect = self.clients.get(int(args[4]))
+                if redirect is None:
+                    return ResponseError('The client ID you want redirect to does not exist')
+            self.tracking[connection] = redirect
+            return b'OK'
+        return ResponseError("unknown subcommand '%s'" % subcommand.decode('ascii'))
+
+    def invalidate(self, key):
+        for connection in self.tracked_keys.pop(key, ()):
+            redirect = self.tracking.get(connection)
+            if redirect is not None and redirect in self.subscribers.get(INVALIDATE_CHANNEL, ()):
+                redirect.push([b'message', INVALIDATE_CHANNEL, [key]])
+
+    def forget(self, connection):
+        """
+        forget drops every subscription, tracking and client id of connection.
+        """
+        for each in list(self.subscribers.values()) + list(self.pattern_subscribers.values()):
+            each.discard(connection)
+        self.tracking.pop(connection, None)
+        for client_id, each in list(self.clients.items()):
+            if each is connection:
+                del self.clients[client_id]
+
+    def _scan_page(self, items, cursor, options):
+        """
+        _scan_page returns the page of items at cursor, which is simply an
+        index into items, as per the COUNT and MATCH options.
+        """
+        count, match = 10, None
+        for i in range(0, len(options) - 1, 2):
+            option = options[i].upper()
+            if option == b'COUNT':
+                count = int(options[i + 1])
+            elif option == b'MATCH':
+                match = options[i + 1]
+        start = int(cursor)
+        page = items[start:start + count]
+        if match is not None:
+            page = [item for item in page if fnmatch.fnmatchcase(item[0] if isinstance(item, tuple) else item, match)]
+        next_cursor = start + count if start + count < len(items) else 0
+        return next_cursor, page
+
+    def _scan(self, cursor, *options):
+        next_cursor, page = self._scan_page(sorted(self.data), cursor, options)
+        return [str(next_cursor).encode('ascii'), page]
+
+    def _hscan(self, key, cursor, *options):
+        next_cursor, page = self._scan_page(sorted(self.data.get(key, {}).items()), cursor, options)
+        return [str(next_cursor).encode('ascii'), [each for pair in page for each in pair]]
+
+    def _sscan(self, key, cursor, *options):
+        next_cursor, page = self._scan_page(sorted(self.data.get(key, ())), cursor, options)
+        return [str(next_cursor).encode('ascii'), page]
+
+    def _zadd(self, key, *pairs):
+        scores = self.data.setdefault(key, {})
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i + 1] not in scores
+            scores[pairs[i + 1]] = pairs[i]
+        return added
+
+    def _zscan(self, key, cursor, *options):
+        next_cursor, page = self._scan_page(sorted(self.data.get(key, {}).items()), cursor, options)
+        return [str(next_cursor).encode('ascii'), [each for pair in page for each in pair]]
+
+    def subscribe(self, connection, args):
+        """
+        subscribe (un)subscribes connection from the channels or patterns in
+        args and returns the replies, one per channel or pattern, to send it.
+        """
+        command = args[0].lower()
+        subscribers = self.pattern_subscribers if command.startswith(b'p') else self.subscribers
+        replies = []
+        for channel in args[1:] or [channel for channel, each in subscribers.items() if connection in each]:
+            if command.endswith(b'unsubscribe'):
+                subscribers[channel].discard(connection)
+            else:
+                subscribers[channel].add(connection)
+            subscriptions = sum(connection in each for each in self.subscribers.values())
+            subscriptions += sum(connection in each for each in self.pattern_subscribers.values())
+            replies.append([command, channel, subscriptions])
+        return replies
+
+    def _publish(self, channel, message):
+        receivers = 0
+        for connection in list(self.subscribers.get(channel, ())):
+            connection.push([b'message', channel, message])
+            receivers += 1
+        for pattern, connections in list(self.pattern_subscribers.items()):
+            if fnmatch.fnmatchcase(channel, pattern):
+                for connection in list(connections):
+                    connection.push([b'pmessage', pattern, channel, message])
+                    receivers += 1
+        return receivers
+
+    def _script(self, subcommand, *args):
+        subcommand = subcommand.upper()
+        if subcommand == b'LOAD':
+            if args[0].startswith(b'!'):
+                return ResponseError('Error compiling script (new function): user_script:1: unexpected symbol')
+            sha = hashlib.sha1(args[0]).hexdigest().encode('ascii')
+            self.scripts[sha] = args[0]
+            return sha
+        if subcommand == b'EXISTS':
+            return [int(sha in self.scripts) for sha in args]
+        if subcommand == b'FLUSH':
+            self.scripts.clear()
+            return b'OK'
+        return ResponseError("unknown subcommand '%s'" % subcommand.decode('ascii'))
+
+    def _eval(self, script, numkeys, *keys_and_args):
+        sha = self._script(b'LOAD', script)
+        if isinstance(sha, ResponseError):
+            return sha
+        return self._evalsha(sha, numkeys, *keys_and_args)
+
+    def _evalsha(self, sha, numkeys, *keys_and_args):
+        if sha not in self.scripts:
+            return NoScriptError('No matching script. Please use EVAL.')
+        if sha in _LOCK_SCRIPTS:
+            numkeys = int(numkeys)
+            return _LOCK_SCRIPTS[sha](self.data, keys_and_args[:numkeys], keys_and_args[numkeys:])
+        return list(keys_and_args)
+
+    def _xadd(self, key, entry_id, *fields):
+        if entry_id == b'*':
+            entry_id = b'%d-0' % int(time.time() * 1e3)
+        self.data.setdefault(key, []).append((entry_id, list(fields)))
+        return entry_id
+
+    def _xgroup(self, subcommand, key, group, *args):
+        if subcommand.upper() != b'CREATE':
+            return ResponseError("unknown subcommand '%s'" % subcommand.decode('ascii'))
+        self.data.setdefault(key, [])
+        self.groups[(key, group)] = {'delivered': 0, 'pending': collections.OrderedDict()}
+        return b'OK'
+
+    def _xreadgroup(self, *args):
+        # XREADGROUP GROUP group consumer [COUNT count] [BLOCK ms] [NOACK] STREAMS key [key ...] id [id ...]
+        group, consumer, count = args[1], args[2], None
+        options = [each.upper() for each in args]
+        if b'COUNT' in options:
+            count = int(args[options.index(b'COUNT') + 1])
+        streams = args[options.index(b'STREAMS') + 1:]
+        reply = []
+        for key, entry_id in zip(streams[:len(streams) // 2], streams[len(streams) // 2:]):
+            state = self.groups.get((key, group))
+            if state is None:
+                return ResponseError('NOGROUP No such key or consumer group')
+            entries = self.data.get(key, [])
+            if entry_id == b'>':
+                entries = entries[state['delivered']:][:count]
+                state['delivered'] += len(entries)
+                for each in entries:
+                    state['pending'][each[0]] = consumer
+            else:
+                entries = [each for each in entries if each[0] in state['pending']][:count]
+            if entries:
+                reply.append([key, [list(each) for each in entries]])
+        return reply or None
+
+    def _xack(self, key, group, *entry_ids):
+        pending = self.groups.get((key, group), {}).get('pending', {})
+        return sum(1 for entry_id in entry_ids if pending.pop(entry_id, None) is not None)
+
+    def _xclaim(self, key, group, consumer, min_idle_time, *args):
+        pending = self.groups.get((key, group), {}).get('pending', {})
+        claimed = [entry_id for entry_id in args if entry_id in pending]
+        for entry_id in claimed:
+            pending[entry_id] = consumer
+        if b'JUSTID' in (each.upper() for each in args):
+            return claimed
+        return [list(each) for each in self.data.get(key, []) if each[0] in claimed]
+
+    def _xpending(self, key, group):
+        pending = self.groups.get((key, group), {}).get('pending', {})
+        if not pending:
+            return [0, None, None, None]
+        consumers = collections.Counter(pending.values())
+        return [len(pending), min(pending), max(pending), [[name, count] for name, count in consumers.items()]]
+
+    def _ping(self):
+        return b'PONG'
+
+    def _echo(self, message):
+        return message
+
+    def _get(self, key):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, bytes):
+            return ResponseError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def _set(self, key, value, *options):
+        if b'NX' in (option.upper() for option in options) and key in self.data:
+            return None
+        self.data[key] = value
+        return b'OK'
+
+    def _mget(self, *keys):
+        # Like Redis, MGET replies nil for the keys that don't hold strings.
+        values = [self.data.get(key) for key in keys]
+        return [value if isinstance(value, bytes) else None for value in values]
+
+    def _mset(self, *pairs):
+        for i in range(0, len(pairs), 2):
+            self.data[pairs[i]] = pairs[i + 1]
+        return b'OK'
+
+    def _del(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def _incr(self, key):
+        return self._incrby(key)
+
+    def _incrby(self, key, amount=b'1'):
+        try:
+            value = int(self.data.get(key, b'0')) + int(amount)
+        except ValueError:
+            return ResponseError('value is not an integer or out of range')
+        self.data[key] = str(value).encode('ascii')
+        return value
+
+    def _hset(self, key, *pairs):
+        mapping = self.data.setdefault(key, {})
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i] not in mapping
+            mapping[pairs[i]] = pairs[i + 1]
+        return added
+
+    def _hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def _hgetall(self, key):
+        reply = []
+        for field, value in self.data.get(key, {}).items():
+            reply.extend([field, value])
+        return reply
+
+    def _sadd(self, key, *members):
+        members_set = self.data.setdefault(key, set())
+        added = len(set(members) - members_set)
+        members_set.update(members)
+        return added
+
+    def _smembers(self, key):
+        return list(self.data.get(key, ()))
+
+    def _rpush(self, key, *values):
+        items = self.data.setdefault(key, [])
+        items.extend(values)
+        return len(items)
+
+    def _blpop(self, *keys_and_timeout):
+        # Nothing blocks, BLPOP times out right away if every list is empty.
+        for key in keys_and_timeout[:-1]:
+            items = self.data.get(key)
+            if items:
+                return [key, items.pop(0)]
+        return None
+
+    def _lrange(self, key, start, stop):
+        items = self.data.get(key, [])
+        start, stop = int(start), int(stop)
+        if stop < 0:
+            stop += len(items)
+        return items[start:stop + 1]
+
+
+class CountingServer(FakeServer):
+    """
+    CountingServer records the commands it executes.
+    """
+
+    def __init__(self):
+        super(CountingServer, self).__init__()
+        self.commands = []
+
+    def execute(self, args, connection=None):
+        self.commands.append([arg.decode('utf-8') for arg in args])
+        return super(CountingServer, self).execute(args, connection)
+
+
+# The arity, flags and key positions that COMMAND reports, as far as the
+# commands sent to FakeClusterNodes go.
+_CLUSTER_COMMANDS = {
+    b'asking': (1, [b'fast'], 0, 0, 0),
+    b'client': (-2, [], 0, 0, 0),
+    b'cluster': (-2, [], 0, 0, 0),
+    b'command': (-1, [], 0, 0, 0),
+    b'del': (-2, [b'write'], 1, -1, 1),
+    b'exists': (-2, [b'readonly'], 1, -1, 1),
+    b'get': (2, [b'readonly'], 1, 1, 1),
+    b'incr': (2, [b'write'], 1, 1, 1),
+    b'incrby': (3, [b'write'], 1, 1, 1),
+    b'mget': (-2, [b'readonly'], 1, -1, 1),
+    b'mset': (-3, [b'write'], 1, -1, 2),
+    b'ping': (-1, [], 0, 0, 0),
+    b'set': (-3, [b'write'], 1, 1, 1),
+}
+
+
+def _command_keys(args):
+    arity, flags, first, last, step = _CLUSTER_COMMANDS.get(args[0].lower(), (0, [], 0, 0, 0))
+    if not first:
+        return []
+    if last < 0:
+        last += len(args)
+    return args[first:last + 1:step]
+
+
+class FakeClusterNode(FakeServer):
+    """
+    FakeClusterNode is a FakeServer that serves the slots of a FakeCluster
+    that it owns, replying MOVED to commands for keys of other slots and ASK
+    to those for keys it doesn't hold of slots that it's migrating.
+    """
+
+    def __init__(self, cluster):
+        super(FakeClusterNode, self).__init__()
+        self.cluster = cluster
+        self.port = None
+        self.asking = set()
+
+    @property
+    def name(self):
+        return '127.0.0.1:%d' % self.port
+
+    def execute(self, args, connection=None):
+        command = args[0].upper()
+        if command == b'ASKING':
+            self.asking.add(connection)
+            return b'OK'
+        asking = connection in self.asking
+        self.asking.discard(connection)
+
+        slots = set(key_slot(key) for key in _command_keys(args))
+        if len(slots) > 1:
+            return ResponseError("CROSSSLOT Keys in request don't hash to the same slot")
+        if slots:
+            slot = slots.pop()
+            owner = self.cluster.owners[slot]
+            target = self.cluster.migrating.get(slot)
+            if owner is self:
+                if target is not None and not all(key in self.data for key in _command_keys(args)):
+                    return ResponseError('ASK %d %s' % (slot, target.name))
+            elif not (asking and target is self):
+                return ResponseError('MOVED %d %s' % (slot, owner.name))
+        return super(FakeClusterNode, self).execute(args, connection)
+
+    def _cluster(self, subcommand, *args):
+        if subcommand.upper() != b'SLOTS':
+            return ResponseError('unknown subcommand')
+        return self.cluster.slots_reply()
+
+    def _command(self, *args):
+        return [[name] + list(spec) for name, spec in sorted(_CLUSTER_COMMANDS.items())]
+
+
+def _parse_packed_commands(packed):
+    """
+    _parse_packed_commands splits RESP arrays of bulk strings back into lists of arguments.
+    """
+    if not isinstance(packed, bytes):
+        packed = b''.join(packed)
+
+    commands = []
+    position = 0
+    while position < len(packed):
+        end = packed.index(b'\r\n', position)
+        count = int(packed[position + 1:end])
+        position = end + 2
+        args = []
+        for i in range(count):
+            end = packed.index(b'\r\n', position)
+            length = int(packed[position + 1:end])
+            position = end + 2
+            args.append(packed[position:position + length])
+            position += length + 2
+        commands.append(args)
+    return commands
+
+
+_SUBSCRIBE_COMMANDS = frozenset([b'SUBSCRIBE', b'UNSUBSCRIBE', b'PSUBSCRIBE', b'PUNSUBSCRIBE'])
+
+
+class _FakeReplies(object):
+    """
+    _FakeReplies has a FakeServer execute the commands sent on a connection,
+    including MULTI/EXEC transactions, and queues up the replies.
+    """
+
+    def _init_fake(self, server):
+        self.server = server if server is not None else FakeServer()
+        self._replies = collections.deque()
+        self._queued = None
+
+    def _send_fake(self, packed):
+        for command_args in _parse_packed_commands(packed):
+            if command_args[0].upper() in _SUBSCRIBE_COMMANDS:
+                self._replies.extend(self.server.subscribe(self, command_args))
+            else:
+                self._replies.append(self._execute(command_args))
+
+    def push(self, message):
+        """
+        push delivers a message that the server sends of its own accord,
+        e.g. a Pub/Sub message.
+        """
+        self._replies.append(message)
+
+    def _execute(self, args):
+        command = args[0].upper()
+        if command == b'MULTI':
+            self._queued = []
+            return b'OK'
+        if command == b'EXEC':
+            queued, self._queued = self._queued, None
+            return [self.server.execute(each_args, self) for each_args in queued]
+        if self._queued is not None:
+            self._queued.append(args)
+            return b'QUEUED'
+        if command == b'CLIENT':
+            return self.server.client(self, args)
+        return self.server.execute(args, self)
+
+    def _next_reply(self):
+        reply = self._replies.popleft()
+        if isinstance(reply, ResponseError):
+            raise reply
+        return reply
+
+
+class FakeConnection(_FakeReplies, redis.Connection):
+    """
+    FakeConnection is a redis-py Connection that never touches the network
+    and instead has a FakeServer reply to every command it sends.
+    """
+
+    def __init__(self, server=None, **kwargs):
+        super(FakeConnection, self).__init__(**kwargs)
+        self._init_fake(server)
+
+    def connect(self):
+        pass
+
+    def disconnect(self, *args, **kwargs):
+        pass
+
+    def send_packed_command(self, command, *args, **kwargs):
+        self._send_fake(command)
+
+    def can_read(self, timeout=0):
+        if not self._replies and timeout:
+            time.sleep(timeout)
+        return bool(self._replies)
+
+    def read_response(self, *args, **kwargs):
+        return self._next_reply()
+
+
+def fake_connection_pool(server=None, pool_class=redis.ConnectionPool, **kwargs):
+    return pool_class(connection_class=FakeConnection, server=server or FakeServer(), **kwargs)
+
+
+if aioredis is not None:
+    class FakeAsyncConnection(_FakeReplies, aioredis.Connection):
+        """
+        FakeAsyncConnection is the redis.asyncio counterpart of FakeConnection.
+        Each reply is delayed by latency seconds so that commands stay in flight.
+        """
+
+        def __init__(self, server=None, latency=0, **kwargs):
+            super(FakeAsyncConnection, self).__init__(**kwargs)
+            self._init_fake(server)
+            self.latency = latency
+
+        async def connect(self):
+            pass
+
+        async def disconnect(self, *args, **kwargs):
+            pass
+
+        async def can_read_destructive(self):
+            return False
+
+        async def send_packed_command(self, command, *args, **kwargs):
+            self._send_fake(command)
+
+        async def read_response(self, *args, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._next_reply()
+
+    def fake_async_connection_pool(server=None, latency=0):
+        return aioredis.ConnectionPool(connection_class=FakeAsyncConnection,
+                server=server or FakeServer(), latency=latency)
+
+
+def encode_reply(reply):
+    """
+    encode_reply encodes reply as per the RESP2 protocol.
+    """
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, ResponseError):
+        message = str(reply)
+        if isinstance(reply, NoScriptError):
+            message = 'NOSCRIPT ' + message
+        elif not message.split(' ', 1)[0].isupper():
+            message = 'ERR ' + message
+        return b'-' + message.encode('utf-8') + b'\r\n'
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if reply in (b'OK', b'PONG', b'QUEUED'):
+        return b'+' + reply + b'\r\n'
+    if isinstance(reply, str):
+        reply = reply.encode('utf-8')
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(encode_reply(each) for each in reply)
+
+
+class _RespHandler(_FakeReplies, socketserver.StreamRequestHandler):
+    def handle(self):
+        latency = self.server.latency
+        # From here on self.server is the FakeServer rather than the socketserver.
+        self._init_fake(self.server.fake)
+        self._write_lock = threading.Lock()
+        try:
+            self._serve(latency)
+        finally:
+            self.server.forget(self)
+
+    def _serve(self, latency):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for i in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            if args[0].upper() in _SUBSCRIBE_COMMANDS:
+                replies = self.server.subscribe(self, args)
+            else:
+                replies = [self._execute(args)]
+            if latency:
+                time.sleep(latency)
+            with self._write_lock:
+                self.wfile.write(b''.join(encode_reply(reply) for reply in replies))
+
+    def push(self, message):
+        try:
+            with self._write_lock:
+                self.wfile.write(encode_reply(message))
+        except (OSError, ValueError):
+            pass
+
+
+class _TCPRespHandler(_RespHandler):
+    # Replies are written one at a time, which Nagle's algorithm would hold
+    # back behind delayed ACKs, e.g. for the replies of pipelines.
+    disable_nagle_algorithm = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class RespServer(object):
+    """
+    RespServer serves a FakeServer over RESP on a local TCP port, or on the
+    unix socket at path, from a background thread. Each reply is delayed by
+    latency seconds.
+    """
+
+    def __init__(self, server=None, latency=0, path=None):
+        if path is None:
+            self._server = _TCPServer(('127.0.0.1', 0), _TCPRespHandler)
+            self.port = self._server.server_address[1]
+        else:
+            self._server = _UnixServer(path, _RespHandler)
+            self.port = None
+        self.path = path
+        self._server.fake = server if server is not None else FakeServer()
+        self._server.latency = latency
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+class FakeCluster(object):
+    """
+    FakeCluster serves the hash slots of Redis Cluster from a number of
+    FakeClusterNodes, each on a RespServer of its own, that own an even
+    share of the slots to begin with. Each reply is delayed by latency seconds.
+    """
+
+    def __init__(self, nodes=3, latency=0):
+        self.nodes = [FakeClusterNode(self) for _ in range(nodes)]
+        self.owners = [self.nodes[slot * nodes // REDIS_CLUSTER_HASH_SLOTS]
+                for slot in range(REDIS_CLUSTER_HASH_SLOTS)]
+        self.migrating = {}
+        self._servers = [RespServer(node, latency) for node in self.nodes]
+        for node, server in zip(self.nodes, self._servers):
+            node.port = server.port
+
+    def __enter__(self):
+        for server in self._servers:
+            server.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        for server in self._servers:
+            server.__exit__(*args)
+
+    def owner_of(self, key):
+        return self.owners[key_slot(key)]
+
+    def _keys_of(self, node, slot):
+        return [key for key in node.data if key_slot(key) == slot]
+
+    def migrate(self, slot, node):
+        """
+        migrate starts migrating slot to node, moving its keys over, so
+        that commands for them are answered with ASK.
+        """
+        owner = self.owners[slot]
+        for key in self._keys_of(owner, slot):
+            node.data[key] = owner.data.pop(key)
+        self.migrating[slot] = node
+
+    def move_slot(self, slot, node):
+        """
+        move_slot hands slot and its keys over to node, so that commands for
+        them are answered with MOVED by the node that owned it.
+        """
+        self.migrate(slot, node)
+        del self.migrating[slot]
+        self.owners[slot] = node
+
+    def slots_reply(self):
+        reply = []
+        for slot, owner in enumerate(self.owners):
+            if reply and reply[-1][2][1] == owner.port and reply[-1][1] == slot - 1:
+                reply[-1][1] = slot
+            else:
+                reply.append([slot, slot, [b'127.0.0.1', owner.port, owner.name.encode()]])
+        return reply
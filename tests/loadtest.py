@@ -0,0 +1,286 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Load tests of OcRedis against a local RESP server, see tests.fakes.RespServer,
+which replies to every command after an injected latency.
+
+A mixed workload of GET, SET, HGET, HSET, MGET and pipelines is driven from
+many threads, optionally in several processes, first through redis.Redis and
+then through OcRedis. The throughput of either run is reported, along with
+the p50, p99 and p999 latencies per method as recorded in the redispy/latency
+measure by ocredis itself, and the share of the client CPU time that goes to
+instrumentation: the extra CPU time per operation of OcRedis over redis.Redis,
+as measured per worker thread so that the server isn't counted.
+
+    python -m tests.loadtest --threads 16 --duration 10 --latency 0.0005
+    python -m tests.loadtest --processes 4 --threads 8 --payload 4096 --output load.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+
+import redis
+from opencensus.stats import stats
+
+import ocredis
+from ocredis import observability
+from tests.fakes import FakeServer, RespServer
+
+# The operations of the default workload, by weight.
+DEFAULT_MIX = {'get': 60, 'set': 20, 'hget': 10, 'hset': 4, 'mget': 4, 'pipeline': 2}
+
+# The percentiles are estimated from the redispy/latency view, whose default
+# buckets are fine enough for a local server.
+LATENCY_BOUNDS = observability.DEFAULT_LATENCY_BUCKETS
+
+PERCENTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+
+def _operations(client, keyspace, payload):
+    value = b'x' * payload
+    return {
+        'get': lambda rng: client.get('key:%d' % rng.randrange(keyspace)),
+        'set': lambda rng: client.set('key:%d' % rng.randrange(keyspace), value),
+        'hget': lambda rng: client.hget('hash:%d' % rng.randrange(keyspace), 'field'),
+        'hset': lambda rng: client.hset('hash:%d' % rng.randrange(keyspace), 'field', value),
+        'mget': lambda rng: client.mget(['key:%d' % rng.randrange(keyspace) for i in range(10)]),
+        'pipeline': lambda rng: _pipeline(client, rng, keyspace, value),
+    }
+
+
+def _pipeline(client, rng, keyspace, value):
+    pipe = client.pipeline(transaction=False)
+    for i in range(10):
+        pipe.set('key:%d' % rng.randrange(keyspace), value)
+    return pipe.execute()
+
+
+def _drive(client, config, seed):
+    """
+    _drive runs the workload of config on client from config['threads']
+    threads, for config['duration'] seconds, and returns the number of
+    operations, errors and the CPU seconds of the threads.
+    """
+    operations = _operations(client, config['keyspace'], config['payload'])
+    mix = sorted(config['mix'].items())
+    names = [name for name, weight in mix]
+    weights = [weight for name, weight in mix]
+    totals = {'operations': 0, 'errors': 0, 'cpu_seconds': 0.0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(config['threads'])
+
+    def work(i):
+        rng = random.Random(seed * 1000 + i)
+        chosen = rng.choices(names, weights, k=4096)
+        done = errors = 0
+        barrier.wait()
+        deadline = time.time() + config['duration']
+        cpu_start = time.thread_time()
+        while time.time() < deadline:
+            try:
+                operations[chosen[done % len(chosen)]](rng)
+            except redis.RedisError:
+                errors += 1
+            done += 1
+        cpu_seconds = time.thread_time() - cpu_start
+        with lock:
+            totals['operations'] += done
+            totals['errors'] += errors
+            totals['cpu_seconds'] += cpu_seconds
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(config['threads'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return totals
+
+
+def _make_client(client_name, config):
+    client_class = ocredis.OcRedis if client_name == 'ocredis' else redis.Redis
+    return client_class(host='127.0.0.1', port=config['port'], max_connections=config['threads'] * 2)
+
+
+def latency_buckets():
+    """
+    latency_buckets returns the bucket counts of the latencies recorded per method.
+    """
+    view_data = stats.stats.view_manager.get_view('redispy/latency')
+    by_method = {}
+    for tag_values, data in view_data.tag_value_aggregation_data_map.items():
+        counts = by_method.setdefault(tag_values[0], [0] * len(data.counts_per_bucket))
+        for i, count in enumerate(data.counts_per_bucket):
+            counts[i] += count
+    return by_method
+
+
+def _run_in_process(client_name, config, seed):
+    client = _make_client(client_name, config)
+    try:
+        totals = _drive(client, config, seed)
+    finally:
+        client.connection_pool.disconnect()
+    if client_name == 'ocredis':
+        ocredis.flush_aggregation()
+        totals['latency_buckets'] = latency_buckets()
+    return totals
+
+
+def _process_main(client_name, config, seed, results):
+    ocredis.register_views()
+    results.put(_run_in_process(client_name, config, seed))
+
+
+def _run(client_name, config):
+    if not config['processes']:
+        return _run_in_process(client_name, config, 0)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=_process_main, args=(client_name, config, seed, results))
+            for seed in range(config['processes'])]
+    for process in processes:
+        process.start()
+    merged = {'operations': 0, 'errors': 0, 'cpu_seconds': 0.0, 'latency_buckets': {}}
+    for process in processes:
+        totals = results.get()
+        for name in ('operations', 'errors', 'cpu_seconds'):
+            merged[name] += totals[name]
+        for method, counts in totals.get('latency_buckets', {}).items():
+            previous = merged['latency_buckets'].get(method, [0] * len(counts))
+            merged['latency_buckets'][method] = [a + b for a, b in zip(previous, counts)]
+    for process in processes:
+        process.join()
+    return merged
+
+
+def percentile(counts, bounds, fraction):
+    """
+    percentile estimates the given fraction of the samples bucketed into
+    counts by bounds, interpolating linearly within buckets. Samples beyond
+    the last bound count as the last bound.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if i >= len(bounds):
+                return bounds[-1]
+            lower = bounds[i - 1] if i else 0.0
+            return lower + (bounds[i] - lower) * (rank - seen) / count
+        seen += count
+    return bounds[-1]
+
+
+def _summary(totals, config):
+    operations = totals['operations']
+    return {
+        'operations': operations,
+        'errors': totals['errors'],
+        'throughput': operations / config['duration'],
+        'cpu_us_per_operation': totals['cpu_seconds'] / operations * 1e6 if operations else None,
+    }
+
+
+def run(threads=8, processes=0, duration=5.0, latency=0.0, payload=100, keyspace=1000, mix=None):
+    """
+    run load tests redis.Redis and then OcRedis as per its arguments against
+    a local RespServer, and returns the report as a dict ready to be saved as JSON.
+    """
+    ocredis.register_views()
+    server = FakeServer()
+    value = b'x' * payload
+    for i in range(keyspace):
+        server.data[b'key:%d' % i] = value
+        server.data[b'hash:%d' % i] = {b'field': value}
+
+    config = {'threads': threads, 'processes': processes, 'duration': duration, 'latency': latency,
+            'payload': payload, 'keyspace': keyspace, 'mix': dict(mix or DEFAULT_MIX)}
+    with RespServer(server, latency=latency) as resp_server:
+        config['port'] = resp_server.port
+        baseline = _run('redis', config)
+        instrumented = _run('ocredis', config)
+
+    report = {
+        'config': dict((name, value) for name, value in config.items() if name != 'port'),
+        'redis': _summary(baseline, config),
+        'ocredis': _summary(instrumented, config),
+        'latency_ms': {},
+        'instrumentation_cpu_share': None,
+    }
+    for method, counts in sorted(instrumented['latency_buckets'].items()):
+        report['latency_ms'][method] = dict([('count', sum(counts))] +
+                [(name, percentile(counts, LATENCY_BOUNDS, fraction)) for name, fraction in PERCENTILES])
+
+    base_cpu, instrumented_cpu = report['redis']['cpu_us_per_operation'], report['ocredis']['cpu_us_per_operation']
+    if base_cpu and instrumented_cpu:
+        report['instrumentation_cpu_share'] = max(instrumented_cpu - base_cpu, 0.0) / instrumented_cpu
+    return report
+
+
+def format_report(report):
+    lines = []
+    for client_name in ('redis', 'ocredis'):
+        summary = report[client_name]
+        lines.append('%-8s %10.0f ops/s %8.1f us CPU/op %d errors' % (client_name, summary['throughput'],
+                summary['cpu_us_per_operation'] or 0, summary['errors']))
+    if report['instrumentation_cpu_share'] is not None:
+        lines.append('instrumentation CPU share: %.1f%%' % (report['instrumentation_cpu_share'] * 100))
+    lines.append('%-32s %8s %10s %10s %10s' % ('method', 'count', 'p50 ms', 'p99 ms', 'p999 ms'))
+    for method, latency in sorted(report['latency_ms'].items()):
+        lines.append('%-32s %8d %10.3f %10.3f %10.3f' % (method, latency['count'],
+                latency['p50'], latency['p99'], latency['p999']))
+    return '\n'.join(lines)
+
+
+def _mix(value):
+    mix = {}
+    for each in value.split(','):
+        name, weight = each.split('=')
+        mix[name] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load tests OcRedis against a local RESP server.')
+    parser.add_argument('--threads', type=int, default=8, help='worker threads per process')
+    parser.add_argument('--processes', type=int, default=0,
+            help='worker processes, or 0 to run the threads in this process')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per client')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the server waits per reply')
+    parser.add_argument('--payload', type=int, default=100, help='bytes per value')
+    parser.add_argument('--keyspace', type=int, default=1000)
+    parser.add_argument('--mix', type=_mix, help='operation weights, e.g. get=80,set=20')
+    parser.add_argument('--output', help='save the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.threads, args.processes, args.duration, args.latency, args.payload, args.keyspace, args.mix)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
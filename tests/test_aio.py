@@ -0,0 +1,178 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('redis.asyncio')
+
+from opencensus.trace import execution_context
+
+import ocredis
+from ocredis.aio import OcAsyncPipeline, OcAsyncRedis
+from tests.fakes import FakeServer, fake_async_connection_pool
+
+
+def calls_by_tags(view_manager):
+    view_data = view_manager.get_view('redispy/calls')
+    return dict((tag_values, data.count_data)
+            for tag_values, data in view_data.tag_value_aggregation_data_map.items())
+
+
+def test_commands_are_traced_and_recorded(span_retainer, fresh_stats):
+    ocredis.register_views()
+
+    async def run():
+        client = OcAsyncRedis(connection_pool=fake_async_connection_pool())
+        assert await client.set('foo', 'bar')
+        assert await client.get('foo') == b'bar'
+        with pytest.raises(Exception):
+            await client.incr('foo')
+
+    asyncio.run(run())
+
+    assert [span.name for span in span_retainer.spans()] == [
+            'redispy.Redis.set', 'redispy.Redis.get', 'redispy.Redis.incrby']
+    assert span_retainer.spans()[2].status.code == 2
+
+    assert calls_by_tags(fresh_stats) == {
+        ('redispy.Redis.set', None, 'OK'): 1,
+        ('redispy.Redis.get', None, 'OK'): 1,
+        ('redispy.Redis.incrby', 'response', 'ERROR'): 1,
+    }
+
+
+def test_blocking_commands_are_recorded_as_blocked(fresh_stats):
+    ocredis.register_views()
+
+    async def run():
+        client = OcAsyncRedis(connection_pool=fake_async_connection_pool(latency=0.05))
+        await client.rpush('jobs', 'a')
+        assert await client.blpop(['jobs'], timeout=1) == (b'jobs', b'a')
+        assert await client.blpop(['jobs'], timeout=1) is None
+
+    asyncio.run(run())
+
+    blocked = fresh_stats.get_view('redispy/blocked_time').tag_value_aggregation_data_map
+    assert blocked[('redispy.Redis.blpop', None, 'OK')].mean_data >= 50
+    assert blocked[('redispy.Redis.blpop', None, 'TIMEOUT')].count_data == 1
+    assert calls_by_tags(fresh_stats)[('redispy.Redis.blpop', None, 'TIMEOUT')] == 1
+
+
+def test_trace_context_is_kept_per_task(span_retainer, fresh_stats):
+    tracer = execution_context.get_opencensus_tracer()
+
+    async def traced_get(client, name):
+        with tracer.span(name=name):
+            for i in range(3):
+                await client.get(name)
+
+    async def run():
+        client = OcAsyncRedis(connection_pool=fake_async_connection_pool(latency=0.001))
+        await asyncio.gather(*[traced_get(client, 'task-%d' % i) for i in range(5)])
+
+    asyncio.run(run())
+
+    spans = span_retainer.spans()
+    parents = dict((span.span_id, span.name) for span in spans if span.name.startswith('task-'))
+    assert len(parents) == 5
+    gets = [span for span in spans if span.name == 'redispy.Redis.get']
+    assert len(gets) == 15
+    for span in gets:
+        assert span.parent_span_id in parents
+
+
+def test_concurrent_root_commands_never_parent_each_other(span_retainer, fresh_stats):
+    async def run():
+        client = OcAsyncRedis(connection_pool=fake_async_connection_pool(latency=0.01))
+        await asyncio.gather(*[client.get('key-%d' % i) for i in range(4)])
+        await client.get('after')
+
+    asyncio.run(run())
+
+    spans = span_retainer.spans()
+    assert len(spans) == 5
+    span_ids = set(span.span_id for span in spans)
+    for span in spans:
+        assert span.parent_span_id not in span_ids
+
+
+def test_span_policy_skips_spans(span_retainer, fresh_stats):
+    ocredis.register_views()
+
+    async def run():
+        client = OcAsyncRedis(connection_pool=fake_async_connection_pool(),
+                span_policy={'get': 'never', 'pipeline': 'never'})
+        await client.set('foo', 'bar')
+        assert await client.get('foo') == b'bar'
+        assert await client.pipeline().get('foo').execute() == [b'bar']
+        assert OcAsyncRedis.from_url('redis://localhost:6379/1', span_policy={'*': 'never'}).span_policy
+
+    asyncio.run(run())
+
+    assert [span.name for span in span_retainer.spans()] == ['redispy.Redis.set']
+    assert calls_by_tags(fresh_stats) == {
+        ('redispy.Redis.set', None, 'OK'): 1,
+        ('redispy.Redis.get', None, 'OK'): 1,
+        ('redispy.Pipeline.execute', None, 'OK'): 1,
+        ('redispy.Pipeline.get', None, 'OK'): 1,
+    }
+
+
+def test_async_pipeline(span_retainer, fresh_stats):
+    ocredis.register_views()
+
+    async def run():
+        client = OcAsyncRedis(connection_pool=fake_async_connection_pool())
+        pipe = client.pipeline(transaction=True)
+        assert isinstance(pipe, OcAsyncPipeline)
+        pipe.set('foo', 'bar').get('foo')
+        return await pipe.execute()
+
+    assert asyncio.run(run()) == [True, b'bar']
+    spans = span_retainer.spans()
+    assert [span.name for span in spans] == ['redispy.Pipeline.execute']
+    assert spans[0].attributes['redispy.pipeline.batch_size'] == 2
+    assert calls_by_tags(fresh_stats) == {
+        ('redispy.Pipeline.execute', None, 'OK'): 1,
+        ('redispy.Pipeline.set', None, 'OK'): 1,
+        ('redispy.Pipeline.get', None, 'OK'): 1,
+    }
+
+
+def test_benchmark_concurrent_in_flight_commands(fresh_stats):
+    """
+    Keeps 10000 commands in flight at once on a single event loop, each
+    waiting 50ms on its reply, and reports the sustained throughput.
+    """
+    ocredis.register_views()
+    in_flight = 10000
+    server = FakeServer()
+
+    async def run():
+        client = OcAsyncRedis(connection_pool=fake_async_connection_pool(server=server, latency=0.05))
+        await client.set('foo', 'bar')
+        start = time.time()
+        results = await asyncio.gather(*[client.get('foo') for i in range(in_flight)])
+        return results, time.time() - start
+
+    results, elapsed = asyncio.run(run())
+    assert results == [b'bar'] * in_flight
+
+    calls = calls_by_tags(fresh_stats)
+    assert calls[('redispy.Redis.get', None, 'OK')] == in_flight
+    # Had the commands been serialized, this would have taken 500s.
+    assert elapsed < 60, '%d concurrent commands took %.3fs' % (in_flight, elapsed)
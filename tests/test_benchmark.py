@@ -0,0 +1,51 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import json
+
+from tests import benchmark
+
+
+def test_every_operation_runs_for_every_client(fresh_stats, tmpdir):
+    report = benchmark.run(iterations=3, repeats=1, alloc_iterations=2)
+    keys = set((result['family'], result['operation'], result['client'], result['tracing'])
+            for result in report['results'])
+    assert len(keys) == len(benchmark.OPERATIONS) * (1 + len(benchmark.TRACING_MODES))
+    assert all(result['ns_per_call'] > 0 for result in report['results'])
+    assert set(report['fast_path']) == {'idle_ns', 'recording_ns'}
+    assert 'fast path overhead' in benchmark.format_report(report)
+
+    output = tmpdir.join('results.json')
+    assert benchmark.main(['--iterations', '3', '--repeats', '1', '--alloc-iterations', '2',
+            '--family', 'pipelines', '--output', str(output)]) == 0
+    saved = json.loads(output.read())
+    assert set(result['family'] for result in saved['results']) == {'pipelines'}
+    assert saved['environment']['iterations'] == 3
+
+
+def test_regressions_compare_the_overhead_over_redis():
+    baseline = {'results': [
+        {'family': 'strings', 'operation': 'get', 'client': 'redis', 'tracing': 'off', 'ns_per_call': 1000},
+        {'family': 'strings', 'operation': 'get', 'client': 'ocredis', 'tracing': 'off', 'ns_per_call': 1500},
+        {'family': 'strings', 'operation': 'get', 'client': 'ocredis', 'tracing': 'on', 'ns_per_call': 3000},
+    ]}
+    report = copy.deepcopy(baseline)
+    # A machine twice as slow is no regression.
+    for result in report['results']:
+        result['ns_per_call'] *= 2
+    assert benchmark.regressions(report, baseline) == []
+
+    report['results'][2]['ns_per_call'] *= 1.5
+    assert [result['tracing'] for result, previous in benchmark.regressions(report, baseline)] == ['on']
@@ -0,0 +1,88 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import ocredis
+from ocredis import observability
+from ocredis.bigvalues import BigValues
+from tests.fakes import fake_connection_pool
+
+
+@pytest.fixture
+def big_value_detection():
+    yield
+    ocredis.disable_big_values()
+
+
+def test_big_writes_and_replies_are_sampled_and_counted(fresh_stats, big_value_detection):
+    ocredis.register_views()
+    ocredis.enable_big_values(threshold=1000)
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.set('user:1', 'x' * 2000)
+    client.set('user:2', 'small')
+    client.get('user:1')
+    client.mget(['user:1', 'user:2', 'blob'])
+    client.hset('session:9', mapping={'a': 'y' * 600, 'b': 'y' * 600})
+    pipe = client.pipeline()
+    pipe.set('blob', 'z' * 5000)
+    pipe.execute()
+
+    snapshot = ocredis.big_values()
+    assert snapshot.seen == 5
+    assert [(sample.method, sample.key, sample.size) for sample in snapshot.samples] == [
+            ('redispy.Redis.set', b'user:1', 2000),
+            ('redispy.Redis.get', b'user:1', 2000),
+            ('redispy.Redis.mget', b'user:1', 2000),
+            ('redispy.Redis.hset', b'session:9', 1200),
+            ('redispy.Pipeline.set', b'blob', 5000)]
+    assert snapshot.by_prefix == {'user': (3, 6000, 2000), 'session': (1, 1200, 1200), 'blob': (1, 5000, 5000)}
+
+    big_values_view = fresh_stats.get_view('redispy/big_values').tag_value_aggregation_data_map
+    assert dict((tag_values, data.count_data) for tag_values, data in big_values_view.items()) == {
+            ('redispy.Redis.set', 'user'): 1, ('redispy.Redis.get', 'user'): 1,
+            ('redispy.Redis.mget', 'user'): 1, ('redispy.Redis.hset', 'session'): 1,
+            ('redispy.Pipeline.set', 'blob'): 1}
+
+
+def test_reservoir_and_prefixes_are_bounded():
+    detector = BigValues(threshold=10, reservoir_size=5, max_prefixes=2)
+    for i in range(1000):
+        detector.record('redispy.Redis.set', ('prefix%d:key' % (i % 10),), ('x' * 10,))
+
+    snapshot = detector.snapshot()
+    assert snapshot.seen == 1000
+    assert len(snapshot.samples) == 5
+    assert len(set(sample.key for sample in snapshot.samples)) > 1
+    assert sorted(snapshot.by_prefix) == ['_other', 'prefix0', 'prefix1']
+    assert snapshot.by_prefix['_other'].count == 800
+
+
+def test_large_collections_are_sized_from_a_sample(monkeypatch):
+    walked = []
+
+    def summarize_lengths(items, *args, **kwargs):
+        walked.append(len(items))
+        return real_summarize_lengths(items, *args, **kwargs)
+
+    real_summarize_lengths = observability.summarize_lengths
+    monkeypatch.setattr(observability, 'summarize_lengths', summarize_lengths)
+    detector = BigValues(threshold=100000)
+    detector.record('redispy.Redis.lrange', 'list', result=[b'x' * 10] * 100000)
+    detector.record('redispy.Redis.hgetall', 'hash', result=dict((b'%05d' % i, b'y' * 5) for i in range(100000)))
+    detector.record('redispy.Redis.lrange', 'small', result=[b'x' * 10] * 1000)
+
+    assert [(sample.key, sample.size) for sample in detector.snapshot().samples] == [
+            (b'list', 1000000), (b'hash', 1000000)]
+    assert max(walked) <= 1024
@@ -0,0 +1,68 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ocredis
+from tests.fakes import RespServer, fake_connection_pool
+
+
+def view_data_map(view_manager, name):
+    return view_manager.get_view(name).tag_value_aggregation_data_map
+
+
+def test_blocked_time_is_kept_out_of_latency(fresh_stats):
+    ocredis.register_views()
+    with RespServer(latency=0.1) as server:
+        client = ocredis.OcRedis(host='127.0.0.1', port=server.port)
+        client.rpush('jobs', 'a')
+        assert client.blpop(['jobs'], timeout=1) == (b'jobs', b'a')
+        assert client.blpop(['jobs'], timeout=1) is None
+
+    blocked = view_data_map(fresh_stats, 'redispy/blocked_time')
+    latency = view_data_map(fresh_stats, 'redispy/latency')
+    for status in ('OK', 'TIMEOUT'):
+        tags = ('redispy.Redis.blpop', None, status)
+        assert blocked[tags].count_data == 1
+        assert blocked[tags].mean_data >= 100
+        # Only sending BLPOP and delivering its reply count as latency.
+        assert latency[tags].mean_data < 50
+
+    assert ('redispy.Redis.rpush', None, 'OK') not in blocked
+    assert latency[('redispy.Redis.rpush', None, 'OK')].mean_data >= 100
+
+
+def test_blocked_time_without_instrumented_connections(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    assert client.blpop(['jobs'], timeout=1) is None
+
+    tags = ('redispy.Redis.blpop', None, 'TIMEOUT')
+    assert view_data_map(fresh_stats, 'redispy/blocked_time')[tags].count_data == 1
+    assert view_data_map(fresh_stats, 'redispy/latency')[tags].mean_data == 0
+    assert view_data_map(fresh_stats, 'redispy/calls')[tags].count_data == 1
+
+
+def test_stream_reads_only_block_given_block(fresh_stats):
+    ocredis.register_views()
+    with RespServer(latency=0.05) as server:
+        client = ocredis.OcRedis(host='127.0.0.1', port=server.port)
+        client.xgroup_create('orders', 'billing', id='0', mkstream=True)
+        assert client.xreadgroup('billing', 'worker-1', {'orders': '>'}, count=10) == []
+        assert client.xreadgroup('billing', 'worker-1', {'orders': '>'}, count=10, block=10) == []
+
+    blocked = view_data_map(fresh_stats, 'redispy/blocked_time')
+    latency = view_data_map(fresh_stats, 'redispy/latency')
+    assert list(blocked) == [('redispy.Redis.xreadgroup', None, 'TIMEOUT')]
+    assert blocked[('redispy.Redis.xreadgroup', None, 'TIMEOUT')].count_data == 1
+    # Without BLOCK, the whole round trip counts as latency.
+    assert latency[('redispy.Redis.xreadgroup', None, 'OK')].mean_data >= 50
@@ -0,0 +1,152 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import pytest
+import redis
+
+import ocredis
+from ocredis import observability
+from tests.fakes import CountingServer, RespServer, fake_connection_pool
+
+
+def sums(view_manager, view_name):
+    view_data = view_manager.get_view(view_name)
+    return dict((tag_values, data.sum_data)
+            for tag_values, data in view_data.tag_value_aggregation_data_map.items())
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_hits_misses_and_own_writes(fresh_stats):
+    ocredis.register_views()
+    server = CountingServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.set('foo', 'bar')
+    client.hset('h', 'a', '1')
+    cache = client.enable_read_cache()
+
+    for i in range(3):
+        assert client.get('foo') == b'bar'
+        assert client.hget('h', 'a') == b'1'
+        assert client.hgetall('h') == {b'a': b'1'}
+    assert [command[0] for command in server.commands[2:]] == ['GET', 'HGET', 'HGETALL']
+
+    client.hgetall('h')[b'b'] = b'2'
+    assert client.hgetall('h') == {b'a': b'1'}
+
+    client.set('foo', 'baz')
+    client.hset('h', 'b', '2')
+    assert client.get('foo') == b'baz'
+    assert client.hgetall('h') == {b'a': b'1', b'b': b'2'}
+
+    pipe = client.pipeline()
+    pipe.set('foo', 'qux').incr('counter')
+    pipe.execute()
+    assert client.get('foo') == b'qux'
+    assert len(cache) == 2
+
+    assert sums(fresh_stats, 'redispy/cache_hits') == {
+            ('redispy.Redis.get',): 2, ('redispy.Redis.hget',): 2, ('redispy.Redis.hgetall',): 4}
+    assert sums(fresh_stats, 'redispy/cache_misses') == {
+            ('redispy.Redis.get',): 3, ('redispy.Redis.hget',): 1, ('redispy.Redis.hgetall',): 2}
+    assert sums(fresh_stats, 'redispy/cache_invalidations') == {('write',): 4}
+
+
+def test_mget_reads_only_the_missing_keys(fresh_stats):
+    ocredis.register_views()
+    server = CountingServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.mset({'a': '1', 'b': '2', 'c': '3'})
+    client.enable_read_cache()
+
+    assert client.get('a') == b'1'
+    assert client.mget('a', 'b', 'missing') == [b'1', b'2', None]
+    assert client.mget(['a', 'b', 'missing']) == [b'1', b'2', None]
+    assert client.get('b') == b'2'
+    assert server.commands[1:] == [['GET', 'a'], ['MGET', 'b', 'missing']]
+
+    assert sums(fresh_stats, 'redispy/cache_hits') == {('redispy.Redis.get',): 1, ('redispy.Redis.mget',): 4}
+    assert sums(fresh_stats, 'redispy/cache_misses') == {('redispy.Redis.get',): 1, ('redispy.Redis.mget',): 2}
+
+
+def test_flushdb_clears_the_cache(fresh_stats):
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    cache = client.enable_read_cache()
+    client.get('a')
+    client.get('b')
+    assert len(cache) == 2
+
+    with pytest.raises(redis.ResponseError):
+        client.flushdb()
+    assert len(cache) == 0
+
+
+def test_ttl_and_size_evictions(fresh_stats, monkeypatch):
+    ocredis.register_views()
+    now = [1000.0]
+    monkeypatch.setattr(observability, '_now', lambda: now[0])
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.mset({'a': 'x' * 40, 'b': 'y' * 40, 'c': 'z' * 40, 'big': 'w' * 200})
+    cache = client.enable_read_cache(max_bytes=100, ttl=5)
+
+    client.get('a')
+    client.get('b')
+    client.get('a')
+    client.get('c')
+    assert sorted(key for name, key in cache._entries) == [b'a', b'c']
+    assert cache.size_bytes == 82
+
+    client.get('big')
+    assert len(cache) == 2
+
+    now[0] += 5
+    client.get('a')
+    assert sums(fresh_stats, 'redispy/cache_evictions') == {('size',): 1, ('ttl',): 1}
+    assert sums(fresh_stats, 'redispy/cache_hits') == {('redispy.Redis.get',): 1}
+    assert fresh_stats.get_view('redispy/cache_bytes').tag_value_aggregation_data_map[()].value == 82
+
+
+def test_tracking_invalidates_writes_from_other_clients(fresh_stats):
+    ocredis.register_views()
+    with RespServer() as server:
+        client = ocredis.OcRedis(host='127.0.0.1', port=server.port)
+        other = redis.Redis(host='127.0.0.1', port=server.port)
+        other.set('foo', 'bar')
+        cache = client.enable_read_cache(tracking=True)
+        try:
+            assert client.get('foo') == b'bar'
+            assert client.get('foo') == b'bar'
+            assert len(cache) == 1
+
+            other.set('foo', 'baz')
+            assert wait_for(lambda: len(cache) == 0)
+            assert client.get('foo') == b'baz'
+        finally:
+            client.disable_read_cache()
+        assert client.connection_pool.tracking_listener is None
+
+    assert sums(fresh_stats, 'redispy/cache_invalidations') == {('tracking',): 1}
+
+
+def test_tracking_requires_an_instrumented_pool():
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    with pytest.raises(ValueError):
+        client.enable_read_cache(tracking=True)
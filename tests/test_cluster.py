@@ -0,0 +1,144 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import pytest
+from redis.cluster import ClusterNode
+from redis.crc import key_slot
+from redis.exceptions import RedisClusterException
+
+import ocredis
+from tests.fakes import FakeCluster
+
+
+def view_data_map(view_manager, name):
+    return view_manager.get_view(name).tag_value_aggregation_data_map
+
+
+def one_key_per_node(cluster):
+    keys = {}
+    for i in range(100):
+        keys.setdefault(cluster.owner_of(b'key:%d' % i).name, 'key:%d' % i)
+    return [keys[node.name] for node in cluster.nodes]
+
+
+def other_node(cluster, key):
+    return next(node for node in cluster.nodes if node is not cluster.owner_of(key.encode()))
+
+
+@pytest.fixture
+def cluster():
+    with FakeCluster() as cluster:
+        yield cluster
+
+
+def test_node_latency_and_redirections(fresh_stats, cluster):
+    ocredis.register_views()
+    client = ocredis.OcRedisCluster(host='127.0.0.1', port=cluster.nodes[0].port)
+    keys = one_key_per_node(cluster)
+    for i, key in enumerate(keys):
+        assert client.set(key, i)
+
+    latency = view_data_map(fresh_stats, 'redispy/cluster_node_latency')
+    for node in cluster.nodes:
+        assert latency[(node.name, 'redispy.Redis.set', 'OK')].count_data == 1
+
+    moved, asked = keys[0], keys[1]
+    moved_from, asked_from = cluster.owner_of(moved.encode()), cluster.owner_of(asked.encode())
+    cluster.move_slot(key_slot(moved.encode()), other_node(cluster, moved))
+    cluster.migrate(key_slot(asked.encode()), other_node(cluster, asked))
+    assert client.get(moved) == b'0'
+    assert client.get(asked) == b'1'
+    # The slot map was patched by the MOVED reply, unlike by the ASK reply.
+    assert client.get(moved) == b'0'
+    assert client.get(asked) == b'1'
+
+    redirections = view_data_map(fresh_stats, 'redispy/cluster_redirections')
+    assert {tags: data.count_data for tags, data in redirections.items()} == {
+        (moved_from.name, 'redispy.Redis.get', 'moved'): 1,
+        (asked_from.name, 'redispy.Redis.get', 'ask'): 2,
+    }
+    client.close()
+
+
+def test_multi_key_commands_fan_out(fresh_stats, cluster):
+    ocredis.register_views()
+    client = ocredis.OcRedisCluster(host='127.0.0.1', port=cluster.nodes[0].port)
+    keys = ['k%d' % i for i in range(20)]
+    assert all(client.mset_nonatomic(dict((key, i) for i, key in enumerate(keys))))
+    assert client.mget_nonatomic(keys) == [b'%d' % i for i in range(20)]
+    assert client.delete(*keys) == 20
+
+    latency = view_data_map(fresh_stats, 'redispy/cluster_node_latency')
+    nodes = set(node for node, method, status in latency if method == 'redispy.ClusterPipeline.execute')
+    assert nodes == set(node.name for node in cluster.nodes)
+    # Each command is sent as a single pipeline, fanned out to the nodes.
+    calls = view_data_map(fresh_stats, 'redispy/latency')
+    assert calls[('redispy.ClusterPipeline.execute', None, 'OK')].count_data == 3
+    assert latency[(cluster.nodes[0].name, 'redispy.ClusterPipeline.execute', 'OK')].count_data == 3
+    client.close()
+
+
+def test_nodes_are_connected_to_through_instrumented_pools(cluster):
+    for client in (ocredis.OcRedisCluster(host='127.0.0.1', port=cluster.nodes[0].port),
+                   ocredis.OcRedisCluster(startup_nodes=[ClusterNode('127.0.0.1', cluster.nodes[0].port)])):
+        nodes = client.get_nodes()
+        assert len(nodes) == len(cluster.nodes)
+        assert all(isinstance(node.redis_connection.connection_pool, ocredis.OcConnectionPool) for node in nodes)
+        client.close()
+
+
+def test_pipeline_fans_out_to_nodes(fresh_stats):
+    ocredis.register_views()
+    with FakeCluster(latency=0.2) as cluster:
+        client = ocredis.OcRedisCluster(host='127.0.0.1', port=cluster.nodes[0].port)
+        keys = one_key_per_node(cluster)
+        # Connect to each node before timing the pipeline.
+        client.mget_nonatomic(keys)
+
+        pipe = client.pipeline()
+        for key in keys:
+            pipe.incr(key)
+        start = time.monotonic()
+        assert pipe.execute() == [1, 1, 1]
+        # One after the other, the nodes would take 0.6s.
+        assert time.monotonic() - start < 0.45
+        client.close()
+
+    latency = view_data_map(fresh_stats, 'redispy/latency')
+    assert latency[('redispy.ClusterPipeline.execute', None, 'OK')].count_data == 2
+
+
+def test_pipeline_follows_redirections_per_node(fresh_stats, cluster):
+    ocredis.register_views()
+    client = ocredis.OcRedisCluster(host='127.0.0.1', port=cluster.nodes[0].port)
+    keys = one_key_per_node(cluster)
+    pipe = client.pipeline()
+    assert isinstance(pipe, ocredis.OcClusterPipeline)
+    for key in keys:
+        pipe.set(key, key)
+    assert pipe.execute() == [True, True, True]
+
+    moved_from = cluster.owner_of(keys[0].encode())
+    cluster.move_slot(key_slot(keys[0].encode()), other_node(cluster, keys[0]))
+    for key in keys:
+        pipe.get(key)
+    assert pipe.execute() == [key.encode() for key in keys]
+
+    redirections = view_data_map(fresh_stats, 'redispy/cluster_redirections')
+    assert redirections[(moved_from.name, 'redispy.Pipeline.execute', 'moved')].count_data == 1
+    with pytest.raises(RedisClusterException):
+        client.pipeline(transaction=True)
+    client.close()
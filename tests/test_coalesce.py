@@ -0,0 +1,176 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import threading
+import time
+
+from redis.exceptions import ResponseError
+
+import ocredis
+from tests.fakes import CountingServer, fake_connection_pool
+
+
+def concurrently(calls):
+    """
+    concurrently makes each of calls from a thread of its own, all at once,
+    and returns their results in order.
+    """
+    barrier = threading.Barrier(len(calls))
+    results = [None] * len(calls)
+
+    def run(i):
+        barrier.wait()
+        results[i] = calls[i]()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+class GatedServer(CountingServer):
+    """
+    GatedServer holds its reply to GET gate until gate is set.
+    """
+
+    def __init__(self):
+        super(GatedServer, self).__init__()
+        self.arrived = threading.Event()
+        self.gate = threading.Event()
+
+    def execute(self, args, connection=None):
+        if args == [b'GET', b'gate']:
+            self.arrived.set()
+            self.gate.wait(10)
+        return super(GatedServer, self).execute(args, connection)
+
+
+@contextlib.contextmanager
+def batch_in_flight(client, server):
+    """
+    batch_in_flight keeps a read of gate in flight, so that the reads made
+    meanwhile wait for each other.
+    """
+    thread = threading.Thread(target=client.get, args=('gate',))
+    thread.start()
+    server.arrived.wait(10)
+    try:
+        yield
+    finally:
+        server.gate.set()
+        thread.join(timeout=10)
+        server.commands.remove(['GET', 'gate'])
+
+
+def raised(fn):
+    try:
+        fn()
+    except Exception as e:
+        return e
+
+
+def test_concurrent_gets_become_one_mget(fresh_stats):
+    ocredis.register_views()
+    server = GatedServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.mset(dict(('key%d' % i, str(i)) for i in range(8)))
+    client.enable_coalescing(window_ms=5000, max_batch=8)
+
+    start_time = time.time()
+    with batch_in_flight(client, server):
+        results = concurrently([lambda i=i: client.get('key%d' % i) for i in range(8)])
+    assert time.time() - start_time < 5
+    assert results == [str(i).encode('ascii') for i in range(8)]
+    assert len(server.commands) == 2
+    assert server.commands[1][0] == 'MGET'
+    assert sorted(server.commands[1][1:]) == ['key%d' % i for i in range(8)]
+
+    batch_size = fresh_stats.get_view('redispy/coalesce_batch_size').tag_value_aggregation_data_map[()]
+    assert (batch_size.count_data, batch_size.sum) == (2, 9)
+    wait = fresh_stats.get_view('redispy/coalesce_wait').tag_value_aggregation_data_map
+    assert wait[('redispy.Redis.get',)].count_data == 9
+
+
+def test_identical_keys_are_single_flighted(fresh_stats):
+    server = GatedServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.set('foo', 'bar')
+    client.enable_coalescing(window_ms=50)
+
+    with batch_in_flight(client, server):
+        assert concurrently([lambda: client.get('foo')] * 5) == [b'bar'] * 5
+    assert server.commands[1:] == [['GET', 'foo']]
+
+
+def test_gets_and_hgets_become_one_pipeline(fresh_stats):
+    server = GatedServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.mset({'a': '1', 'b': '2'})
+    client.hset('h', 'f', 'v')
+    client.enable_coalescing(window_ms=5000, max_batch=4)
+
+    with batch_in_flight(client, server):
+        results = concurrently([lambda: client.get('a'), lambda: client.get('b'),
+                lambda: client.hget('h', 'f'), lambda: client.hget('h', 'missing')])
+    assert results == [b'1', b'2', b'v', None]
+    assert sorted(command[0] for command in server.commands[2:]) == ['GET', 'GET', 'HGET', 'HGET']
+
+
+def test_nil_replies_of_mget_are_read_again(fresh_stats):
+    server = GatedServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.set('a', '1')
+    client.hset('h', 'f', 'v')
+    client.enable_coalescing(window_ms=5000, max_batch=3)
+
+    with batch_in_flight(client, server):
+        results = concurrently([lambda: client.get('a'), lambda: raised(lambda: client.get('h')),
+                lambda: client.get('missing')])
+    assert results[0] == b'1'
+    assert isinstance(results[1], ResponseError) and 'WRONGTYPE' in str(results[1])
+    assert results[2] is None
+    assert [command[0] for command in server.commands[2:]] == ['MGET', 'GET', 'GET']
+    assert sorted(command[1] for command in server.commands[3:]) == ['h', 'missing']
+
+
+def test_shared_errors_are_raised_as_copies(fresh_stats):
+    server = GatedServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.hset('h', 'f', 'v')
+    client.enable_coalescing(window_ms=50)
+
+    with batch_in_flight(client, server):
+        errors = concurrently([lambda: raised(lambda: client.get('h'))] * 3)
+    assert server.commands[1:] == [['GET', 'h']]
+    assert all(isinstance(error, ResponseError) for error in errors)
+    assert len(set(id(error) for error in errors)) == 3
+    assert len(set(id(error.__cause__) for error in errors)) == 1
+    assert str(errors[0]) == str(errors[0].__cause__)
+
+
+def test_lone_reads_and_other_commands(fresh_stats):
+    server = CountingServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    client.enable_coalescing(window_ms=5000)
+
+    # A read waits for no one when no other batch is in flight.
+    start_time = time.time()
+    assert client.set('foo', 'bar')
+    assert client.get('foo') == b'bar'
+    assert time.time() - start_time < 5
+    assert client.mget('foo', 'missing') == [b'bar', None]
+    assert server.commands == [['SET', 'foo', 'bar'], ['GET', 'foo'], ['MGET', 'foo', 'missing']]
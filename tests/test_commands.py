@@ -0,0 +1,94 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import ocredis
+from ocredis import observability
+from ocredis.commands import call_info, command_info, command_keys, command_values
+from tests.fakes import fake_connection_pool
+
+
+@pytest.mark.parametrize('args, method, keys, values', [
+    (('GET', 'foo'), 'redispy.Redis.get', ('foo',), ()),
+    (('SET', 'foo', 'bar', 'EX', 10), 'redispy.Redis.set', ('foo',), ('bar',)),
+    (('MSET', 'a', '1', 'b', '2'), 'redispy.Redis.mset', ('a', 'b'), ('1', '2')),
+    (('HSET', 'h', 'f1', 'v1', 'f2', 'v2'), 'redispy.Redis.hset', ('h',), ('v1', 'v2')),
+    (('BLPOP', 'a', 'b', 5), 'redispy.Redis.blpop', ('a', 'b'), ()),
+    (('EVAL', 'return 1', 2, 'k1', 'k2', 'arg'), 'redispy.Redis.eval', ('k1', 'k2'), ('arg',)),
+    (('ZUNIONSTORE', 'dest', 2, 'a', 'b', 'WEIGHTS', 1, 2), 'redispy.Redis.zunionstore', ('dest', 'a', 'b'), ()),
+    ((b'XREAD', b'COUNT', 1, b'STREAMS', b's1', b's2', b'0', b'0'), 'redispy.Redis.xread', (b's1', b's2'), ()),
+    (('LMPOP', 2, 'a', 'b', 'LEFT', 'COUNT', 3), 'redispy.Redis.lmpop', ('a', 'b'), ()),
+    (('BLMPOP', 5, 2, 'a', 'b', 'LEFT'), 'redispy.Redis.blmpop', ('a', 'b'), ()),
+    (('ZMPOP', 1, 'z', 'MIN'), 'redispy.Redis.zmpop', ('z',), ()),
+    (('BZMPOP', 0.5, 2, 'y', 'z', 'MAX', 'COUNT', 2), 'redispy.Redis.bzmpop', ('y', 'z'), ()),
+    (('CLIENT KILL', '127.0.0.1:6379'), 'redispy.Redis.client_kill', (), ()),
+    (('SOMENEWCOMMAND', 'key', 'v1', 'v2'), 'redispy.Redis.somenewcommand', ('key',), ('v1', 'v2')),
+])
+def test_command_table(args, method, keys, values):
+    info = command_info(args[0])
+    assert info.method == method
+    assert command_keys(info, args) == keys
+    assert command_values(info, args) == values
+
+
+def test_command_flags():
+    assert 'r' in command_info('GET').flags
+    assert 'w' in command_info('SET').flags
+    assert 'b' in command_info('BRPOPLPUSH').flags
+    assert 'b' not in command_info('RPOPLPUSH').flags
+    assert 'b' in command_info('BLMPOP').flags and 'b' in command_info('BZMPOP').flags
+    assert 'b' not in command_info('LMPOP').flags and 'b' not in command_info('ZMPOP').flags
+    assert call_info(('XREAD', 'COUNT', 10, 'STREAMS', 'orders', '0')).flags == 'r'
+    assert call_info(('XREAD', 'BLOCK', 0, 'STREAMS', 'orders', '$')).flags == 'rb'
+    # Stream names aren't arguments.
+    assert call_info(('XREADGROUP', 'GROUP', 'g', 'c', 'STREAMS', 'BLOCK', '>')).flags == 'w'
+
+
+def test_every_command_is_instrumented_once(span_retainer, fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+
+    client.set('foo', 'bar')
+    client.mset({'a': '1', 'b': '22'})
+    client.incr('counter')
+    assert client.mget(['a', 'b']) == [b'1', b'22']
+
+    assert [span.name for span in span_retainer.spans()] == [
+            'redispy.Redis.set', 'redispy.Redis.mset', 'redispy.Redis.incrby', 'redispy.Redis.mget']
+
+    value_lengths = fresh_stats.get_view('redispy/value_lengths').tag_value_aggregation_data_map
+    mset_values = value_lengths[('redispy.Redis.mset', None, 'OK')]
+    assert mset_values.count_data == 2
+    assert mset_values.sum == pytest.approx(3)
+
+
+def test_nested_calls_do_not_create_spans(span_retainer, fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+
+    def get_both():
+        return client.get('a'), client.get('b')
+
+    observability.trace_and_record_stats_with_key_and_value('ocredis.get_both', get_both, None, None)
+
+    spans = span_retainer.spans()
+    assert [span.name for span in spans] == ['ocredis.get_both']
+
+    # The nested commands still have their stats recorded.
+    calls = fresh_stats.get_view('redispy/calls').tag_value_aggregation_data_map
+    assert calls[('redispy.Redis.get', None, 'OK')].count_data == 2
+
+    client.get('c')
+    assert [span.name for span in span_retainer.spans()] == ['ocredis.get_both', 'redispy.Redis.get']
@@ -0,0 +1,99 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+
+import pytest
+import redis
+
+import ocredis
+from ocredis import OcConnection, OcUnixDomainSocketConnection
+from tests.fakes import RespServer
+
+
+def wire_bytes(view_manager, view_name):
+    view_data = view_manager.get_view(view_name)
+    return dict((tag_values[0], (data.count_data, data.sum))
+            for tag_values, data in view_data.tag_value_aggregation_data_map.items())
+
+
+def test_ocredis_uses_instrumented_connections():
+    assert ocredis.OcRedis().connection_pool.connection_class is OcConnection
+    assert ocredis.OcRedis(unix_socket_path='/tmp/redis.sock').connection_pool.connection_class is \
+            OcUnixDomainSocketConnection
+    assert ocredis.OcRedis.from_url('unix:///tmp/redis.sock').connection_pool.connection_class is \
+            OcUnixDomainSocketConnection
+
+
+def test_exact_bytes_per_command_and_reply(fresh_stats):
+    ocredis.register_views()
+    with RespServer() as server:
+        client = ocredis.OcRedis(host='127.0.0.1', port=server.port)
+        assert client.set('foo', 'x' * 1000)
+        assert client.get('foo') == b'x' * 1000
+        assert client.get('missing') is None
+        with pytest.raises(redis.ResponseError):
+            client.incr('foo')
+
+        pipe = client.pipeline(transaction=False)
+        pipe.set('a', '1').get('a')
+        assert pipe.execute() == [True, b'1']
+
+    requests = wire_bytes(fresh_stats, 'redispy/request_bytes')
+    responses = wire_bytes(fresh_stats, 'redispy/response_bytes')
+
+    packed_set = len(b''.join(redis.Connection().pack_command('SET', 'foo', 'x' * 1000)))
+    assert requests['redispy.Redis.set'] == (1, packed_set)
+    assert responses['redispy.Redis.set'] == (1, len(b'+OK\r\n'))
+    assert requests['redispy.Redis.get'] == (2, 2 * len(b'*2\r\n$3\r\nGET\r\n$3\r\nfoo\r\n') + 4)
+    assert responses['redispy.Redis.get'] == (2, len(b'$1000\r\n\r\n') + 1000 + len(b'$-1\r\n'))
+    assert responses['redispy.Redis.incrby'] == (1, len(b'-ERR value is not an integer or out of range\r\n'))
+
+    # The commands of a pipeline are sent at once, its replies are read one by one.
+    packed_pipeline = b'*3\r\n$3\r\nSET\r\n$1\r\na\r\n$1\r\n1\r\n*2\r\n$3\r\nGET\r\n$1\r\na\r\n'
+    assert requests['redispy.Pipeline.execute'] == (1, len(packed_pipeline))
+    assert responses['redispy.Pipeline.execute'] == (2, len(b'+OK\r\n$1\r\n1\r\n'))
+
+
+def test_preloaded_scripts_are_counted_apart(fresh_stats):
+    ocredis.register_views()
+    with RespServer() as server:
+        client = ocredis.OcRedis(host='127.0.0.1', port=server.port)
+        client.enable_script_preload()
+        client.eval('return 1', 0)
+        # The script is loaded into the connection that ran it, and then into a new one.
+        held = client.connection_pool.get_connection('_')
+        assert client.ping()
+        client.connection_pool.release(held)
+
+    requests = wire_bytes(fresh_stats, 'redispy/request_bytes')
+    responses = wire_bytes(fresh_stats, 'redispy/response_bytes')
+    sha = client.register_script('return 1').sha
+    assert requests['redispy.ScriptRegistry.preload'] == \
+            (2, 2 * len(b''.join(redis.Connection().pack_command('SCRIPT', 'LOAD', 'return 1'))))
+    assert responses['redispy.ScriptRegistry.preload'] == (2, 2 * (len(b'$40\r\n\r\n') + len(sha)))
+    assert requests['redispy.Redis.ping'] == (1, len(b'*1\r\n$4\r\nPING\r\n'))
+    assert 'redispy.Pipeline.execute' not in requests
+
+
+def test_unix_domain_socket_connection(fresh_stats):
+    ocredis.register_views()
+    path = os.path.join(tempfile.mkdtemp(), 'redis.sock')
+    with RespServer(path=path):
+        client = ocredis.OcRedis(unix_socket_path=path)
+        assert client.ping()
+
+    assert wire_bytes(fresh_stats, 'redispy/request_bytes')['redispy.Redis.ping'] == (1, len(b'*1\r\n$4\r\nPING\r\n'))
+    assert wire_bytes(fresh_stats, 'redispy/response_bytes')['redispy.Redis.ping'] == (1, len(b'+PONG\r\n'))
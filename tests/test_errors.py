@@ -0,0 +1,45 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+
+import pytest
+from redis import exceptions
+
+from ocredis.errors import ERROR_CLASSES, classify_error
+
+
+@pytest.mark.parametrize('error, error_class', [
+    (exceptions.TimeoutError('Timeout reading from 10.0.0.1:6379'), 'timeout'),
+    (socket.timeout('timed out'), 'timeout'),
+    (exceptions.ConnectionError('Error 111 connecting to localhost:6379. Connection refused.'), 'connection'),
+    (ConnectionResetError(104, 'Connection reset by peer'), 'connection'),
+    (exceptions.BusyLoadingError('Redis is loading the dataset in memory'), 'busy'),
+    (exceptions.ResponseError('BUSY Redis is busy running a script.'), 'busy'),
+    (exceptions.AuthenticationError('invalid username-password pair'), 'auth'),
+    (exceptions.ReadOnlyError("You can't write against a read only replica."), 'readonly'),
+    (exceptions.NoScriptError('No matching script.'), 'noscript'),
+    (exceptions.ResponseError('MOVED 3999 127.0.0.1:6381'), 'redirect'),
+    (exceptions.ResponseError('WRONGTYPE Operation against a key holding the wrong kind of value'),
+            'wrongtype'),
+    (exceptions.ResponseError('Command # 2 (LPUSH user:1 x) of pipeline caused error: '
+            'WRONGTYPE Operation against a key holding the wrong kind of value'), 'wrongtype'),
+    (exceptions.ResponseError('value is not an integer or out of range'), 'response'),
+    (exceptions.WatchError('Watched variable changed.'), 'transaction'),
+    (exceptions.DataError('Invalid input of type: dict'), 'data'),
+    (ValueError('bad key user:1'), 'other'),
+])
+def test_classify_error(error, error_class):
+    assert classify_error(error) == error_class
+    assert error_class in ERROR_CLASSES
@@ -0,0 +1,136 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+
+import pytest
+
+import ocredis
+from ocredis import observability
+from ocredis.hotkeys import HotKeys, SpaceSaving
+from tests.fakes import fake_connection_pool
+
+
+@pytest.fixture
+def hot_key_tracking():
+    yield
+    ocredis.disable_hot_keys()
+
+
+def test_space_saving_keeps_the_heavy_hitters():
+    sketch = SpaceSaving(20)
+    stream = [b'a'] * 500 + [b'b'] * 300 + [b'c'] * 200 + [b'light%d' % i for i in range(2000)]
+    random.Random(1).shuffle(stream)
+    for key in stream:
+        sketch.add(key)
+
+    assert len(sketch) == 20
+    top = sketch.top(3)
+    assert [hot_key.key for hot_key in top] == [b'a', b'b', b'c']
+    for hot_key, actual in zip(top, (500, 300, 200)):
+        assert hot_key.value - hot_key.error <= actual <= hot_key.value
+        assert hot_key.error <= len(stream) / 20
+
+
+def test_hot_keys_by_calls_and_bytes(fresh_stats, hot_key_tracking):
+    ocredis.enable_hot_keys(top_k=2, interval=None)
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.set('big', 'x' * 10000)
+    for i in range(10):
+        client.get('hot')
+    for i in range(5):
+        client.get('warm')
+    pipe = client.pipeline()
+    for i in range(3):
+        pipe.get('warm')
+    pipe.execute()
+
+    snapshot = ocredis.hot_keys()
+    assert snapshot.by_calls == [(b'hot', 10, 0), (b'warm', 8, 0)]
+    assert snapshot.by_bytes[0].key == b'big'
+    assert snapshot.by_bytes[0].value > 10000
+
+
+def test_striped_sketches_are_merged(fresh_stats):
+    tracker = HotKeys(top_k=3, interval=None, stripes=4)
+    counts = dict((b'key%d' % i, i + 1) for i in range(20))
+
+    def record(keys):
+        for key in keys:
+            for i in range(counts[key]):
+                tracker.record((key,), None, None)
+
+    keys = list(counts)
+    threads = [threading.Thread(target=record, args=(keys[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tracker.snapshot().by_calls == [(b'key19', 20, 0), (b'key18', 19, 0), (b'key17', 18, 0)]
+
+
+def test_keys_are_truncated_or_hashed(fresh_stats, hot_key_tracking):
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    ocredis.enable_hot_keys(top_k=1, interval=None, max_key_bytes=8)
+    client.get('session:12345678')
+    assert ocredis.hot_keys().by_calls[0].key == b'session:'
+
+    ocredis.enable_hot_keys(top_k=1, interval=None, max_key_bytes=8, hash_keys=True)
+    client.get('session:12345678')
+    assert len(ocredis.hot_keys().by_calls[0].key) == 8
+
+
+def test_snapshots_per_interval_as_metrics(fresh_stats, hot_key_tracking, monkeypatch):
+    ocredis.register_views()
+    now = [100.0]
+    monkeypatch.setattr(observability, '_now', lambda: now[0])
+    ocredis.enable_hot_keys(top_k=2, interval=60)
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+
+    for key, calls in (('a', 3), ('b', 2), ('c', 1)):
+        for i in range(calls):
+            client.get(key)
+    now[0] += 60
+    snapshot = ocredis.hot_keys()
+    assert (snapshot.start, snapshot.end) == (100.0, 160.0)
+    assert [hot_key.key for hot_key in snapshot.by_calls] == [b'a', b'b']
+
+    calls_view = fresh_stats.get_view('redispy/hot_key_calls').tag_value_aggregation_data_map
+    assert dict((tag_values, data.value) for tag_values, data in calls_view.items()) == {
+            ('1', 'a'): 3, ('2', 'b'): 2}
+
+    client.get('d')
+    now[0] += 60
+    assert [hot_key.key for hot_key in ocredis.hot_keys().by_calls] == [b'd']
+    calls_view = fresh_stats.get_view('redispy/hot_key_calls').tag_value_aggregation_data_map
+    assert dict((tag_values, data.value) for tag_values, data in calls_view.items()) == {('1', 'd'): 1}
+
+
+def test_snapshots_keep_tag_values_cache_bounded(fresh_stats, hot_key_tracking, monkeypatch):
+    ocredis.register_views()
+    now = [100.0]
+    monkeypatch.setattr(observability, '_now', lambda: now[0])
+    monkeypatch.setattr(observability, '_MAX_CACHED_TAG_VALUES', 50)
+    monkeypatch.setattr(observability, '_tag_values_cache', {})
+    ocredis.enable_hot_keys(top_k=2, interval=60)
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+
+    # Every interval has keys of its own rank.
+    for interval in range(100):
+        client.get('key:%d' % interval)
+        now[0] += 60
+        ocredis.hot_keys()
+    assert len(observability._tag_values_cache) <= 50
@@ -0,0 +1,39 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from tests import loadtest
+
+
+def test_percentile_interpolates_within_buckets():
+    bounds = [1, 2, 4]
+    assert loadtest.percentile([0, 0, 0, 0], bounds, 0.5) is None
+    assert loadtest.percentile([10, 0, 0, 0], bounds, 0.5) == pytest.approx(0.5)
+    assert loadtest.percentile([0, 10, 10, 0], bounds, 0.75) == pytest.approx(3)
+    assert loadtest.percentile([0, 0, 0, 10], bounds, 0.999) == 4
+
+
+@pytest.mark.parametrize('processes', [0, 1])
+def test_load_test_reports_from_the_views(fresh_stats, processes):
+    report = loadtest.run(threads=2, processes=processes, duration=0.2, latency=0.001, keyspace=10,
+            mix={'get': 1, 'set': 1, 'pipeline': 1})
+
+    for client_name in ('redis', 'ocredis'):
+        assert report[client_name]['operations'] > 0
+        assert report[client_name]['errors'] == 0
+    assert set(report['latency_ms']) == {'redispy.Redis.get', 'redispy.Redis.set', 'redispy.Pipeline.execute'}
+    get_latency = report['latency_ms']['redispy.Redis.get']
+    assert 1 <= get_latency['p50'] <= get_latency['p99'] <= get_latency['p999']
+    assert 0 <= report['instrumentation_cpu_share'] < 1
@@ -0,0 +1,120 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+from redis.exceptions import LockNotOwnedError
+
+import ocredis
+from tests.fakes import FakeServer, RespServer, fake_connection_pool
+
+
+def view_data_map(view_manager, name):
+    return view_manager.get_view(name).tag_value_aggregation_data_map
+
+
+def total(distribution):
+    return distribution.mean_data * distribution.count_data
+
+
+def test_lock_contention_and_hold_time(fresh_stats):
+    ocredis.register_views()
+    server = FakeServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    holder = client.lock('orders:42', timeout=30)
+    waiter = client.lock('orders:42', sleep=0.01, blocking_timeout=0.05)
+    assert isinstance(holder, ocredis.OcLock)
+
+    assert holder.acquire()
+    assert not waiter.acquire()
+    assert not waiter.acquire(blocking=False)
+    assert holder.extend(10)
+    holder.release()
+    assert waiter.acquire(blocking=False)
+    del server.data[b'orders:42']
+    with pytest.raises(LockNotOwnedError):
+        waiter.release()
+
+    acquisitions = view_data_map(fresh_stats, 'redispy/lock_acquisitions')
+    assert acquisitions[('orders', 'OK')].count_data == 2
+    assert acquisitions[('orders', 'FAILED')].count_data == 2
+    attempts = view_data_map(fresh_stats, 'redispy/lock_acquire_attempts')[('orders',)]
+    assert attempts.count_data == 4
+    assert total(attempts) >= 1 + 3 + 1 + 1
+    hold_time = view_data_map(fresh_stats, 'redispy/lock_hold_time')
+    assert hold_time[('orders', 'OK')].count_data == 1
+    assert hold_time[('orders', 'ERROR')].count_data == 1
+
+    latency = view_data_map(fresh_stats, 'redispy/lock_latency')
+    assert latency[('orders', 'redispy.Lock.release', 'OK')].count_data == 1
+    assert latency[('orders', 'redispy.Lock.release', 'ERROR')].count_data == 1
+    assert latency[('orders', 'redispy.Lock.extend', 'OK')].count_data == 1
+
+
+def test_lock_backoff_makes_fewer_attempts(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.lock('poll:1').acquire()
+    client.lock('backoff:1').acquire()
+
+    for name, wakeup in (('poll:1', 'poll'), ('backoff:1', 'backoff')):
+        assert not client.lock(name, sleep=0.005, blocking_timeout=0.2, wakeup=wakeup, max_sleep=0.1).acquire()
+
+    attempts = view_data_map(fresh_stats, 'redispy/lock_acquire_attempts')
+    assert total(attempts[('backoff',)]) < total(attempts[('poll',)])
+
+    with pytest.raises(ValueError):
+        client.lock('x', wakeup='spin')
+
+
+def test_lock_prefixes_are_bounded(fresh_stats, monkeypatch):
+    monkeypatch.setattr(ocredis.lock, 'MAX_PREFIXES', 2)
+    monkeypatch.setattr(ocredis.lock, '_prefixes', set())
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    for name in ('orders:1', 'users:1', 'carts:1', 'orders:2', 'session-1f3a'):
+        lock = client.lock(name)
+        assert lock.acquire()
+        lock.release()
+
+    acquisitions = view_data_map(fresh_stats, 'redispy/lock_acquisitions')
+    assert {tags: data.count_data for tags, data in acquisitions.items()} == {
+        ('orders', 'OK'): 2,
+        ('users', 'OK'): 1,
+        ('_other', 'OK'): 2,
+    }
+
+
+def test_lock_pubsub_wakeup(fresh_stats):
+    ocredis.register_views()
+    with RespServer() as server:
+        client = ocredis.OcRedis(host='127.0.0.1', port=server.port)
+        holder = client.lock('jobs:1', wakeup='pubsub', thread_local=False)
+        assert holder.acquire()
+        # Without the release published, the waiter would retry after 5s.
+        waiter = client.lock('jobs:1', wakeup='pubsub', max_sleep=5, blocking_timeout=10)
+        releaser = threading.Timer(0.2, holder.release)
+        releaser.start()
+        start = time.monotonic()
+        assert waiter.acquire()
+        assert time.monotonic() - start < 2
+        releaser.join()
+        waiter.release()
+
+    attempts = view_data_map(fresh_stats, 'redispy/lock_acquire_attempts')[('jobs',)]
+    assert attempts.count_data == 2
+    # The waiter tries once, again once subscribed, and once more on release.
+    assert total(attempts) == 1 + 3
@@ -0,0 +1,363 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import random
+import threading
+
+import pytest
+
+from opencensus.stats import stats
+from opencensus.stats.measure_to_view_map import MeasureToViewMap
+
+import ocredis
+from ocredis import observability
+from tests.fakes import fake_connection_pool
+
+
+def test_calls_are_invoked_directly_when_nothing_is_listening(fresh_stats):
+    # The overhead of this fast path is measured by tests/benchmark.py.
+    assert not observability._is_recording()
+    assert observability._active_tracer() is None
+    assert observability.trace_and_record_stats_with_key_and_value(
+            'redispy.Redis.get', lambda key: key, 'foo', None, 'foo') == 'foo'
+    assert observability._recording_slot.get() is None
+
+
+def test_samples_of_a_call_are_exported_once(fresh_stats):
+    ocredis.register_views()
+    exports = []
+
+    class CountingExporter(object):
+        def export(self, view_datas):
+            exports.append(view_datas)
+
+    fresh_stats.register_exporter(CountingExporter())
+
+    def get(key):
+        observability._record_measurement(observability.m_request_bytes, 20, 'redispy.Redis.get', None, None)
+        observability._record_measurement(observability.m_response_bytes, 9, 'redispy.Redis.get', None, None)
+        assert exports == []
+        return b'bar'
+
+    assert observability.trace_and_record_stats_with_key_and_value('redispy.Redis.get', get, 'foo', None, 'foo') \
+            == b'bar'
+    assert len(exports) == 1
+    names = [view_data.view.name for view_data in exports[0]]
+    assert 'redispy/latency' in names and 'redispy/request_bytes' in names
+    assert len(names) == len(set(names))
+    request_bytes = fresh_stats.get_view('redispy/request_bytes').tag_value_aggregation_data_map
+    assert [(data.count_data, data.mean_data) for data in request_bytes.values()] == [(1, 20)]
+
+
+def test_records_with_precomputed_tags(fresh_stats):
+    ocredis.register_views()
+
+    for i in range(3):
+        observability.trace_and_record_stats_with_key_and_value(
+                'redispy.Redis.get', lambda key: None, 'foo', None, 'foo')
+
+    with pytest.raises(ValueError):
+        def fails(key):
+            raise ValueError('bad key')
+        observability.trace_and_record_stats_with_key_and_value(
+                'redispy.Redis.get', fails, 'foo', None, 'foo')
+
+    calls_view_data = fresh_stats.get_view('redispy/calls')
+    counts = dict((tag_values, data.count_data)
+            for tag_values, data in calls_view_data.tag_value_aggregation_data_map.items())
+    assert counts == {
+        ('redispy.Redis.get', None, 'OK'): 3,
+        ('redispy.Redis.get', 'other', 'ERROR'): 1,
+    }
+
+    key_lengths_view_data = fresh_stats.get_view('redispy/key_lengths')
+    key_lengths = key_lengths_view_data.tag_value_aggregation_data_map[('redispy.Redis.get', None, 'OK')]
+    assert key_lengths.count_data == 3
+    assert key_lengths.mean_data == 3
+
+
+def snapshot_view_data(view_manager, view_name):
+    view_data = view_manager.get_view(view_name)
+    snapshot = {}
+    for tag_values, data in view_data.tag_value_aggregation_data_map.items():
+        if hasattr(data, 'counts_per_bucket'):
+            snapshot[tag_values] = (data.count_data, list(data.counts_per_bucket), round(data.mean_data, 6),
+                    round(data.sum_of_sqd_deviations, 6))
+        else:
+            snapshot[tag_values] = data.count_data
+    return snapshot
+
+
+def record_fixed_calls():
+    keys = ['a', 'bb', 'cccccccccccc', 'd' * 120]
+    for i in range(40):
+        key = keys[i % len(keys)]
+        observability._record_call('redispy.Redis.set', 'OK', None, float(i % 7), key, 'v' * i)
+    observability._record_call('redispy.Redis.set', 'ERROR', 'boom', 3.0, 'a', None)
+    command_stack = [(('SET', 'k', 'v' * 10), {}), (('GET', 'k'), {}), (('GET', 'kk'), {})]
+    observability._record_pipeline('redispy.Pipeline.execute', 'OK', None, 2.0, command_stack,
+            [True, b'v' * 10, None], None)
+
+
+def test_aggregation_matches_direct_recording(fresh_stats, monkeypatch):
+    ocredis.register_views()
+    record_fixed_calls()
+    direct = dict((name, snapshot_view_data(fresh_stats, name))
+            for name in ('redispy/calls', 'redispy/latency', 'redispy/key_lengths', 'redispy/value_lengths'))
+
+    monkeypatch.setattr(stats.stats.view_manager, '_measure_view_map', MeasureToViewMap())
+    ocredis.register_views()
+    ocredis.enable_aggregation(flush_interval=None, flush_threshold=1 << 20)
+    try:
+        threads = [threading.Thread(target=record_fixed_calls) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Nothing is merged into the views until a flush.
+        assert snapshot_view_data(fresh_stats, 'redispy/calls') == {}
+        ocredis.flush_aggregation()
+    finally:
+        ocredis.disable_aggregation()
+
+    for name, expected in direct.items():
+        aggregated = snapshot_view_data(fresh_stats, name)
+        assert set(aggregated) == set(expected)
+        for tag_values, expected_data in expected.items():
+            if isinstance(expected_data, int):
+                assert aggregated[tag_values] == 4 * expected_data
+            else:
+                count, counts_per_bucket, mean, sum_of_sqd_deviations = aggregated[tag_values]
+                assert count == 4 * expected_data[0]
+                assert counts_per_bucket == [4 * c for c in expected_data[1]]
+                assert mean == pytest.approx(expected_data[2])
+                assert sum_of_sqd_deviations == pytest.approx(4 * expected_data[3])
+
+
+def test_aggregation_flushes_at_threshold(fresh_stats):
+    ocredis.register_views()
+    ocredis.enable_aggregation(flush_interval=None, flush_threshold=10)
+    try:
+        for i in range(25):
+            observability._record_call('redispy.Redis.get', 'OK', None, 1.0, 'foo', None)
+        assert snapshot_view_data(fresh_stats, 'redispy/calls') == {('redispy.Redis.get', None, 'OK'): 20}
+    finally:
+        ocredis.disable_aggregation()
+    assert snapshot_view_data(fresh_stats, 'redispy/calls') == {('redispy.Redis.get', None, 'OK'): 25}
+
+
+def test_summarize_lengths():
+    summarize = observability.summarize_lengths
+    assert summarize(None) == (0, 0, 0, {})
+    assert summarize('foo') == (1, 3, 3, {3: 1})
+    assert summarize(u'hé') == (1, 3, 3, {3: 1})
+    assert summarize(b'\x00\x01') == (1, 2, 2, {2: 1})
+    assert summarize(memoryview(b'abcd').cast('H')) == (1, 4, 4, {4: 1})
+    assert summarize(12345) == (1, 5, 5, {5: 1})
+    assert summarize(1.5) == (1, 3, 3, {3: 1})
+    assert summarize(['a', ('bb', ['ccc'])]) == (3, 6, 3, {1: 1, 2: 1, 3: 1})
+    assert summarize({'key': 'value'}) == (2, 8, 5, {3: 1, 5: 1})
+    assert summarize(['a', 'b', 'cc']) == (3, 4, 2, {1: 2, 2: 1})
+
+
+def test_summarize_lengths_is_bounded():
+    summary = observability.summarize_lengths(['abc'] * 100000, max_items=10)
+    assert summary == (10, 30, 3, {3: 10})
+
+    deep = 'x'
+    for i in range(10):
+        deep = [deep]
+    assert observability.summarize_lengths(deep, max_depth=4) == (0, 0, 0, {})
+    assert observability.summarize_lengths(deep, max_depth=10) == (1, 1, 1, {1: 1})
+
+
+def test_summarize_lengths_does_not_consume_iterators():
+    members = (member for member in ['a', 'b', 'c'])
+    assert observability.summarize_lengths(members) == (0, 0, 0, {})
+    assert list(members) == ['a', 'b', 'c']
+
+
+def test_summaries_are_recorded_as_weighted_samples(fresh_stats):
+    ocredis.register_views()
+    observability._record_call('redispy.Redis.sadd', 'OK', None, 1.0, 'set', ['a', 'bb', 'cccccc'])
+
+    value_lengths = fresh_stats.get_view('redispy/value_lengths').tag_value_aggregation_data_map
+    data = value_lengths[('redispy.Redis.sadd', None, 'OK')]
+    assert data.count_data == 3
+    assert data.sum == pytest.approx(9)
+
+
+def bucket_counts(data, *lengths):
+    counts = [0] * len(data.counts_per_bucket)
+    for length in lengths:
+        counts[bisect.bisect_right(data.bounds, length)] += 1
+    return counts
+
+
+def test_mixed_lengths_are_bucketed_apart(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.mset({'a': 'x', 'bb': 'y' * 6000})
+    pipe = client.pipeline(transaction=False)
+    pipe.set('a', 'x').set('bb', 'y' * 6000)
+    pipe.execute()
+
+    value_lengths = fresh_stats.get_view('redispy/value_lengths').tag_value_aggregation_data_map
+    for method_name in ('redispy.Redis.mset', 'redispy.Pipeline.set'):
+        data = value_lengths[(method_name, None, 'OK')]
+        assert list(data.counts_per_bucket) == bucket_counts(data, 1, 6000)
+        assert data.mean_data == pytest.approx(3000.5)
+        assert data.sum_of_sqd_deviations == pytest.approx(2 * 2999.5 ** 2)
+
+    key_lengths = fresh_stats.get_view('redispy/key_lengths').tag_value_aggregation_data_map
+    data = key_lengths[('redispy.Redis.mset', None, 'OK')]
+    assert list(data.counts_per_bucket) == bucket_counts(data, 1, 2)
+
+
+def test_mixed_lengths_are_bucketed_apart_when_aggregated(fresh_stats):
+    ocredis.register_views()
+    ocredis.enable_aggregation(flush_interval=None)
+    try:
+        observability._record_call('redispy.Redis.mset', 'OK', None, 1.0, None, ['x', 'y' * 6000])
+    finally:
+        ocredis.disable_aggregation()
+
+    value_lengths = fresh_stats.get_view('redispy/value_lengths').tag_value_aggregation_data_map
+    data = value_lengths[('redispy.Redis.mset', None, 'OK')]
+    assert list(data.counts_per_bucket) == bucket_counts(data, 1, 6000)
+
+
+@pytest.fixture
+def size_sampling():
+    yield ocredis.set_size_sampling
+    ocredis.set_size_sampling()
+
+
+def test_size_sampling_keeps_calls_exact_and_weights_sizes(fresh_stats, size_sampling):
+    ocredis.register_views()
+    random.seed(4)
+    size_sampling(rate=0.25, method_rates={'redispy.Redis.mset': 0.0})
+
+    for i in range(4000):
+        observability._record_call('redispy.Redis.set', 'OK', None, 1.0, 'key', 'value')
+        observability._record_call('redispy.Redis.mset', 'OK', None, 1.0, {'key': 'value'}, None)
+
+    calls = fresh_stats.get_view('redispy/calls').tag_value_aggregation_data_map
+    assert calls[('redispy.Redis.set', None, 'OK')].count_data == 4000
+    assert calls[('redispy.Redis.mset', None, 'OK')].count_data == 4000
+
+    key_lengths = fresh_stats.get_view('redispy/key_lengths').tag_value_aggregation_data_map
+    assert ('redispy.Redis.mset', None, 'OK') not in key_lengths
+    set_key_lengths = key_lengths[('redispy.Redis.set', None, 'OK')]
+    assert set_key_lengths.count_data == pytest.approx(4000, rel=0.1)
+    assert set_key_lengths.count_data % 4 == 0
+    assert set_key_lengths.mean_data == pytest.approx(3)
+
+
+def test_size_sampling_per_second_budget(fresh_stats, size_sampling, monkeypatch):
+    ocredis.register_views()
+    clock = [0.0]
+    monkeypatch.setattr(observability, '_now', lambda: clock[0])
+    random.seed(4)
+    size_sampling(per_second=100)
+
+    for second in range(3):
+        for i in range(1000):
+            clock[0] = second + i / 1000.0
+            observability._record_call('redispy.Redis.get', 'OK', None, 1.0, 'key', None)
+
+    key_lengths = fresh_stats.get_view('redispy/key_lengths').tag_value_aggregation_data_map
+    data = key_lengths[('redispy.Redis.get', None, 'OK')]
+    # The first second is measured in full, the next two at about 100 calls each of weight 10.
+    assert data.count_data == pytest.approx(3000, rel=0.15)
+    assert data.mean_data == pytest.approx(3)
+
+
+def test_size_sampling_rejects_invalid_rates(size_sampling):
+    with pytest.raises(ValueError):
+        size_sampling(rate=1.5)
+    with pytest.raises(ValueError):
+        size_sampling(method_rates={'redispy.Redis.get': -1})
+
+
+@pytest.fixture
+def cardinality_limit():
+    yield ocredis.set_cardinality_limit
+    ocredis.set_cardinality_limit()
+
+
+def test_cardinality_limit_overflows_into_other(fresh_stats, cardinality_limit):
+    ocredis.register_views()
+    cardinality_limit(max_series=3, per_view={'redispy/latency': 1})
+
+    for i in range(10):
+        observability._record_call('redispy.Redis.get%d' % i, 'OK', None, 1.0, 'key', None)
+
+    calls = fresh_stats.get_view('redispy/calls').tag_value_aggregation_data_map
+    assert len(calls) == 4
+    assert calls[('_other', '_other', '_other')].count_data == 7
+    latency = fresh_stats.get_view('redispy/latency').tag_value_aggregation_data_map
+    assert sorted(latency) == [('_other', '_other', '_other'), ('redispy.Redis.get0', None, 'OK')]
+
+    with pytest.raises(ValueError):
+        cardinality_limit(max_series=0)
+
+
+def test_cardinality_limit_bounds_tag_values_cache(fresh_stats, cardinality_limit, monkeypatch):
+    ocredis.register_views()
+    monkeypatch.setattr(observability, '_tag_values_cache', {})
+    cardinality_limit(per_view={'redispy/script_latency': 5})
+
+    for i in range(1000):
+        observability._record_measurement(observability.m_script_latency_ms, 1.0, None, 'OK', None,
+                ((observability.key_script, 'script:%d' % i),))
+
+    latency = fresh_stats.get_view('redispy/script_latency').tag_value_aggregation_data_map
+    assert len(latency) == 6
+    assert len(observability._tag_values_cache) == 5
+
+
+def test_size_views_without_status(fresh_stats):
+    ocredis.register_views(size_views_by_status=False)
+    observability._record_call('redispy.Redis.get', 'OK', None, 1.0, 'key', None)
+    observability._record_call('redispy.Redis.get', 'ERROR', 'timeout', 1.0, 'key', None)
+
+    key_lengths = fresh_stats.get_view('redispy/key_lengths').tag_value_aggregation_data_map
+    assert dict((tag_values, data.count_data) for tag_values, data in key_lengths.items()) == {
+            ('redispy.Redis.get',): 2}
+    calls = fresh_stats.get_view('redispy/calls').tag_value_aggregation_data_map
+    assert len(calls) == 2
+
+
+def test_exponential_buckets():
+    assert observability.exponential_buckets(1, 2, 3) == [1, 2, 4, 8]
+    assert observability.exponential_buckets(0.01, 2, 2, sub_buckets=4) == [
+            0.01, 0.0125, 0.015, 0.0175, 0.02, 0.025, 0.03, 0.035, 0.04]
+    with pytest.raises(ValueError):
+        observability.exponential_buckets(0, 2, 3)
+
+
+def test_latency_buckets_resolve_sub_millisecond_calls(fresh_stats):
+    ocredis.register_views()
+    for latency_ms in (0.08, 0.1, 0.4):
+        observability._record_call('redispy.Redis.get', 'OK', None, latency_ms, 'key', None)
+    data = fresh_stats.get_view('redispy/latency').tag_value_aggregation_data_map[('redispy.Redis.get', None, 'OK')]
+    assert sum(1 for count in data.counts_per_bucket if count) == 3
+
+
+def test_latency_buckets_are_configurable(fresh_stats):
+    ocredis.register_views(latency_buckets=[1, 10, 100])
+    assert fresh_stats.get_view('redispy/latency').view.new_aggregation_data().bounds == [1, 10, 100]
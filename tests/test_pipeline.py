@@ -0,0 +1,85 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import redis
+
+import ocredis
+from tests.fakes import fake_connection_pool
+
+
+def calls_by_tags(view_manager):
+    view_data = view_manager.get_view('redispy/calls')
+    return dict((tag_values, data.count_data)
+            for tag_values, data in view_data.tag_value_aggregation_data_map.items())
+
+
+@pytest.mark.parametrize('transaction', [True, False])
+def test_execute_records_one_span_and_bulk_stats(span_retainer, fresh_stats, transaction):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+
+    pipe = client.pipeline(transaction=transaction, shard_hint='shard')
+    assert isinstance(pipe, ocredis.OcPipeline)
+    assert pipe.transaction == transaction
+    assert pipe.shard_hint == 'shard'
+
+    pipe.set('foo', 'bar').set('baz', 'quux').get('foo').incr('foo')
+    with pytest.raises(redis.ResponseError):
+        pipe.execute()
+
+    spans = span_retainer.spans()
+    assert [span.name for span in spans] == ['redispy.Pipeline.execute']
+    attributes = spans[0].attributes
+    assert attributes['redispy.pipeline.batch_size'] == 4
+    assert attributes['redispy.pipeline.request_bytes'] == 3 + 3 + 3 + 4 + 3 + 3
+    assert 'redispy.pipeline.response_bytes' not in attributes
+    assert attributes['redispy.pipeline.latency_ms'] >= 0
+
+    calls = calls_by_tags(fresh_stats)
+    error = 'response'
+    assert calls == {
+        ('redispy.Pipeline.execute', error, 'ERROR'): 1,
+        ('redispy.Pipeline.set', error, 'ERROR'): 2,
+        ('redispy.Pipeline.get', error, 'ERROR'): 1,
+        ('redispy.Pipeline.incrby', error, 'ERROR'): 1,
+    }
+
+    latency_view_data = fresh_stats.get_view('redispy/latency')
+    assert list(latency_view_data.tag_value_aggregation_data_map) == [('redispy.Pipeline.execute', error, 'ERROR')]
+
+
+def test_execute_records_per_command_status(span_retainer, fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+
+    pipe = client.pipeline(transaction=False)
+    pipe.set('foo', 'bar').incr('foo').get('foo')
+    results = pipe.execute(raise_on_error=False)
+    assert results[0] is True
+    assert isinstance(results[1], redis.ResponseError)
+    assert results[2] == b'bar'
+
+    assert span_retainer.spans()[0].attributes['redispy.pipeline.response_bytes'] == 1 + 3
+
+    calls = calls_by_tags(fresh_stats)
+    assert calls == {
+        ('redispy.Pipeline.execute', None, 'OK'): 1,
+        ('redispy.Pipeline.set', None, 'OK'): 1,
+        ('redispy.Pipeline.incrby', 'response', 'ERROR'): 1,
+        ('redispy.Pipeline.get', None, 'OK'): 1,
+    }
+
+    value_lengths = fresh_stats.get_view('redispy/value_lengths').tag_value_aggregation_data_map
+    assert value_lengths[('redispy.Pipeline.set', None, 'OK')].count_data == 1
@@ -0,0 +1,166 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+import redis
+from opencensus.trace import execution_context
+
+import ocredis
+from ocredis import OcBlockingConnectionPool, OcConnectionPool
+from tests.fakes import FakeConnection, FakeServer, fake_connection_pool
+
+
+class SlowConnection(FakeConnection):
+    """
+    SlowConnection takes 20ms to connect, once.
+    """
+
+    def connect(self):
+        if getattr(self, 'connected', False):
+            return
+        time.sleep(0.02)
+        self.connected = True
+
+
+def view_data_map(view_manager, view_name):
+    return view_manager.get_view(view_name).tag_value_aggregation_data_map
+
+
+def test_ocredis_uses_an_instrumented_pool_by_default():
+    assert type(ocredis.OcRedis().connection_pool) is OcConnectionPool
+    assert type(ocredis.OcRedis.from_url('redis://localhost:6379/1').connection_pool) is OcConnectionPool
+
+    pool = redis.ConnectionPool()
+    assert ocredis.OcRedis(connection_pool=pool).connection_pool is pool
+
+    client = ocredis.OcRedis(host='example.com', port=6380, max_connections=5)
+    assert client.connection_pool.connection_kwargs['host'] == 'example.com'
+    assert client.connection_pool.connection_kwargs['port'] == 6380
+    assert client.connection_pool.max_connections == 5
+
+
+def test_checkout_is_a_child_span_of_the_command(span_retainer, fresh_stats):
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(pool_class=OcConnectionPool))
+    client.set('foo', 'bar')
+
+    spans = dict((span.name, span) for span in span_retainer.spans())
+    assert set(spans) == {'redispy.Redis.set', 'redispy.ConnectionPool.get_connection'}
+    checkout = spans['redispy.ConnectionPool.get_connection']
+    assert checkout.parent_span_id == spans['redispy.Redis.set'].span_id
+    assert checkout.attributes['redispy.pool.created'] is True
+
+
+def test_checkouts_of_a_scan_iteration_are_child_spans_of_its_span(span_retainer, fresh_stats):
+    server = FakeServer()
+    for i in range(25):
+        server.data[b'key:%03d' % i] = b'v'
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server, pool_class=OcConnectionPool))
+    tracer = execution_context.get_opencensus_tracer()
+
+    with tracer.span(name='outer'):
+        assert len(list(client.scan_iter(count=10))) == 25
+
+    spans = span_retainer.spans()
+    scan = next(span for span in spans if span.name == 'redispy.Redis.scan_iter')
+    checkouts = [span for span in spans if span.name == 'redispy.ConnectionPool.get_connection']
+    assert len(checkouts) == 3
+    for span in checkouts:
+        assert span.parent_span_id == scan.span_id
+
+
+def test_pools_must_count_their_connections():
+    class UncountedPool(ocredis.pool._InstrumentedPool, redis.ConnectionPool):
+        pass
+
+    with pytest.raises(TypeError):
+        UncountedPool()
+
+
+def test_connection_creation_is_recorded_apart_from_checkout(fresh_stats):
+    ocredis.register_views()
+    pool = OcConnectionPool(connection_class=SlowConnection, server=FakeServer())
+    pool.counts_interval = 0
+    client = ocredis.OcRedis(connection_pool=pool)
+    for i in range(3):
+        client.get('foo')
+
+    creation = view_data_map(fresh_stats, 'redispy/pool_connection_creation_latency')[()]
+    assert creation.count_data == 1
+    assert creation.mean_data >= 20
+    checkout = view_data_map(fresh_stats, 'redispy/pool_checkout_latency')[('OK',)]
+    assert checkout.count_data == 3
+    assert checkout.mean_data < 20
+
+    assert view_data_map(fresh_stats, 'redispy/pool_connections_in_use')[()].value == 0
+    assert view_data_map(fresh_stats, 'redispy/pool_connections_idle')[()].value == 1
+
+
+def test_connection_counts_are_sampled(fresh_stats):
+    ocredis.register_views()
+    pool = fake_connection_pool(pool_class=OcConnectionPool)
+    client = ocredis.OcRedis(connection_pool=pool)
+    # Recorded as the connection is created, but not as it is released.
+    for i in range(10):
+        client.get('foo')
+    assert view_data_map(fresh_stats, 'redispy/pool_connections_in_use')[()].value == 1
+    assert view_data_map(fresh_stats, 'redispy/pool_connections_idle')[()].value == 0
+
+    # Recorded again once counts_interval has passed.
+    connection = pool.get_connection('GET')
+    pool._counts_recorded_at -= pool.counts_interval
+    pool.release(connection)
+    assert view_data_map(fresh_stats, 'redispy/pool_connections_in_use')[()].value == 0
+    assert view_data_map(fresh_stats, 'redispy/pool_connections_idle')[()].value == 1
+
+
+def test_blocking_pool_checkout_wait(fresh_stats):
+    ocredis.register_views()
+    pool = fake_connection_pool(pool_class=OcBlockingConnectionPool, max_connections=1, timeout=5)
+    client = ocredis.OcRedis(connection_pool=pool)
+
+    connection = pool.get_connection('GET')
+    assert view_data_map(fresh_stats, 'redispy/pool_connections_in_use')[()].value == 1
+    releaser = threading.Timer(0.05, pool.release, [connection])
+    releaser.start()
+    assert client.get('foo') is None
+    releaser.join()
+
+    checkout = view_data_map(fresh_stats, 'redispy/pool_checkout_latency')[('OK',)]
+    assert checkout.count_data == 2
+    assert checkout.sum >= 40
+
+
+def test_blocking_pool_checkout_timeout(fresh_stats):
+    ocredis.register_views()
+    pool = fake_connection_pool(pool_class=OcBlockingConnectionPool, max_connections=1, timeout=0.01)
+    pool.get_connection('GET')
+
+    with pytest.raises(redis.ConnectionError):
+        ocredis.OcRedis(connection_pool=pool).get('foo')
+    assert view_data_map(fresh_stats, 'redispy/pool_checkout_latency')[('ERROR',)].count_data == 1
+
+
+def test_disconnects(fresh_stats):
+    ocredis.register_views()
+    pool = fake_connection_pool(pool_class=OcConnectionPool)
+    connections = [pool.get_connection('GET') for i in range(3)]
+    pool.release(connections[0])
+    pool.disconnect(inuse_connections=False)
+    pool.disconnect()
+
+    disconnects = view_data_map(fresh_stats, 'redispy/pool_disconnects')
+    assert dict((tag_values, data.sum_data) for tag_values, data in disconnects.items()) == {('pool',): 4}
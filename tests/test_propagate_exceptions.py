@@ -67,14 +67,19 @@ def test_ensure_exceptions_are_raised_yet_reported():
         client.get('newer')
 
     spans = span_retainer.spans()
-    assert len(spans) == 1
+    assert len(spans) == 2
 
-    span0 = spans[0]
+    span0 = spans[1]
     assert span0.name == 'redispy.Redis.get'
 
     # Ensure that the span for .get is the root span.
     assert span0.parent_span_id == None
 
+    # The connection failed while being checked out of the pool, within .get
+    assert spans[0].name == 'redispy.ConnectionPool.get_connection'
+    assert spans[0].parent_span_id == span0.span_id
+    assert spans[0].status.code == 2
+
     # Now check that the top most span has a Status
     root_span_status = span0.status
     assert root_span_status.code == 2 # Unknown as per https://opencensus.io/tracing/span/status/#status-code-mapping
@@ -115,7 +120,7 @@ def test_ensure_exceptions_are_raised_yet_reported():
     assert len(sorted_calls_tag_values) >= 1
     assert sorted_calls_tag_values[0] == (
                 'redispy.Redis.get',
-                'Error 8 connecting to localhost:262144. nodename nor servname provided, or not known.',
+                'connection',
                 'ERROR',
             )
     
@@ -0,0 +1,147 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import time
+
+import pytest
+
+import ocredis
+from ocredis.pubsub import OTHER_CHANNELS, OcPubSub, _unread_bytes
+from tests.fakes import fake_connection_pool
+
+
+def view_data_map(view_manager, view_name):
+    return view_manager.get_view(view_name).tag_value_aggregation_data_map
+
+
+def drain(pubsub):
+    messages = []
+    while True:
+        message = pubsub.get_message()
+        if message is None:
+            return messages
+        if message['type'] in ('message', 'pmessage'):
+            messages.append(message)
+
+
+def test_messages_and_bytes_per_channel(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    pubsub = client.pubsub(max_channel_tags=2)
+    assert isinstance(pubsub, OcPubSub)
+    pubsub.subscribe('a', 'b', 'c')
+    pubsub.psubscribe('news.*')
+
+    client.publish('a', 'hello')
+    client.publish('a', 'hi')
+    client.publish('b', 'x' * 100)
+    client.publish('c', 'abc')
+    client.publish('news.sports', 'goal')
+    assert len(drain(pubsub)) == 5
+
+    messages = view_data_map(fresh_stats, 'redispy/pubsub_messages')
+    counts = dict((tag_values, data.count_data) for tag_values, data in messages.items())
+    assert counts == {('a',): 2, ('b',): 1, (OTHER_CHANNELS,): 2}
+    total_bytes = dict((tag_values, data.sum_data) for tag_values, data
+            in view_data_map(fresh_stats, 'redispy/pubsub_bytes').items())
+    assert total_bytes == {('a',): 7, ('b',): 100, (OTHER_CHANNELS,): 7}
+
+    receive = view_data_map(fresh_stats, 'redispy/pubsub_receive_latency')
+    assert receive[('redispy.PubSub.get_message',)].count_data >= 5
+
+
+def test_messages_are_tagged_by_pattern(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    pubsub = client.pubsub()
+    pubsub.psubscribe('news.*')
+    for channel in ('news.sports', 'news.weather', 'news.politics'):
+        client.publish(channel, 'story')
+    assert [message['channel'] for message in drain(pubsub)] == [b'news.sports', b'news.weather', b'news.politics']
+
+    messages = view_data_map(fresh_stats, 'redispy/pubsub_messages')
+    assert dict((tag_values, data.count_data) for tag_values, data in messages.items()) == {('news.*',): 3}
+
+
+def test_handler_latency_in_run_in_thread(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    pubsub = client.pubsub()
+    handled = []
+
+    def handler(message):
+        time.sleep(0.01)
+        handled.append(message['data'])
+        if message['data'] == b'bad':
+            raise ValueError('bad message')
+
+    def exception_handler(e, pubsub, thread):
+        pass
+
+    pubsub.subscribe(jobs=handler)
+    thread = pubsub.run_in_thread(sleep_time=0.001, exception_handler=exception_handler)
+    try:
+        for data in ('one', 'two', 'bad'):
+            client.publish('jobs', data)
+        deadline = time.time() + 10
+        while len(handled) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        thread.stop()
+        thread.join(timeout=10)
+
+    assert handled == [b'one', b'two', b'bad']
+    handler_latency = view_data_map(fresh_stats, 'redispy/pubsub_handler_latency')
+    assert handler_latency[('jobs', 'OK')].count_data == 2
+    assert handler_latency[('jobs', 'OK')].mean_data >= 10
+    assert handler_latency[('jobs', 'ERROR')].count_data == 1
+
+    # Handlers run within get_message but aren't counted as receiving time.
+    receive = view_data_map(fresh_stats, 'redispy/pubsub_receive_latency')[('redispy.PubSub.get_message',)]
+    assert receive.count_data > 0
+    assert receive.mean_data < 10
+
+
+def test_listen(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe('a')
+    client.publish('a', 'hello')
+    pubsub.unsubscribe('a')
+
+    assert [message['data'] for message in pubsub.listen()] == [b'hello']
+    receive = view_data_map(fresh_stats, 'redispy/pubsub_receive_latency')
+    assert receive[('redispy.PubSub.listen',)].count_data == 3
+    assert view_data_map(fresh_stats, 'redispy/pubsub_backlog')[()].count_data == 3
+
+
+def test_unread_bytes():
+    class Connection(object):
+        pass
+
+    reader, writer = socket.socketpair()
+    try:
+        connection = Connection()
+        connection._sock = reader
+        assert _unread_bytes(connection) == 0
+        writer.sendall(b'x' * 1000)
+        time.sleep(0.05)
+        if _unread_bytes(connection) == 0:
+            pytest.skip('FIONREAD is not supported on this platform')
+        assert _unread_bytes(connection) == 1000
+    finally:
+        reader.close()
+        writer.close()
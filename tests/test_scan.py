@@ -0,0 +1,130 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from opencensus.trace import execution_context
+
+import ocredis
+from ocredis.scan import _AdaptiveCount
+from tests.fakes import FakeServer, fake_connection_pool
+
+
+def client_with_keys(n):
+    server = FakeServer()
+    for i in range(n):
+        server.data[('key:%03d' % i).encode('ascii')] = b'v'
+    return ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+
+
+def view_data_map(view_manager, view_name):
+    return view_manager.get_view(view_name).tag_value_aggregation_data_map
+
+
+def test_scan_iter_is_one_span_with_an_event_per_page(span_retainer, fresh_stats):
+    ocredis.register_views()
+    client = client_with_keys(25)
+
+    keys = list(client.scan_iter(count=10))
+    assert keys == [('key:%03d' % i).encode('ascii') for i in range(25)]
+
+    spans = span_retainer.spans()
+    assert [span.name for span in spans] == ['redispy.Redis.scan_iter']
+    span = spans[0]
+    assert [annotation.attributes.attributes['elements'] for annotation in span.annotations] == [10, 10, 5]
+    assert span.attributes['redispy.scan.pages'] == 3
+    assert span.attributes['redispy.scan.elements'] == 25
+    assert span.attributes['redispy.scan.complete'] is True
+
+    tags = ('redispy.Redis.scan_iter', None, 'OK')
+    assert view_data_map(fresh_stats, 'redispy/scan_pages')[tags].sum == 3
+    page_elements = view_data_map(fresh_stats, 'redispy/scan_page_elements')[tags]
+    assert page_elements.count_data == 3
+    assert page_elements.sum == 25
+    assert view_data_map(fresh_stats, 'redispy/scan_latency')[tags].count_data == 1
+    # The commands fetching each page are recorded as usual.
+    assert view_data_map(fresh_stats, 'redispy/calls')[('redispy.Redis.scan', None, 'OK')].count_data == 3
+
+
+def test_scan_span_is_not_the_current_span(span_retainer, fresh_stats):
+    client = client_with_keys(20)
+    tracer = execution_context.get_opencensus_tracer()
+
+    with tracer.span(name='outer'):
+        for key in client.scan_iter(count=10):
+            client.get(key)
+
+    spans = dict((span.name, span) for span in span_retainer.spans())
+    gets = [span for span in span_retainer.spans() if span.name == 'redispy.Redis.get']
+    assert len(gets) == 20
+    for span in gets:
+        assert span.parent_span_id == spans['outer'].span_id
+    assert spans['redispy.Redis.scan_iter'].parent_span_id == spans['outer'].span_id
+
+
+def test_abandoned_scan_iter_is_recorded_as_incomplete(span_retainer, fresh_stats):
+    ocredis.register_views()
+    client = client_with_keys(25)
+
+    keys = client.scan_iter(count=10)
+    next(keys)
+    keys.close()
+
+    span = span_retainer.spans()[0]
+    assert span.attributes['redispy.scan.pages'] == 1
+    assert span.attributes['redispy.scan.complete'] is False
+    assert view_data_map(fresh_stats, 'redispy/scan_pages')[('redispy.Redis.scan_iter', None, 'OK')].sum == 1
+
+
+def test_hscan_sscan_and_zscan_iter(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.hset('h', mapping=dict(('f%02d' % i, i) for i in range(15)))
+    client.sadd('s', *['m%02d' % i for i in range(15)])
+    client.zadd('z', dict(('m%02d' % i, i) for i in range(15)))
+
+    assert dict(client.hscan_iter('h', count=4)) == dict((('f%02d' % i).encode('ascii'), str(i).encode('ascii'))
+            for i in range(15))
+    assert sorted(client.sscan_iter('s', count=4)) == [('m%02d' % i).encode('ascii') for i in range(15)]
+    assert list(client.zscan_iter('z', count=4)) == [(('m%02d' % i).encode('ascii'), float(i)) for i in range(15)]
+
+    pages = view_data_map(fresh_stats, 'redispy/scan_pages')
+    for method in ('redispy.Redis.hscan_iter', 'redispy.Redis.sscan_iter', 'redispy.Redis.zscan_iter'):
+        assert pages[(method, None, 'OK')].sum == 4
+
+
+def test_adaptive_count():
+    adaptive = _AdaptiveCount(target_page_ms=10, count=100, max_count=1000)
+    adaptive.update(1)
+    assert adaptive.count == 200
+    adaptive.update(8)
+    assert adaptive.count == 250
+    adaptive.update(50)
+    assert adaptive.count == 125
+    for i in range(10):
+        adaptive.update(0)
+    assert adaptive.count == 1000
+
+    with pytest.raises(ValueError):
+        _AdaptiveCount(target_page_ms=0)
+
+
+def test_scan_iter_with_target_page_latency(span_retainer, fresh_stats):
+    client = client_with_keys(500)
+
+    assert len(list(client.scan_iter(target_page_ms=1e3))) == 500
+
+    counts = [annotation.attributes.attributes['count'] for annotation in span_retainer.spans()[0].annotations]
+    # Pages are much faster than the target, so the COUNT doubles on each page.
+    assert counts == [10, 20, 40, 80, 160, 320]
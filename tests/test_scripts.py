@@ -0,0 +1,142 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from redis.exceptions import ResponseError
+
+import ocredis
+from tests.fakes import CountingServer, fake_connection_pool
+
+RATE_LIMIT = '''
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return current
+'''
+
+
+def view_data_map(view_manager, name):
+    return view_manager.get_view(name).tag_value_aggregation_data_map
+
+
+def test_scripts_are_sent_as_evalsha_and_reloaded(fresh_stats):
+    ocredis.register_views()
+    server = CountingServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    rate_limit = client.register_script(RATE_LIMIT, name='rate_limit')
+    assert isinstance(rate_limit, ocredis.OcScript)
+
+    assert rate_limit(keys=['user:1'], args=[1000]) == [b'user:1', b'1000']
+    assert client.eval(RATE_LIMIT, 1, 'user:2', 1000) == [b'user:2', b'1000']
+    server.scripts.clear()
+    assert rate_limit(keys=['user:3'], args=[1000]) == [b'user:3', b'1000']
+    assert [command[0] for command in server.commands] == [
+            'EVALSHA', 'SCRIPT', 'EVALSHA', 'EVALSHA', 'EVALSHA', 'SCRIPT', 'EVALSHA']
+
+    latency = view_data_map(fresh_stats, 'redispy/script_latency')
+    assert latency[('rate_limit', 'OK')].count_data == 3
+    assert view_data_map(fresh_stats, 'redispy/script_reloads')[('rate_limit',)].count_data == 2
+    saved = view_data_map(fresh_stats, 'redispy/script_bytes_saved')[('rate_limit',)]
+    assert saved.sum_data == len(RATE_LIMIT) - 40
+
+    one_off = client.eval('return 1', 0)
+    assert one_off == []
+    client.eval('return 1', 0)
+    assert len(client.scripts) == 2
+    # Sources shorter than their digest save nothing.
+    sha = client.register_script('return 1').sha
+    assert view_data_map(fresh_stats, 'redispy/script_bytes_saved')[(sha[:12],)].sum_data == 0
+
+
+def test_registered_scripts_are_looked_up_by_source(fresh_stats, monkeypatch):
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.eval(RATE_LIMIT, 1, 'user:1', 1000)
+    script = client.scripts.get(client.register_script(RATE_LIMIT).sha)
+
+    created = []
+    init = ocredis.OcScript.__init__
+
+    def counting_init(self, *args):
+        created.append(args)
+        init(self, *args)
+
+    monkeypatch.setattr(ocredis.OcScript, '__init__', counting_init)
+    for i in range(3):
+        assert client.eval(RATE_LIMIT, 1, 'user:1', 1000)
+        assert client.register_script(RATE_LIMIT) is script
+    assert created == []
+
+    client.scripts.discard(script.sha)
+    client.register_script(RATE_LIMIT)
+    assert len(created) == 1
+
+
+def test_pipelines_queue_evalsha(fresh_stats):
+    server = CountingServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server))
+    pipe = client.pipeline(transaction=False)
+    pipe.eval(RATE_LIMIT, 1, 'user:1', 1000)
+    assert pipe.execute() == [[b'user:1', b'1000']]
+    sha = client.register_script(RATE_LIMIT).sha
+    assert [command[:2] for command in server.commands] == [['SCRIPT', 'EXISTS'], ['SCRIPT', 'LOAD'], ['EVALSHA', sha]]
+
+
+def test_scripts_are_preloaded_into_connections(fresh_stats):
+    server = CountingServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server, pool_class=ocredis.OcConnectionPool))
+    client.enable_script_preload()
+    rate_limit = client.register_script(RATE_LIMIT)
+    # Scripts are only preloaded once they ran.
+    assert len(client.scripts) == 0
+    rate_limit(keys=['user:1'], args=[1000])
+    assert len(client.scripts) == 1
+
+    # A second connection has the script loaded once.
+    pool = client.connection_pool
+    held = pool.get_connection('_')
+    del server.commands[:]
+    client.ping()
+    client.ping()
+    assert [command[:2] for command in server.commands] == [['SCRIPT', 'LOAD'], ['PING'], ['PING']]
+
+    # Only the scripts added since are loaded into connections that have some.
+    client.eval('return 2', 0)
+    pool.release(held)
+    del server.commands[:]
+    pool.get_connection('_')
+    assert [command[:3] for command in server.commands] == [['SCRIPT', 'LOAD', 'return 2']]
+
+    client.disable_script_preload()
+    with pytest.raises(ValueError):
+        ocredis.OcRedis(connection_pool=fake_connection_pool()).enable_script_preload()
+
+
+def test_scripts_that_fail_to_load_are_dropped(fresh_stats, caplog):
+    server = CountingServer()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(server, pool_class=ocredis.OcConnectionPool))
+    client.enable_script_preload()
+    with pytest.raises(ResponseError):
+        client.eval('!syntax error', 0)
+    assert len(client.scripts) == 0
+    client.set('a', '1')
+    assert client.get('a') == b'1'
+
+    # Say a script was added that the server can't load, e.g. another one.
+    client.eval(RATE_LIMIT, 1, 'user:1', 1000)
+    client.scripts.add(client.register_script('!syntax error'))
+    server.scripts.clear()
+    assert client.get('a') == b'1'
+    assert len(client.scripts) == 1
+    assert 'failed to load' in caplog.text
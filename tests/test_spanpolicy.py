@@ -0,0 +1,93 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+from opencensus.trace import span as trace_span
+
+import ocredis
+from ocredis import observability
+from ocredis.commands import command_info
+from ocredis.spanpolicy import PIPELINE, SpanPolicy
+from tests.fakes import fake_connection_pool
+
+
+def calls_by_method(view_manager):
+    view_data = view_manager.get_view('redispy/calls')
+    calls = {}
+    for tag_values, data in view_data.tag_value_aggregation_data_map.items():
+        calls[tag_values[0]] = calls.get(tag_values[0], 0) + data.count_data
+    return calls
+
+
+def test_decisions_from_most_to_least_specific():
+    policy = SpanPolicy({'redispy.Redis.hget': 'always', 'get': 'never', 'read': 0.5, 'pipeline': 'never',
+            '*': 'always'}, default='never')
+    rates = dict((name, policy._rate_for(command_info(name))) for name in ('hget', 'get', 'hgetall', 'set'))
+    assert rates == {'hget': 1.0, 'get': 0.0, 'hgetall': 0.5, 'set': 1.0}
+    assert policy._rate_for(PIPELINE) == 0.0
+    assert SpanPolicy({}, default='never')._rate_for(command_info('set')) == 0.0
+
+    callable_policy = SpanPolicy(lambda info: 'never' if 'r' in info.flags else None)
+    assert not callable_policy.should_trace(command_info('get'))
+    assert callable_policy.should_trace(command_info('set'))
+
+    with pytest.raises(ValueError):
+        SpanPolicy({'get': 2})
+
+
+def test_callable_policies_decide_on_every_command():
+    decisions = ['always', 'never']
+    policy = SpanPolicy(lambda info: decisions[-1])
+    assert not policy.should_trace(command_info('get'))
+    decisions.pop()
+    assert policy.should_trace(command_info('get'))
+
+
+def test_skipped_spans_still_record_stats(span_retainer, fresh_stats, monkeypatch):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool(pool_class=ocredis.OcConnectionPool),
+            span_policy={'get': 'never', 'hget': 0.25, 'pipeline': 'never'})
+    created = []
+    original_init = trace_span.Span.__init__
+
+    def counting_init(self, name, *args, **kwargs):
+        created.append(name)
+        original_init(self, name, *args, **kwargs)
+    monkeypatch.setattr(trace_span.Span, '__init__', counting_init)
+
+    client.get('foo')
+    client.pipeline().set('foo', 'bar').execute()
+    assert created == []
+
+    client.set('foo', 'bar')
+    assert created == ['redispy.Redis.set', 'redispy.ConnectionPool.get_connection']
+
+    random.seed(1)
+    for i in range(400):
+        client.hget('hash', 'field')
+    assert created.count('redispy.Redis.hget') == pytest.approx(100, abs=30)
+
+    assert calls_by_method(fresh_stats) == {'redispy.Redis.get': 1, 'redispy.Redis.set': 1,
+            'redispy.Redis.hget': 400, 'redispy.Pipeline.execute': 1, 'redispy.Pipeline.set': 1}
+
+
+def test_nested_skips_keep_skipping_spans(span_retainer):
+    def outer():
+        observability._without_spans(observability._active_tracer)
+        return observability._active_tracer()
+
+    assert observability._without_spans(outer) is None
+    assert observability._active_tracer() is not None
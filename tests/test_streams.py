@@ -0,0 +1,72 @@
+# Copyright 2019, OpenCensus Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import ocredis
+from ocredis.streams import StreamTracker, entry_timestamp_ms
+from tests.fakes import fake_connection_pool
+
+
+def view_data_map(view_manager, name):
+    return view_manager.get_view(name).tag_value_aggregation_data_map
+
+
+def test_entry_timestamp_ms():
+    assert entry_timestamp_ms(b'1526985054069-0') == 1526985054069
+    assert entry_timestamp_ms('1526985054079-3') == 1526985054079
+    assert entry_timestamp_ms(b'>') is None
+
+
+def test_consumer_group_lag_and_ack_latency(fresh_stats):
+    ocredis.register_views()
+    client = ocredis.OcRedis(connection_pool=fake_connection_pool())
+    client.xgroup_create('orders', 'billing', id='0')
+    added_ms = int(time.time() * 1e3) - 5000
+    for i in range(3):
+        client.xadd('orders', {'n': i}, id='%d-%d' % (added_ms, i))
+
+    reply = client.xreadgroup('billing', 'worker-1', {'orders': '>'}, count=2)
+    assert [entry_id for entry_id, _ in reply[0][1]] == [b'%d-0' % added_ms, b'%d-1' % added_ms]
+    assert client.xreadgroup('billing', 'worker-1', {'orders': '0'}) == reply
+    assert client.xpending('orders', 'billing')['pending'] == 2
+    assert client.xack('orders', 'billing', reply[0][1][0][0]) == 1
+    assert client.xclaim('orders', 'billing', 'worker-2', 0, [reply[0][1][1][0]], justid=True)
+    assert client.xack('orders', 'billing', reply[0][1][1][0], b'0-1') == 1
+    assert client.xreadgroup('billing', 'worker-1', {'orders': '>'}, count=2)
+    assert client.xreadgroup('billing', 'worker-1', {'orders': '>'}) == []
+    assert len(client.streams) == 1
+
+    tags = ('orders', 'billing')
+    # The last read returned no entries, which isn't a batch.
+    batch_sizes = view_data_map(fresh_stats, 'redispy/stream_batch_size')[tags]
+    assert batch_sizes.count_data == 3
+    assert view_data_map(fresh_stats, 'redispy/stream_entries')[tags].sum_data == 2 + 2 + 1
+
+    # Only the entries read from '>' tell how far behind the group is.
+    end_to_end = view_data_map(fresh_stats, 'redispy/stream_end_to_end_latency')[tags]
+    assert end_to_end.count_data == 3
+    assert end_to_end.mean_data >= 5000
+
+    assert view_data_map(fresh_stats, 'redispy/stream_ack_latency')[tags].count_data == 2
+    assert view_data_map(fresh_stats, 'redispy/stream_pending')[tags].value == 2
+
+
+def test_stream_tracker_bounds_deliveries(fresh_stats):
+    tracker = StreamTracker(max_deliveries=2)
+    reply = [[b'orders', [(b'1-0', {}), (b'2-0', {}), (b'3-0', {})]]]
+    tracker.read('billing', {'orders': '>'}, reply)
+    assert len(tracker) == 2
+    tracker.acked('orders', 'billing', ['2-0', '3-0'])
+    assert len(tracker) == 0